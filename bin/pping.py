@@ -27,6 +27,7 @@ import sys
 import signal
 import argparse
 import logging
+import time
 
 import nav.daemon
 from nav import buildconf
@@ -36,7 +37,7 @@ from nav.statemon import statistics
 from nav.statemon import megaping
 from nav.statemon import db
 from nav.statemon import config
-from nav.statemon import circbuf
+from nav.statemon.pingstate import ReplyMatrix
 from nav.statemon.event import Event
 from nav.statemon.netbox import Netbox
 
@@ -81,43 +82,102 @@ class Pinger(object):
         self._nrping = int(self.config.get("nrping", 3))
         # To keep status...
         self.netboxmap = {}  # hash netboxid -> netbox
-        self.down = []       # list of netboxids down
-        self.replies = {}    # hash netboxid -> circbuf
+        self.replies = ReplyMatrix(self._nrping)
+        self.metric_paths = {}  # hash netboxid -> metric paths
         self.ip_to_netboxid = {}
+        self.changes = db.ChangeListener(
+            [db.NETBOX_CHANNEL], 'pping',
+            int(self.config.get("resyncinterval",
+                                db.DEFAULT_RESYNC_INTERVAL)))
 
     def update_host_list(self):
+        """
+        Updates internal data structures with the netboxes that have changed
+        in the NAVdb since the last update, or with all netboxes if changes
+        may have been missed.
+        """
+        changes = self.changes.get_changes()
+        if changes is None:
+            self.reload_all_hosts()
+        elif changes[db.NETBOX_CHANNEL]:
+            self.reload_hosts(changes[db.NETBOX_CHANNEL])
+
+    def reload_all_hosts(self):
         """
         Fetches all netboxes from the NAVdb, and updates
         internal data structures.
         """
         LOGGER.debug("Getting hosts from database...")
         hosts = self.db.hosts_to_ping()
-        netboxmap = {}
-        self.ip_to_netboxid = {}
+        gone = set(self.netboxmap) - set(host[0] for host in hosts)
+        self._update_hosts(hosts, gone)
+        LOGGER.debug("We now got %i hosts in our list to ping",
+                     len(self.netboxmap))
+        # then update our pinger object
+        self.pinger.set_hosts(self.ip_to_netboxid.keys())
+
+    def reload_hosts(self, netboxids):
+        """
+        Fetches a set of changed netboxes from the NAVdb, and updates
+        internal data structures.
+        """
+        LOGGER.debug("Getting %i changed hosts from database...",
+                     len(netboxids))
+        try:
+            hosts = self.db.hosts_to_ping(netboxids)
+        except db.DbError:
+            self.changes.request_resync()
+            return
+        gone = set(netboxids) - set(host[0] for host in hosts)
+        removed_ips, added_ips = self._update_hosts(hosts, gone)
+        self.pinger.remove_hosts(removed_ips)
+        self.pinger.add_hosts(added_ips)
+
+    def _update_hosts(self, hosts, gone):
+        """
+        Updates internal data structures with a list of netbox rows, and
+        removes the netboxes whose ids are in gone.
+
+        :returns: A tuple of the sets of IP addresses that are no longer
+                  pinged, and that should now be pinged.
+
+        """
+        removed_ips = set()
+        added_ips = set()
+        for netboxid in gone:
+            netbox = self.netboxmap.pop(netboxid, None)
+            if netbox is None:
+                continue
+            LOGGER.info("Netbox %s is no longer with us...", netboxid)
+            self.replies.remove(netboxid)
+            del self.metric_paths[netboxid]
+            if self.ip_to_netboxid.get(netbox.ip) == netboxid:
+                del self.ip_to_netboxid[netbox.ip]
+                removed_ips.add(netbox.ip)
+
         for host in hosts:
             netboxid, sysname, ip, up = host
             netbox = Netbox(netboxid, sysname, ip, up)
-            if netbox.netboxid not in self.netboxmap:
+            if netbox.netboxid not in self.replies:
                 # new netbox. Be sure to get it's state
                 if netbox.up != 'y':
                     LOGGER.debug(
                         "Got new netbox, %s, currently "
                         "marked down in navDB", netbox.ip)
-                    self.down.append(netbox.netboxid)
-            if netbox.netboxid not in self.replies:
-                self.replies[netbox.netboxid] = circbuf.CircBuf(self._nrping)
-                if netbox.up != 'y':
-                    buf = self.replies[netbox.netboxid]
-                    # This genious line marks all-down for the whole buf
-                    map(buf.push, [-1]*len(buf))
-            netboxmap[netbox.netboxid] = netbox
+                self.replies.add(netbox.netboxid, up=netbox.up == 'y')
+            old = self.netboxmap.get(netbox.netboxid)
+            if old is None or old.sysname != netbox.sysname:
+                self.metric_paths[netbox.netboxid] = (
+                    statistics.get_ping_metric_paths(netbox.sysname))
+            if (old is not None and old.ip != netbox.ip and
+                    self.ip_to_netboxid.get(old.ip) == netbox.netboxid):
+                del self.ip_to_netboxid[old.ip]
+                removed_ips.add(old.ip)
+            self.netboxmap[netbox.netboxid] = netbox
             self.ip_to_netboxid[netbox.ip] = netbox.netboxid
-        # Update netboxmap
-        self.netboxmap = netboxmap
-        LOGGER.debug("We now got %i hosts in our list to ping",
-                     len(self.netboxmap))
-        # then update our pinger object
-        self.pinger.set_hosts(self.ip_to_netboxid.keys())
+            added_ips.add(netbox.ip)
+
+        return removed_ips - added_ips, added_ips
 
     def generate_events(self):
         """
@@ -125,30 +185,18 @@ class Pinger(object):
         """
         LOGGER.debug("Checks which hosts didn't answer")
         answers = self.pinger.results()
+        samples = []
+        metrics = []
         for ip, rtt in answers:
             # rtt = round trip time (-1 => host didn't reply)
             netboxid = self.ip_to_netboxid.get(ip)
-            self.replies[netboxid].push(rtt)
-            netbox = self.netboxmap[netboxid]
-            if rtt != -1:
-                statistics.update(netbox.netboxid, netbox.sysname, 'N', 'UP',
-                                  rtt)
-            else:
-                # ugly...
-                statistics.update(netbox.netboxid, netbox.sysname, 'N', 'DOWN',
-                                  5)
-
-        down_now = []
-        # Find out which netboxes to consider down
-        for (netboxid, replies) in self.replies.items():
-            if replies[:self._nrping] == [-1]*self._nrping:
-                down_now.append(netboxid)
+            samples.append((netboxid, rtt))
+            metrics.append((self.metric_paths[netboxid], rtt))
+        statistics.send_ping_metrics(metrics, time.time())
 
-        LOGGER.debug("No answer from %i hosts", len(down_now))
         # Detect state changes since last run
-        report_down = set(down_now) - set(self.down)
-        report_up = set(self.down) - set(down_now)
-        self.down = down_now
+        report_down, report_up = self.replies.update(samples)
+        LOGGER.debug("No answer from %i hosts", self.replies.count_down())
 
         # Reporting netboxes as down
         LOGGER.debug("Starts reporting %i hosts as down", len(report_down))
@@ -166,11 +214,7 @@ class Pinger(object):
         # Reporting netboxes as up
         LOGGER.debug("Starts reporting %i hosts as up", len(report_up))
         for netboxid in report_up:
-            try:
-                netbox = self.netboxmap[netboxid]
-            except:
-                LOGGER.info("Netbox %s is no longer with us...", netboxid)
-                continue
+            netbox = self.netboxmap[netboxid]
             new_event = Event(None,
                               netbox.netboxid,
                               None,  # deviceid
@@ -193,7 +237,8 @@ class Pinger(object):
             self.generate_events()
             LOGGER.info("%i hosts checked in %03.3f secs. %i hosts "
                         "currently marked as down.",
-                        len(self.netboxmap), elapsedtime, len(self.down))
+                        len(self.netboxmap), elapsedtime,
+                        self.replies.count_down())
             wait = self._looptime-elapsedtime
             if wait > 0:
                 LOGGER.debug("Sleeping %03.3f secs", wait)
@@ -47,7 +47,7 @@ class Controller:
         init_generic_logging(stderr=True, read_config=True)
         self._deamon = kwargs.get("fork", 1)
         self._isrunning = 1
-        self._checkers = []
+        self._checkers = {}
         self._looptime = int(self.conf.get("checkinterval", 60))
         LOGGER.debug("Setting checkinterval=%i", self._looptime)
         self.db = db.db()
@@ -55,33 +55,83 @@ class Controller:
         LOGGER.debug("Setting up runqueue")
         self._runqueue = RunQueue.RunQueue(controller=self)
         self.dirty = 1
+        self.changes = db.ChangeListener(
+            [db.NETBOX_CHANNEL, db.SERVICE_CHANNEL], 'servicemon',
+            int(self.conf.get("resyncinterval", db.DEFAULT_RESYNC_INTERVAL)))
 
     def get_checkers(self):
         """
-        Fetches new checkers from the NAV database and appends them to
-        the runqueue.
+        Updates the checkers of the services that have changed in the NAV
+        database since the last update, or all checkers if changes may have
+        been missed.
         """
-        newcheckers = self.db.get_checkers(self.dirty)
+        changes = self.changes.get_changes()
+        if changes is None:
+            self.reload_all_checkers()
+        elif changes[db.SERVICE_CHANNEL] or changes[db.NETBOX_CHANNEL]:
+            self.reload_checkers(changes[db.SERVICE_CHANNEL],
+                                 changes[db.NETBOX_CHANNEL])
+
+    def reload_all_checkers(self):
+        """
+        Fetches all checkers from the NAV database.
+        """
+        try:
+            newcheckers = self.db.load_checkers(self.dirty)
+        except db.DbError:
+            # make sure we don't delete all checkers if we have lost
+            # connection to the db
+            self.changes.request_resync()
+            return
         self.dirty = 0
-        # make sure we don't delete all checkers if we get an empty
-        # list from the database (maybe we have lost connection to
-        # the db)
-        if newcheckers:
-            s = []
-            for i in newcheckers:
-                if i in self._checkers:
-                    oldchecker = self._checkers[self._checkers.index(i)]
-                    s.append(oldchecker)
-                else:
-                    s.append(i)
-
-            self._checkers = s
-        elif self.db.status and self._checkers:
+        if not newcheckers and self._checkers:
             LOGGER.info("No checkers left in database, flushing list.")
-            self._checkers = []
 
-        # Randomize order of checker plugins
-        random.shuffle(self._checkers)
+        oldcheckers = self._checkers
+        self._checkers = {}
+        for checker in newcheckers:
+            self._checkers[checker.serviceid] = self._keep_state(
+                oldcheckers.get(checker.serviceid), checker)
+        LOGGER.info("Loaded %s checkers", len(self._checkers))
+
+    def reload_checkers(self, serviceids, netboxids):
+        """
+        Fetches the checkers of a set of changed services, and of the
+        services of a set of changed netboxes, from the NAV database.
+        """
+        LOGGER.debug("Reloading checkers for %i services and %i netboxes",
+                     len(serviceids), len(netboxids))
+        try:
+            newcheckers = self.db.load_checkers(
+                self.dirty, serviceids=serviceids, netboxids=netboxids)
+        except db.DbError:
+            self.changes.request_resync()
+            return
+
+        oldcheckers = dict((serviceid, self._checkers.pop(serviceid))
+                           for serviceid in serviceids
+                           if serviceid in self._checkers)
+        for checker in newcheckers:
+            serviceid = checker.serviceid
+            oldchecker = oldcheckers.get(serviceid,
+                                         self._checkers.get(serviceid))
+            self._checkers[serviceid] = self._keep_state(oldchecker, checker)
+
+    @staticmethod
+    def _keep_state(oldchecker, newchecker):
+        """
+        Returns the old instance of a reloaded checker if nothing has
+        changed, so its state is kept. Otherwise, the new instance is
+        returned, with the status of the old one.
+        """
+        if oldchecker is None:
+            return newchecker
+        if (oldchecker == newchecker and
+                oldchecker.get_address() == newchecker.get_address() and
+                oldchecker.sysname == newchecker.sysname):
+            return oldchecker
+        newchecker.status = oldchecker.status
+        return newchecker
 
     def main(self):
         """
@@ -98,11 +148,14 @@ class Controller:
                 LOGGER.warning("System clock has drifted backwards, "
                                "resetting loop delay")
                 wait = self._looptime
-            if self._checkers:
-                pause = wait/(len(self._checkers)*2)
+            # Randomize order of checker plugins
+            checkers = list(self._checkers.values())
+            random.shuffle(checkers)
+            if checkers:
+                pause = wait/(len(checkers)*2)
             else:
                 pause = 0
-            for checker in self._checkers:
+            for checker in checkers:
                 self._runqueue.enq(checker)
                 sleep(pause)
 
@@ -29,6 +29,7 @@ from nav.models.profiles import (Account, AccountAlertQueue, AlertSubscription,
                                  AlertAddress, FilterGroup, AlertPreference,
                                  TimePeriod)
 from nav.models.event import AlertQueue
+from nav.alertengine.filters import FilterMatcher
 
 
 def check_alerts(debug=False):
@@ -51,7 +52,10 @@ def check_alerts(debug=False):
     now = datetime.now()
 
     # Get all alerts that aren't in alert queue due to subscription
-    new_alerts = AlertQueue.objects.filter(accountalertqueue__isnull=True)
+    new_alerts = AlertQueue.objects.filter(
+        accountalertqueue__isnull=True).select_related(
+            'netbox__room', 'netbox__type', 'netbox__category',
+            'netbox__organization', 'event_type', 'alert_type')
     num_new_alerts = len(new_alerts)
 
     initial_alerts = AlertQueue.objects.values_list('id', flat=True)
@@ -122,8 +126,14 @@ def check_alerts(debug=False):
 @transaction.atomic()
 def handle_new_alerts(new_alerts):
     """Handles new alerts on the queue"""
-    memoized_check_alert = lru_cache()(check_alert_against_filtergroupcontents)
     logger = logging.getLogger('nav.alertengine.handle_new_alerts')
+    matcher = FilterMatcher(new_alerts)
+
+    def check_alert(alert, filtergroupcontents, atype):
+        """Checks alert using the filters compiled for this run"""
+        return check_alert_against_filtergroupcontents(
+            alert, filtergroupcontents, atype, matcher)
+    memoized_check_alert = lru_cache()(check_alert)
     accounts = []
 
     def subscription_sort_key(subscription):
@@ -157,13 +167,15 @@ def handle_new_alerts(new_alerts):
         for alertsubscription in current_alertsubscriptions:
             tmp.append(
                 (alertsubscription,
-                 alertsubscription.filter_group.filtergroupcontent_set.all()))
+                 alertsubscription.filter_group.filtergroupcontent_set.
+                 select_related('filter')))
 
         if tmp:
             permissions = []
             for filtergroup in FilterGroup.objects.filter(
                     group_permissions__accounts__in=[account]):
-                permissions.append(filtergroup.filtergroupcontent_set.all())
+                permissions.append(
+                    filtergroup.filtergroupcontent_set.select_related('filter'))
 
             accounts.append((account, tmp, permissions))
             del permissions
@@ -187,6 +199,9 @@ def handle_new_alerts(new_alerts):
         del account
         del permissions
 
+    logger.debug('Verified filters: %d compiled, %d queried in SQL',
+                 matcher.compiled_count, matcher.fallback_count)
+
     del memoized_check_alert
     del new_alerts
     gc.collect()
@@ -428,8 +443,13 @@ def alert_should_be_ignored(queued_alert, subscription, now):
             subscription.type != AlertSubscription.NOW)
 
 
-def check_alert_against_filtergroupcontents(alert, filtergroupcontents, atype):
-    """Checks a given alert against an array of filtergroupcontents"""
+def check_alert_against_filtergroupcontents(alert, filtergroupcontents, atype,
+                                            matcher=None):
+    """Checks a given alert against an array of filtergroupcontents
+
+    :param matcher: A FilterMatcher to verify filters with. If omitted, each
+                    filter is verified using its own database query.
+    """
 
     logger = logging.getLogger(
         'nav.alertengine.check_alert_against_filtergroupcontents')
@@ -438,6 +458,11 @@ def check_alert_against_filtergroupcontents(alert, filtergroupcontents, atype):
         logger.debug("Emtpy filtergroup")
         return False
 
+    if matcher:
+        verify = matcher.verify
+    else:
+        verify = lambda filtr, alert: filtr.verify(alert)
+
     # Allways assume that the match will fail
     matches = False
 
@@ -446,7 +471,7 @@ def check_alert_against_filtergroupcontents(alert, filtergroupcontents, atype):
 
         # If we have not matched the message see if we can match it
         if not matches and content.include:
-            matches = content.filter.verify(alert) == content.positive
+            matches = verify(content.filter, alert) == content.positive
 
             if matches:
                 logger.debug('alert %d: got included by filter %d in %s',
@@ -454,7 +479,7 @@ def check_alert_against_filtergroupcontents(alert, filtergroupcontents, atype):
 
         # If the alert has been matched try excluding it
         elif matches and not content.include:
-            matches = content.filter.verify(alert) != content.positive
+            matches = verify(content.filter, alert) != content.positive
 
             # Log that we excluded the alert
             if not matches:
@@ -0,0 +1,302 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.  You should have received a copy of the GNU General Public
+# License along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""Compiled alert profile filters.
+
+Verifying an alert against a Filter using Filter.verify() costs one database
+query per alert/filter combination. During a single alertengine run, the
+FilterMatcher in this module instead compiles each Filter's expressions once
+into Python predicates, which are evaluated against the attributes of the
+already loaded alerts.
+
+Expressions that cannot be faithfully evaluated in Python (IP address
+matching, wildcards, text ordering and anything that traverses multi-valued
+relations, like a netbox' modules or ARP entries) cause the whole filter to
+fall back to a single set-based query covering all the alerts of the run.
+
+"""
+import itertools
+import logging
+import re
+
+from django.core.exceptions import ValidationError, FieldDoesNotExist
+from django.db import models
+from django.utils import six
+
+from nav.models.event import AlertQueue
+from nav.models.manage import Location
+from nav.models.profiles import Operator, MatchField
+
+_logger = logging.getLogger(__name__)
+
+# Operators that compare the text representation of values
+TEXT_OPERATORS = (Operator.STARTSWITH, Operator.ENDSWITH, Operator.CONTAINS,
+                  Operator.REGEXP)
+# Operators whose outcome depend on the database collation for text values
+ORDERING_OPERATORS = (Operator.GREATER, Operator.GREATER_EQ, Operator.LESS,
+                      Operator.LESS_EQ)
+
+
+# Regular expressions that mean the same thing to Python's re module as to
+# PostgreSQL's case insensitive ~* operator: Literal text, anchors, wildcards,
+# quantifiers, alternation and groups. Escapes, bracket expressions, bounds
+# and (?...) extensions differ between the two, and are left to PostgreSQL.
+_PORTABLE_REGEXP = re.compile(r'^(?:[\w\s.*+?|()^$,:;=@/#%&\'"<>!~-])*$',
+                              re.UNICODE)
+
+
+class UncompilableExpression(Exception):
+    """Raised when an expression cannot be compiled into a Python predicate"""
+
+
+class FilterMatcher(object):
+    """Verifies a set of alerts against alert profile filters.
+
+    Each filter is compiled at most once, and filters that must be verified
+    in SQL are queried at most once for all the alerts given to the matcher.
+
+    """
+    def __init__(self, alerts):
+        """
+        :param alerts: The list of AlertQueue objects that will be verified by
+                       this matcher.
+        """
+        self.alert_ids = set(alert.id for alert in alerts)
+        self._predicates = {}
+        self._sql_matches = {}
+        self.compiled_count = 0
+        self.fallback_count = 0
+
+    def verify(self, filtr, alert):
+        """Returns True if alert matches filtr.
+
+        :type filtr: nav.models.profiles.Filter
+        :type alert: nav.models.event.AlertQueue
+        """
+        predicate = self._get_predicate(filtr)
+        if predicate is not None:
+            matches = predicate(alert)
+        elif alert.id in self._sql_matches[filtr.id]:
+            matches = True
+        elif alert.id not in self.alert_ids:
+            matches = filtr.verify(alert)
+        else:
+            matches = False
+
+        _logger.debug('alert %d: %s filter %d', alert.id,
+                      'matches' if matches else 'did not match', filtr.id)
+        return matches
+
+    def _get_predicate(self, filtr):
+        if filtr.id in self._predicates:
+            return self._predicates[filtr.id]
+
+        expressions = list(filtr.expression_set.select_related('match_field'))
+        try:
+            predicate = compile_filter(expressions)
+        except UncompilableExpression as error:
+            _logger.debug("filter %d will be verified in SQL: %s",
+                          filtr.id, error)
+            predicate = None
+            self._sql_matches[filtr.id] = (
+                filtr.get_matching_alert_ids(list(self.alert_ids), expressions)
+                if self.alert_ids else set())
+            self.fallback_count += 1
+        else:
+            self.compiled_count += 1
+
+        self._predicates[filtr.id] = predicate
+        return predicate
+
+
+def compile_filter(expressions):
+    """Compiles a list of filter Expressions into a single predicate function.
+
+    :returns: A function that takes an AlertQueue object as its argument and
+              returns True if the alert matches all the expressions.
+    :raises UncompilableExpression: if any expression cannot be compiled.
+
+    """
+    predicates = [compile_expression(expr) for expr in expressions]
+
+    def _filter_predicate(alert):
+        return all(predicate(alert) for predicate in predicates)
+    return _filter_predicate
+
+
+def compile_expression(expression):
+    """Compiles a single filter Expression into a predicate function.
+
+    :raises UncompilableExpression: if the expression cannot be compiled.
+
+    """
+    match_field = expression.match_field
+    operator = expression.operator
+    if match_field.data_type == MatchField.IP:
+        raise UncompilableExpression("IP matching of %s" % match_field)
+    if operator == Operator.WILDCARD:
+        raise UncompilableExpression("wildcard matching of %s" % match_field)
+
+    if match_field.name == 'Location':
+        return _compile_location_expression(expression)
+
+    lookup = match_field.get_lookup_mapping()
+    if not lookup:
+        raise UncompilableExpression("unknown match field %s" % match_field)
+    path, field = _resolve_lookup(lookup)
+    getter = _make_getter(path, field.attname)
+
+    if operator == Operator.IN:
+        values = set(_to_python(field, value)
+                     for value in expression.value.split('|'))
+        return lambda alert: getter(alert) in values
+    elif operator in TEXT_OPERATORS:
+        return _compile_text_expression(getter, field, operator,
+                                        expression.value)
+
+    value = _to_python(field, expression.value)
+    if operator == Operator.EQUALS:
+        return lambda alert: getter(alert) == value
+    elif operator == Operator.NOT_EQUAL:
+        return lambda alert: getter(alert) != value
+    elif operator in ORDERING_OPERATORS:
+        if _is_text_field(field):
+            raise UncompilableExpression("text ordering of %s" % match_field)
+        return _compile_ordering_expression(getter, operator, value)
+
+    raise UncompilableExpression("unknown operator %r" % operator)
+
+
+def _compile_location_expression(expression):
+    """Location expressions match any sublocation of the given locations"""
+    locations = Location.objects.filter(pk__in=expression.value.split('|'))
+    location_ids = set(
+        loc.pk for loc in itertools.chain(
+            *[l.get_descendants(include_self=True) for l in locations]))
+    path, field = _resolve_lookup(MatchField.FOREIGN_MAP[MatchField.LOCATION])
+    getter = _make_getter(path, field.attname)
+    return lambda alert: getter(alert) in location_ids
+
+
+def _compile_text_expression(getter, field, operator, value):
+    if not (_is_text_field(field) or isinstance(field, models.IntegerField)):
+        raise UncompilableExpression("text matching of %s" % field.name)
+
+    if operator == Operator.REGEXP:
+        match = _compile_regexp(value)
+    else:
+        value = value.upper()
+        if operator == Operator.STARTSWITH:
+            match = lambda text: text.upper().startswith(value)
+        elif operator == Operator.ENDSWITH:
+            match = lambda text: text.upper().endswith(value)
+        else:
+            match = lambda text: value in text.upper()
+
+    def _text_predicate(alert):
+        attr = getter(alert)
+        return attr is not None and bool(match(six.text_type(attr)))
+    return _text_predicate
+
+
+def _compile_regexp(value):
+    """Compiles a regular expression to match like PostgreSQL's ~* would.
+
+    :raises UncompilableExpression: unless the expression only uses syntax
+                                    that is known to mean the same thing in
+                                    Python and PostgreSQL.
+
+    """
+    if not _PORTABLE_REGEXP.match(value) or '(?' in value:
+        raise UncompilableExpression("non-portable regexp %r" % value)
+    # In PostgreSQL, . matches newlines, and $ only matches at the very end
+    pattern = value.replace('$', r'\Z')
+    try:
+        regexp = re.compile(pattern, re.IGNORECASE | re.UNICODE | re.DOTALL)
+    except re.error as error:
+        raise UncompilableExpression("regexp %r: %s" % (value, error))
+    return regexp.search
+
+
+def _compile_ordering_expression(getter, operator, value):
+    compare = {
+        Operator.GREATER: lambda attr: attr > value,
+        Operator.GREATER_EQ: lambda attr: attr >= value,
+        Operator.LESS: lambda attr: attr < value,
+        Operator.LESS_EQ: lambda attr: attr <= value,
+    }[operator]
+
+    def _ordering_predicate(alert):
+        attr = getter(alert)
+        return attr is not None and compare(attr)
+    return _ordering_predicate
+
+
+def _resolve_lookup(lookup):
+    """Resolves a Django lookup string relative to AlertQueue.
+
+    :returns: A tuple of (path, field), where path is the list of foreign key
+              attributes to follow from an alert, and field is the model
+              field at the end of the lookup.
+    :raises UncompilableExpression: if the lookup traverses anything but
+                                    single-valued forward relations.
+
+    """
+    names = lookup.split('__')
+    model = AlertQueue
+    for name in names[:-1]:
+        field = _get_field(model, name)
+        if not (field.is_relation and field.concrete and
+                (field.many_to_one or field.one_to_one)):
+            raise UncompilableExpression(
+                "%s traverses a multi-valued relation" % lookup)
+        model = field.related_model
+    return names[:-1], _get_field(model, names[-1])
+
+
+def _get_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise UncompilableExpression("%s has no field %s" %
+                                     (model.__name__, name))
+
+
+def _make_getter(path, attname):
+    """Makes a function that retrieves the value of attname by following the
+    foreign key attributes in path from an alert. A NULL foreign key along the
+    path yields a None value.
+
+    """
+    def _getter(alert):
+        obj = alert
+        for name in path:
+            obj = getattr(obj, name)
+            if obj is None:
+                return None
+        return getattr(obj, attname)
+    return _getter
+
+
+def _to_python(field, value):
+    try:
+        return field.to_python(value)
+    except ValidationError:
+        raise UncompilableExpression("%r is not a valid %s value" %
+                                     (value, field.name))
+
+
+def _is_text_field(field):
+    return isinstance(field, (models.CharField, models.TextField))
@@ -36,6 +36,10 @@ linkDown.alert = 4m
 snmpAgentDown.alert = 4m
 
 bgpDown.alert = 1m
+
+[queue]
+batched = no
+batch_size = 500
 """
 
     def get_timeout_for(self, option):
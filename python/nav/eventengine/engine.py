@@ -21,11 +21,15 @@ SQL is needed::
 
     CREATE RULE eventq_notify AS ON INSERT TO eventq DO ALSO NOTIFY new_event;
 
+Cached topology information is invalidated when a topology_changed
+notification is received, as sent by navtopology.
+
 """
 import logging
 import sched
 import select
 import time
+from collections import defaultdict
 from functools import wraps
 import errno
 from psycopg2 import OperationalError
@@ -33,12 +37,21 @@ from nav.eventengine.plugin import EventHandler
 from nav.eventengine.alerts import AlertGenerator
 from nav.eventengine.config import EVENTENGINE_CONF
 from nav.eventengine import unresolved
+from nav.eventengine import topology
+from nav.metrics.carbon import send_metrics
+from nav.metrics.templates import (
+    metric_prefix_for_eventengine,
+    metric_path_for_eventengine_plugin_runtime,
+)
 from nav.models.event import EventQueue as Event
 import nav.db
 from django.db import connection, DatabaseError, transaction
 
 _logger = logging.getLogger(__name__)
 
+EVENT_CHANNEL = 'new_event'
+TOPOLOGY_CHANNEL = topology.TOPOLOGY_CHANGE_CHANNEL
+
 
 def harakiri():
     """Kills the entire daemon when no database is available"""
@@ -81,6 +94,10 @@ class EventEngine(object):
     # too often, since we rely on PostgreSQL notification when new events are
     # inserted into the queue.
     CHECK_INTERVAL = 30
+    # interval for reconciling the unresolved alerts map with the database.
+    # the map is otherwise maintained incrementally as we open and close
+    # alerts ourselves, but other NAV processes may resolve alerts too.
+    UNRESOLVED_RECONCILE_INTERVAL = 60
     PLUGIN_TASKS_PRIORITY = 1
     _logger = logging.getLogger(__name__)
 
@@ -89,6 +106,10 @@ class EventEngine(object):
         self._unfinished = set()
         self.target = target
         self.config = config
+        self.batched = config.getboolean('queue', 'batched')
+        self.batch_size = config.getint('queue', 'batch_size')
+        self._last_event_id = 0
+        self._plugin_runtimes = defaultdict(float)
         self.handlers = EventHandler.load_and_find_subclasses()
         self._logger.debug("found %d event handler%s: %r",
                            len(self.handlers),
@@ -115,9 +136,15 @@ class EventEngine(object):
                 self._listen()
                 return
             if conn.notifies:
-                self._logger.debug("got event notification from database")
-                self._schedule_next_queuecheck()
+                channels = set(notify.channel for notify in conn.notifies)
                 del conn.notifies[:]
+                if TOPOLOGY_CHANNEL in channels:
+                    self._logger.debug("got topology change notification "
+                                       "from database")
+                    topology.invalidate_topology_cache()
+                if EVENT_CHANNEL in channels:
+                    self._logger.debug("got event notification from database")
+                    self._schedule_next_queuecheck()
         else:
             time.sleep(delay)
 
@@ -125,6 +152,7 @@ class EventEngine(object):
         "Starts the event engine"
         self._logger.info("--- starting event engine ---")
         self._listen()
+        self._load_unresolved_alerts()
         self._load_new_events_and_reschedule()
         self._scheduler.run()
 
@@ -132,15 +160,42 @@ class EventEngine(object):
     @retry_on_db_loss()
     @transaction.atomic()
     def _listen():
-        """Ensures that we subscribe to new_event notifications on our
-        PostgreSQL connection.
+        """Ensures that we subscribe to new_event and topology_changed
+        notifications on our PostgreSQL connection.
 
         """
         _logger.debug("registering event listener with PostgreSQL")
         cursor = connection.cursor()
-        cursor.execute('LISTEN new_event')
+        cursor.execute('LISTEN ' + EVENT_CHANNEL)
+        cursor.execute('LISTEN ' + TOPOLOGY_CHANNEL)
+
+    @retry_on_db_loss()
+    @transaction.atomic()
+    def _load_unresolved_alerts(self):
+        unresolved.update()
+        self._logger.debug("loaded %d unresolved alerts",
+                           len(unresolved.get_map()))
+        self._scheduler.enter(self.UNRESOLVED_RECONCILE_INTERVAL, 0,
+                              self._reconcile_unresolved_alerts, ())
+
+    @swallow_unhandled_exceptions
+    @transaction.atomic()
+    def _reconcile_unresolved_alerts(self):
+        try:
+            loaded, dropped = unresolved.reconcile()
+            if loaded or dropped:
+                self._logger.info("unresolved alerts map was out of sync "
+                                  "with database: loaded %d, dropped %d",
+                                  loaded, dropped)
+            self._logger.debug("unresolved alerts map stats: %r",
+                               unresolved.get_stats())
+        finally:
+            self._scheduler.enter(self.UNRESOLVED_RECONCILE_INTERVAL, 0,
+                                  self._reconcile_unresolved_alerts, ())
 
     def _load_new_events_and_reschedule(self):
+        if self.batched:
+            self._load_missed_events()
         self.load_new_events()
         self._schedule_next_queuecheck(
             self.CHECK_INTERVAL,
@@ -152,10 +207,16 @@ class EventEngine(object):
 
         self._scheduler.enter(delay, 0, action, ())
 
-    @swallow_unhandled_exceptions
-    @transaction.atomic()
     def load_new_events(self):
         "Loads and processes new events on the queue, if any"
+        if self.batched:
+            self._load_new_event_batches()
+        else:
+            self._load_all_events()
+
+    @swallow_unhandled_exceptions
+    @transaction.atomic()
+    def _load_all_events(self):
         self._logger.debug("checking for new events on queue")
         events = Event.objects.filter(target=self.target).order_by('id')
         if events:
@@ -166,18 +227,99 @@ class EventEngine(object):
             self._logger.info("found %d new and %d old events in queue db",
                               len(new_events), len(old_events))
             for event in new_events:
-                unresolved.update()
-                try:
-                    self.handle_event(event)
-                except Exception:
-                    self._logger.exception("Unhandled exception while "
-                                           "handling %s, deleting event",
-                                           event)
-                    if event.id:
-                        event.delete()
+                self._handle_event_or_delete(event)
 
         self._log_task_queue()
 
+    def _handle_event_or_delete(self, event):
+        try:
+            self.handle_event(event)
+        except Exception:
+            self._logger.exception("Unhandled exception while "
+                                   "handling %s, deleting event",
+                                   event)
+            if event.id:
+                event.delete()
+
+    @swallow_unhandled_exceptions
+    def _load_new_event_batches(self):
+        """Loads and processes events newer than the last seen event, in
+        batches of at most batch_size events.
+
+        """
+        self._logger.debug("checking for events newer than #%s on queue",
+                           self._last_event_id)
+        latencies = []
+        handled = 0
+        while True:
+            start = time.time()
+            count = self._handle_event_batch()
+            if not count:
+                break
+            latencies.append(time.time() - start)
+            handled += count
+            if count < self.batch_size:
+                break
+
+        if handled:
+            self._logger.info("handled %d new events in %d batches",
+                              handled, len(latencies))
+            self._send_queue_metrics(handled, latencies)
+        self._log_task_queue()
+
+    @transaction.atomic()
+    def _handle_event_batch(self):
+        """Handles a single batch of new events within one transaction.
+
+        :returns: The number of events in the batch.
+
+        """
+        events = list(Event.objects.filter(
+            target=self.target, id__gt=self._last_event_id).order_by('id')[
+                :self.batch_size])
+        for event in events:
+            self._last_event_id = event.id
+            self._handle_event_or_delete(event)
+        return len(events)
+
+    @swallow_unhandled_exceptions
+    @transaction.atomic()
+    def _load_missed_events(self):
+        """Handles any events below the high-water mark that have neither been
+        seen nor are held for later processing.
+
+        Event ids are allocated before the inserting transactions commit, so
+        an event may become visible after events with higher ids have already
+        been processed.
+
+        """
+        ids = Event.objects.filter(
+            target=self.target, id__lte=self._last_event_id).values_list(
+                'id', flat=True)
+        missed = set(ids).difference(self._unfinished)
+        if missed:
+            self._logger.info("found %d events missed by the batched queue "
+                              "reader", len(missed))
+            for event in Event.objects.filter(id__in=missed).order_by('id'):
+                self._handle_event_or_delete(event)
+
+    def _send_queue_metrics(self, handled, latencies):
+        prefix = metric_prefix_for_eventengine()
+        now = time.time()
+        depth = Event.objects.filter(target=self.target).count()
+        metrics = [
+            (prefix + '.queue.depth', (now, depth)),
+            (prefix + '.queue.held', (now, len(self._unfinished))),
+            (prefix + '.queue.handled', (now, handled)),
+            (prefix + '.queue.batch_latency', (now, max(latencies))),
+        ]
+        metrics.extend(
+            (metric_path_for_eventengine_plugin_runtime(plugin),
+             (now, runtime))
+            for plugin, runtime in self._plugin_runtimes.items())
+        self._plugin_runtimes.clear()
+        send_metrics(metrics)
+
     def _log_task_queue(self):
         logger = logging.getLogger(__name__ + '.queue')
         if not logger.isEnabledFor(logging.DEBUG):
@@ -236,7 +378,9 @@ class EventEngine(object):
             self._post_generic_alert(event)
 
         for handler in queue:
-            self._logger.debug("giving event to %s", handler.__class__.__name__)
+            plugin = handler.__class__.__name__
+            self._logger.debug("giving event to %s", plugin)
+            start = time.time()
             try:
                 handler.handle()
             except Exception:
@@ -246,6 +390,8 @@ class EventEngine(object):
                     # there's only one handler and it failed,
                     # this will probably never be handled, so we delete it
                     event.delete()
+            finally:
+                self._plugin_runtimes[plugin] += time.time() - start
 
         if event.id:
             self._logger.debug("event wasn't disposed of, "
@@ -16,7 +16,8 @@
 """"Superclass for plugins that use delayed handling of state events"""
 from nav.eventengine import unresolved
 
-from nav.eventengine.topology import netbox_appears_reachable
+from nav.eventengine.topology import (netbox_appears_reachable,
+                                     forget_reachability)
 from nav.models.manage import Netbox
 from nav.eventengine.plugin import EventHandler
 
@@ -205,11 +206,29 @@ class DelayedStateHandler(EventHandler):
 
     def _verify_shadow(self):
         netbox = self.event.netbox
-        netbox.up = (Netbox.UP_DOWN if netbox_appears_reachable(netbox)
-                     else Netbox.UP_SHADOW)
+        was_up = netbox.up == Netbox.UP_UP
+        reachable = netbox_appears_reachable(
+            netbox, pending=self._get_pending_netboxes())
+        netbox.up = Netbox.UP_DOWN if reachable else Netbox.UP_SHADOW
         Netbox.objects.filter(id=netbox.id).update(up=netbox.up)
+        if was_up:
+            forget_reachability()
         return netbox.up == Netbox.UP_SHADOW
 
+    def _get_pending_netboxes(self):
+        """Returns the netboxes of all other plugin instances of this type
+        that are currently waiting for a resolve.
+
+        Their reachability is likely to be verified soon, and is more
+        efficiently evaluated in the same pass as our own netbox.
+
+        """
+        return set(plugin.event.netbox
+                   for (plugin_type, _target), plugin
+                   in self.__waiting_for_resolve.items()
+                   if plugin_type is type(self) and plugin is not self
+                   and plugin.event.netbox)
+
     def schedule(self, delay, action, args=()):
         "Schedules a callback and makes a note of it in a class variable"
         self.task = self.engine.schedule(delay, action, args=args)
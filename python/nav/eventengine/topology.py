@@ -16,6 +16,7 @@
 """Topology evaluation functions for event processing"""
 import socket
 import datetime
+import itertools
 
 import networkx
 from networkx.exception import NetworkXException
@@ -25,17 +26,198 @@ import logging
 _logger = logging.getLogger(__name__)
 
 
-def netbox_appears_reachable(netbox):
+# The PostgreSQL notification channel used to signal topology changes
+TOPOLOGY_CHANGE_CHANNEL = 'topology_changed'
+
+# VLAN topology graphs are cached for this long, unless the cache is
+# invalidated earlier by a topology change notification
+GRAPH_CACHE_MAX_AGE = datetime.timedelta(minutes=10)
+
+
+def netbox_appears_reachable(netbox, pending=()):
     """Returns True if netbox appears to be reachable through the known
     topology.
 
+    Results are remembered until forget_reachability() is called, which
+    should happen whenever a netbox changes between being up and down.
+
+    :param pending: Other netboxes whose reachability is likely to be asked
+                    for shortly. Any of these that are not already known are
+                    evaluated in the same pass as netbox.
+
+    """
+    unknown = set(box for box in itertools.chain([netbox], pending)
+                  if box.id not in _reachability)
+    if unknown:
+        _reachability.update(netboxes_appear_reachable(unknown))
+    return _reachability[netbox.id]
+
+
+def netboxes_appear_reachable(netboxes):
+    """Evaluates the reachability of multiple netboxes in one pass.
+
+    Each VLAN topology graph involved is retrieved and analyzed only once,
+    regardless of how many of the netboxes are located on it.
+
+    :returns: A dict mapping netbox ids to True or False values.
+
+    """
+    evaluators = {}
+    nav_paths = {}
+    results = {}
+    for netbox in netboxes:
+        target_path = _evaluate_path(netbox, evaluators)
+        nav = NAVServer.make_for(netbox.ip)
+        if not nav:
+            nav_path = True
+        elif nav.ip in nav_paths:
+            nav_path = nav_paths[nav.ip]
+        else:
+            nav_path = nav_paths[nav.ip] = _evaluate_path(
+                nav, evaluators, nav.get_switches_from_cam())
+        _logger.debug("reachability of %(netbox)s, "
+                      "target_path=%(target_path)r, nav_path=%(nav_path)r",
+                      locals())
+        results[netbox.id] = bool(target_path and nav_path)
+    return results
+
+
+def forget_reachability():
+    """Forgets all reachability results remembered by
+    netbox_appears_reachable().
+
+    """
+    _reachability.clear()
+
+
+def invalidate_topology_cache():
+    """Invalidates all cached VLAN topology graphs, as well as all remembered
+    reachability results.
+
+    """
+    _graph_cache.invalidate()
+    forget_reachability()
+
+
+def _evaluate_path(node, evaluators, extra_neighbors=()):
+    """Evaluates whether node appears to have a path to its apparent router.
+
+    :param evaluators: A dict of VlanReachability objects (or None values)
+                       per prefix id, shared between evaluations of the same
+                       pass.
+    :param extra_neighbors: Neighbors of node that are not part of the VLAN
+                            topology graph.
+
     """
-    target_path = get_path_to_netbox(netbox)
-    nav = NAVServer.make_for(netbox.ip)
-    nav_path = get_path_to_netbox(nav) if nav else True
-    _logger.debug("reachability paths, target_path=%(target_path)r, "
-                  "nav_path=%(nav_path)r", locals())
-    return bool(target_path and nav_path)
+    prefix = node.get_prefix()
+    if not prefix:
+        _logger.warning("couldn't find prefix for %s", node)
+        return True
+
+    if prefix.id not in evaluators:
+        router_ports = prefix.get_router_ports()
+        if router_ports:
+            router = router_ports[0].interface.netbox
+            evaluators[prefix.id] = VlanReachability(
+                _graph_cache.get(prefix.vlan), router, prefix)
+        else:
+            _logger.warning("couldn't find router ports for %s", prefix)
+            evaluators[prefix.id] = None
+
+    evaluator = evaluators[prefix.id]
+    if evaluator is None:
+        return True
+    return evaluator.evaluate(node, extra_neighbors)
+
+
+class VlanReachability(object):
+    """Evaluates whether nodes of a VLAN topology graph appear to have a path
+    to the VLAN's router through nodes that are up.
+
+    The set of nodes connected to the router is computed only once, both with
+    and without the nodes that are currently down, so that any number of
+    nodes can be evaluated against the same graph.
+
+    This gives the same answers as get_path_to_netbox(), without modifying
+    the graph.
+
+    """
+    def __init__(self, graph, router, prefix):
+        self.graph = graph
+        self.router = router
+        self.prefix = prefix
+        self._connected = None
+        self._connected_up = None
+
+    def evaluate(self, node, extra_neighbors=()):
+        """Returns True if node appears to have a path to the router, or if
+        there is insufficient information to find a likely path. Returns
+        False if the path is broken by nodes that are down.
+
+        """
+        router = self.router
+        if node == router:
+            return router in self.graph or router.up == router.UP_UP
+
+        neighbors = set(extra_neighbors)
+        if node in self.graph:
+            neighbors.update(self.graph.neighbors(node))
+
+        # first, see if any path exists
+        if node not in self.connected and not neighbors & self.connected:
+            _logger.warning("cannot find a path between %s and %s on VLAN %s",
+                            node, router, self.prefix.vlan)
+            return True
+
+        if not self._router_is_up():
+            if router.up == router.UP_UP:
+                _logger.warning("%(node)s topology problem: router %(router)s "
+                                "is up, but not in VLAN graph for %(prefix)r. "
+                                "Defaulting to 'reachable' status.",
+                                dict(node=node, router=router,
+                                     prefix=self.prefix))
+                return True
+            _logger.debug("%s not reachable, router is down", node)
+            return False
+
+        # now, see if a path still exists through nodes that are up
+        return node in self.connected_up or bool(neighbors & self.connected_up)
+
+    @property
+    def connected(self):
+        """The set of nodes that have a path to the router"""
+        if self._connected is None:
+            self._connected = self._find_connected(lambda node: True)
+        return self._connected
+
+    @property
+    def connected_up(self):
+        """The set of nodes that are up and have a path to the router through
+        nodes that are up.
+
+        """
+        if self._connected_up is None:
+            self._connected_up = self._find_connected(_is_up)
+        return self._connected_up
+
+    def _router_is_up(self):
+        return self.router in self.graph and self.router in self.connected_up
+
+    def _find_connected(self, is_passable):
+        if self.router not in self.graph or not is_passable(self.router):
+            return set()
+        found = set([self.router])
+        stack = [self.router]
+        while stack:
+            for neighbor in self.graph.neighbors_iter(stack.pop()):
+                if neighbor not in found and is_passable(neighbor):
+                    found.add(neighbor)
+                    stack.append(neighbor)
+        return found
+
+
+def _is_up(node):
+    return node.up == node.UP_UP
 
 
 def get_path_to_netbox(netbox):
@@ -133,6 +315,56 @@ def get_graph_for_vlan(vlan):
     return graph
 
 
+class VlanGraphCache(object):
+    """A cache of VLAN topology graphs, as built by get_graph_for_vlan().
+
+    The cached graphs describe only the topology, which changes rarely. The
+    up states of the graph nodes are refreshed from the database every time
+    a graph is retrieved.
+
+    Graphs retrieved from the cache are shared, and must not be modified.
+
+    """
+    def __init__(self, max_age=GRAPH_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self._graphs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, vlan):
+        """Returns the topology graph for vlan"""
+        now = datetime.datetime.now()
+        cached = self._graphs.get(vlan.id)
+        if cached and now - cached[0] <= self.max_age:
+            graph = cached[1]
+            self.hits += 1
+        else:
+            graph = get_graph_for_vlan(vlan)
+            self._graphs[vlan.id] = (now, graph)
+            self.misses += 1
+        _refresh_up_states(graph)
+        return graph
+
+    def invalidate(self):
+        """Removes all graphs from the cache"""
+        _logger.debug("invalidating %d cached VLAN graphs (%d hits, "
+                      "%d misses)", len(self._graphs), self.hits, self.misses)
+        self._graphs.clear()
+
+
+def _refresh_up_states(graph):
+    """Refreshes the up states of the netbox nodes of graph"""
+    nodes = graph.nodes()
+    states = dict(Netbox.objects.filter(
+        id__in=[node.id for node in nodes]).values_list('id', 'up'))
+    for node in nodes:
+        node.up = states.get(node.id, node.up)
+
+
+_graph_cache = VlanGraphCache()
+_reachability = {}
+
+
 def strip_down_nodes_from_graph(graph, keep=None):
     """Strips all nodes (netboxes) from graph that are currently down.
 
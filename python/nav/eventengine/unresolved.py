@@ -21,6 +21,7 @@ import logging
 
 _logger = logging.getLogger(__name__)
 _unresolved_alerts_map = {}
+_stats = dict(hits=0, misses=0, added=0, removed=0, reconciled=0)
 
 
 def get_map():
@@ -28,6 +29,16 @@ def get_map():
     return _unresolved_alerts_map
 
 
+def get_stats():
+    """Returns a dictionary of counters describing the use of the unresolved
+    alerts map, including its current size.
+
+    """
+    stats = dict(_stats)
+    stats['size'] = len(_unresolved_alerts_map)
+    return stats
+
+
 def update():
     """Updates the map of unresolved alerts from the database"""
     # yes mr. pylint, we use global state, this module acts as a singleton
@@ -38,6 +49,54 @@ def update():
                                   for alert in unresolved)
 
 
+def reconcile():
+    """Cheaply reconciles the map of unresolved alerts with the database.
+
+    Only the ids of unresolved alerts are queried; entries that have been
+    resolved behind our back are dropped from the map, while entries missing
+    from the map are loaded.
+
+    :returns: A tuple of the number of (loaded, dropped) map entries.
+
+    """
+    current_ids = set(AlertHistory.objects.filter(
+        end_time__gte=INFINITY).values_list('id', flat=True))
+    mapped = dict((alert.id, key)
+                  for key, alert in _unresolved_alerts_map.items())
+
+    dropped = [key for alert_id, key in mapped.items()
+               if alert_id not in current_ids]
+    for key in dropped:
+        del _unresolved_alerts_map[key]
+
+    missing = current_ids.difference(mapped)
+    if missing:
+        for alert in AlertHistory.objects.filter(id__in=missing):
+            _unresolved_alerts_map[alert.get_key()] = alert
+
+    _stats['reconciled'] += len(missing) + len(dropped)
+    return len(missing), len(dropped)
+
+
+def track(alert):
+    """Updates the map of unresolved alerts with an AlertHistory entry that
+    was just saved, adding it if it is unresolved and removing it if it was
+    resolved.
+
+    :type alert: nav.models.event.AlertHistory
+
+    """
+    key = alert.get_key()
+    if alert.end_time is not None and alert.end_time >= INFINITY:
+        _unresolved_alerts_map[key] = alert
+        _stats['added'] += 1
+    else:
+        mapped = _unresolved_alerts_map.get(key)
+        if mapped is not None and mapped.id == alert.id:
+            del _unresolved_alerts_map[key]
+            _stats['removed'] += 1
+
+
 def refers_to_unresolved_alert(event):
     """Verifies whether an event appears to refer to a currently
     unresolved alert state.
@@ -48,9 +107,10 @@ def refers_to_unresolved_alert(event):
     """
     try:
         result = _unresolved_alerts_map[event.get_key()]
+        _stats['hits'] += 1
         return result
     except KeyError:
+        _stats['misses'] += 1
         _logger.debug("no match for (%r) %r among list of unresolved alerts",
                       event.get_key(), event)
-        _logger.debug("unresolved map contains: %r", _unresolved_alerts_map)
         return False
@@ -32,10 +32,30 @@ class IpdevpollConfig(NAVConfigParser):
 [ipdevpoll]
 logfile = ipdevpolld.log
 max_concurrent_jobs = 500
+bulk_save = no
+joblog_flush_interval = 5s
+joblog_max_queue = 10000
+
+[multiprocess]
+max-worker-rss = 0
+affinity-slack = 30
 
 [snmp]
 timeout = 1.5
 max-repetitions = 10
+max-concurrent-columns = 1
+columns-per-request = 1
+
+[snmpcache]
+enabled = no
+max-values = 500000
+
+[snmpcache:oids]
+1.3.6.1.2.1.2.2.1.2 = 10m
+1.3.6.1.2.1.2.2.1.3 = 10m
+1.3.6.1.2.1.31.1.1.1.1 = 10m
+1.3.6.1.2.1.31.1.1.1.18 = 10m
+1.3.6.1.2.1.17.1.4.1.2 = 10m
 
 [plugins]
 
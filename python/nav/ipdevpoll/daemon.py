@@ -39,6 +39,7 @@ from nav.util import is_valid_ip
 import nav.daemon
 from nav.daemon import signame
 import nav.logs
+from nav.metrics import twistedcarbon
 from nav.models import manage
 
 from nav.ipdevpoll import ContextFormatter, schedule, db
@@ -83,6 +84,7 @@ class IPDevPollProcess(object):
     def run(self):
         """Loads plugins, and initiates polling schedules."""
         reactor.callWhenRunning(self.install_sighandlers)
+        twistedcarbon.install_from_config()
 
         if self.options.netbox:
             self.setup_single_job()
@@ -177,10 +179,16 @@ class IPDevPollProcess(object):
     def setup_multiprocess(self, process_count, max_jobs):
         self._logger.info("Starting multi-process setup")
         from .schedule import JobScheduler
+        from .config import ipdevpoll_conf
         plugins.import_plugins()
-        self.work_pool = pool.WorkerPool(process_count,
-                                         max_jobs,
-                                         self.options.threadpoolsize)
+        max_rss = ipdevpoll_conf.getint('multiprocess', 'max-worker-rss')
+        self.work_pool = pool.WorkerPool(
+            process_count,
+            max_jobs,
+            self.options.threadpoolsize,
+            max_rss=max_rss * 1024 * 1024,
+            affinity_slack=ipdevpoll_conf.getfloat('multiprocess',
+                                                   'affinity-slack'))
         reactor.callWhenRunning(JobScheduler.initialize_from_config_and_run,
                                 self.work_pool, self.options.onlyjob)
 
@@ -31,14 +31,30 @@ database during asynchronous operation.  The loading/reloading of data
 from the database can be executed in a separate thread to avoid
 interfering with the daemon's asynchronous operations.
 
+Alongside the netboxes, a snapshot of each netbox' inventory counts (its
+"capabilities") is loaded in bulk and cached, so that plugins can decide
+whether they can handle a netbox without querying the database on every
+job run.
+
 """
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+import datetime
+import threading
+
+from twisted.internet import defer
 
 from nav.models import manage, event
 from nav import ipdevpoll
 from . import storage
 from nav.ipdevpoll.db import django_debug_cleanup, run_in_thread
 import django.db
+from django.db.models import Q
+
+# How often all netboxes are reloaded, rather than just the modified ones
+NETBOX_FULL_RELOAD_INTERVAL = datetime.timedelta(minutes=30)
+# How far back modifications are looked for beyond the previous reload, to
+# catch changes committed by transactions that were running at the time
+NETBOX_MODIFICATION_OVERLAP = datetime.timedelta(minutes=5)
 
 
 def load_netbox(netbox_id):
@@ -55,6 +71,51 @@ def load_netbox(netbox_id):
     return storage.shadowify(netbox)
 
 
+def get_database_time():
+    """Returns the current time according to the database server"""
+    cursor = django.db.connection.cursor()
+    cursor.execute("SELECT LOCALTIMESTAMP")
+    return cursor.fetchone()[0]
+
+
+def load_snmp_down_ids():
+    """Returns the set of IDs of netboxes with an active snmpAgentState"""
+    return set(event.AlertHistory.objects.unresolved(
+        'snmpAgentState').values_list('netbox__id', flat=True))
+
+
+def load_netbox_ids():
+    """Returns the set of IDs of all netboxes that aren't deleted"""
+    return set(manage.Netbox.objects.filter(
+        deleted_at__isnull=True).values_list('id', flat=True))
+
+
+def load_netboxes(snmp_down, last_updated, modified_since=None,
+                  extra_ids=()):
+    """Loads netboxes that aren't deleted, converted to Shadow objects.
+
+    :param snmp_down: The set of IDs of netboxes whose SNMP agents are down.
+    :param last_updated: A dict of last-success times, as returned by
+                         load_last_updated_times().
+    :param modified_since: If set, only netboxes modified after this time,
+                           or listed in extra_ids, are loaded.
+    :param extra_ids: IDs of netboxes to load regardless of modified_since.
+    :rtype: list of nav.ipdevpoll.shadows.netbox.Netbox
+
+    """
+    related = ('room__location', 'type__vendor',
+               'category', 'organization', 'device')
+    queryset = manage.Netbox.objects.filter(deleted_at__isnull=True)
+    if modified_since is not None:
+        queryset = queryset.filter(Q(last_modified__gt=modified_since) |
+                                   Q(id__in=list(extra_ids)))
+    queryset = list(queryset.select_related(*related))
+    for netbox in queryset:
+        netbox.snmp_up = netbox.id not in snmp_down
+        netbox.last_updated = last_updated.get(netbox.id, {})
+    return storage.shadowify_queryset(queryset)
+
+
 class NetboxLoader(dict):
     """Loads netboxes from the database, synchronously or asynchronously.
 
@@ -68,6 +129,8 @@ class NetboxLoader(dict):
     def __init__(self):
         super(NetboxLoader, self).__init__()
         self.peak_count = 0
+        self._last_stamp = None
+        self._last_full_reload = None
         # touch _logger to initialize logging context right away
         # pylint: disable=W0104
         self._logger
@@ -75,6 +138,11 @@ class NetboxLoader(dict):
     def load_all_s(self):
         """Synchronously load netboxes from database.
 
+        Only netboxes whose rows have been modified since the previous load
+        are actually reloaded, except for a full reload every
+        NETBOX_FULL_RELOAD_INTERVAL, which also picks up changes to related
+        objects, such as rooms and types.
+
         Returns:
 
           A three-tuple, (new_ids, lost_ids, changed_ids), whose elements are
@@ -89,32 +157,35 @@ class NetboxLoader(dict):
             changed in the database since the last load operation.
 
         """
-        related = ('room__location', 'type__vendor',
-                   'category', 'organization', 'device')
-        snmp_down = set(event.AlertHistory.objects.unresolved(
-            'snmpAgentState').values_list('netbox__id', flat=True))
+        stamp = get_database_time()
+        full_reload = self._is_full_reload_due(stamp)
+        snmp_down = load_snmp_down_ids()
         self._logger.debug("These netboxes have active snmpAgentStates: %r",
                            snmp_down)
-        queryset = manage.Netbox.objects.filter(deleted_at__isnull=True)
-        queryset = list(queryset.select_related(*related))
-        for netbox in queryset:
-            netbox.snmp_up = netbox.id not in snmp_down
-        netbox_list = storage.shadowify_queryset(queryset)
-        netbox_dict = dict((netbox.id, netbox) for netbox in netbox_list)
-
         times = load_last_updated_times()
-        for netbox in netbox_list:
-            netbox.last_updated = times.get(netbox.id, {})
-
-        django_debug_cleanup()
 
         previous_ids = set(self.keys())
-        current_ids = set(netbox_dict.keys())
+        if full_reload:
+            netbox_list = load_netboxes(snmp_down, times)
+        else:
+            present_ids = load_netbox_ids()
+            netbox_list = load_netboxes(
+                snmp_down, times,
+                modified_since=self._last_stamp - NETBOX_MODIFICATION_OVERLAP,
+                extra_ids=present_ids.difference(previous_ids))
+        netbox_dict = dict((netbox.id, netbox) for netbox in netbox_list)
+
+        if full_reload:
+            current_ids = set(netbox_dict.keys())
+        else:
+            current_ids = present_ids.intersection(previous_ids).union(
+                netbox_dict.keys())
         lost_ids = previous_ids.difference(current_ids)
         new_ids = current_ids.difference(previous_ids)
 
         same_ids = previous_ids.intersection(current_ids)
-        changed_ids = set(i for i in same_ids
+        reloaded_ids = same_ids.intersection(netbox_dict.keys())
+        changed_ids = set(i for i in reloaded_ids
                           if is_netbox_changed(self[i], netbox_dict[i]))
 
         # update self
@@ -122,22 +193,42 @@ class NetboxLoader(dict):
             del self[i]
         for i in new_ids:
             self[i] = netbox_dict[i]
-        for i in same_ids:
+        for i in reloaded_ids:
             self[i].copy(netbox_dict[i])
+        for i in same_ids.difference(reloaded_ids):
+            netbox = self[i]
+            netbox.last_updated = times.get(i, {})
+            snmp_up = i not in snmp_down
+            if netbox.snmp_up != snmp_up:
+                netbox.snmp_up = snmp_up
+                changed_ids.add(i)
+
+        _capability_cache.load_all(current_ids)
+
+        django_debug_cleanup()
+
+        self._last_stamp = stamp
+        if full_reload:
+            self._last_full_reload = stamp
 
         self.peak_count = max(self.peak_count, len(self))
 
         anything_changed = len(new_ids) or len(lost_ids) or len(changed_ids)
         log = self._logger.info if anything_changed else self._logger.debug
 
-        log("Loaded %d netboxes from database "
+        log("Loaded %d of %d netboxes from database "
             "(%d new, %d removed, %d changed, %d peak)",
-            len(netbox_dict), len(new_ids), len(lost_ids), len(changed_ids),
-            self.peak_count
+            len(netbox_dict), len(self), len(new_ids), len(lost_ids),
+            len(changed_ids), self.peak_count
             )
 
         return (new_ids, lost_ids, changed_ids)
 
+    def _is_full_reload_due(self, now):
+        return (self._last_stamp is None or
+                self._last_full_reload is None or
+                now - self._last_full_reload >= NETBOX_FULL_RELOAD_INTERVAL)
+
     def load_all(self):
         """Asynchronously load netboxes from database."""
         return run_in_thread(self.load_all_s)
@@ -175,12 +266,9 @@ def load_last_updated_times():
     sql = """SELECT
                netboxid,
                job_name,
-               MAX(end_time) AS end_time
+               end_time
              FROM
-               ipdevpoll_job_log
-             WHERE
-               success
-             GROUP BY netboxid, job_name
+               ipdevpoll_job_last_success
              """
     cursor = django.db.connection.cursor()
     cursor.execute(sql)
@@ -188,3 +276,144 @@ def load_last_updated_times():
     for netboxid, job_name, end_time in cursor.fetchall():
         times[netboxid][job_name] = end_time
     return dict(times)
+
+
+def load_job_runtimes(max_age=datetime.timedelta(days=1)):
+    """Loads the average runtime of each job of each netbox.
+
+    :param max_age: Only job log entries younger than this are considered.
+    :returns: A dict of {(netboxid, job_name): average_duration_in_seconds}
+
+    """
+    sql = """SELECT
+               netboxid,
+               job_name,
+               AVG(duration) AS duration
+             FROM
+               ipdevpoll_job_log
+             WHERE
+               success AND duration IS NOT NULL AND end_time > %s
+             GROUP BY netboxid, job_name
+             """
+    cursor = django.db.connection.cursor()
+    cursor.execute(sql, [datetime.datetime.now() - max_age])
+    return dict(((netboxid, job_name), float(duration))
+                for netboxid, job_name, duration in cursor.fetchall())
+
+
+NetboxCapabilities = namedtuple('NetboxCapabilities',
+                                'interfaces sensors power_supplies')
+NO_CAPABILITIES = NetboxCapabilities(interfaces=0, sensors=0,
+                                     power_supplies=0)
+
+# The models counted for each field of NetboxCapabilities
+CAPABILITY_MODELS = (
+    ('interfaces', manage.Interface),
+    ('sensors', manage.Sensor),
+    ('power_supplies', manage.PowerSupplyOrFan),
+)
+# How long a capability snapshot is trusted before it is reloaded
+CAPABILITY_MAX_AGE = datetime.timedelta(minutes=10)
+# Every job scheduler reloads its netboxes; this limits how often all
+# capability snapshots are reloaded as a consequence
+CAPABILITY_MIN_RELOAD_INTERVAL = datetime.timedelta(minutes=1)
+
+
+def load_capabilities(netbox_ids):
+    """Loads capability snapshots from the database.
+
+    :param netbox_ids: The IDs of the netboxes to load snapshots for.
+    :returns: A dict of {netbox_id: NetboxCapabilities}, with an entry for
+              every netbox in netbox_ids.
+
+    """
+    netbox_ids = list(netbox_ids)
+    counts = dict((netbox_id, {}) for netbox_id in netbox_ids)
+    cursor = django.db.connection.cursor()
+    for name, model in CAPABILITY_MODELS:
+        column = model._meta.get_field('netbox').column
+        sql = """SELECT {column}, COUNT(*)
+                 FROM {table}
+                 WHERE {column} = ANY(%s)
+                 GROUP BY {column}""".format(column=column,
+                                             table=model._meta.db_table)
+        cursor.execute(sql, [netbox_ids])
+        for netbox_id, count in cursor.fetchall():
+            counts[netbox_id][name] = count
+
+    return dict((netbox_id, NO_CAPABILITIES._replace(**values))
+                for netbox_id, values in counts.items())
+
+
+class CapabilityCache(object):
+    """A cache of per-netbox capability snapshots.
+
+    Snapshots are loaded in bulk by NetboxLoader, are refreshed for a single
+    netbox when a job has saved inventory data for it, and are discarded
+    when they become older than max_age.
+
+    """
+    def __init__(self, max_age=CAPABILITY_MAX_AGE,
+                 min_reload_interval=CAPABILITY_MIN_RELOAD_INTERVAL):
+        self.max_age = max_age
+        self.min_reload_interval = min_reload_interval
+        self._snapshots = {}
+        self._last_full_load = datetime.datetime.min
+        self._lock = threading.Lock()
+
+    def get(self, netbox_id):
+        """Returns the cached snapshot of a netbox, or None if no current
+        snapshot is available.
+
+        """
+        with self._lock:
+            cached = self._snapshots.get(netbox_id)
+        if cached and datetime.datetime.now() - cached[0] <= self.max_age:
+            return cached[1]
+
+    def load_all(self, netbox_ids):
+        """Synchronously reloads the snapshots of all the given netboxes,
+        discarding any other snapshots, unless a full reload was performed
+        recently.
+
+        """
+        now = datetime.datetime.now()
+        if now - self._last_full_load < self.min_reload_interval:
+            return
+        snapshots = load_capabilities(netbox_ids)
+        with self._lock:
+            self._snapshots = dict((netbox_id, (now, snapshot))
+                                   for netbox_id, snapshot
+                                   in snapshots.items())
+            self._last_full_load = now
+
+    def load(self, netbox_id):
+        """Synchronously reloads and returns the snapshot of a single
+        netbox.
+
+        """
+        now = datetime.datetime.now()
+        snapshot = load_capabilities([netbox_id])[netbox_id]
+        with self._lock:
+            self._snapshots[netbox_id] = (now, snapshot)
+        return snapshot
+
+
+_capability_cache = CapabilityCache()
+
+
+def get_capabilities(netbox):
+    """Gets the capability snapshot of a netbox, from the cache if possible.
+
+    :returns: A deferred whose result is a NetboxCapabilities instance.
+
+    """
+    snapshot = _capability_cache.get(netbox.id)
+    if snapshot is not None:
+        return defer.succeed(snapshot)
+    return run_in_thread(_capability_cache.load, netbox.id)
+
+
+def refresh_capabilities(netbox_id):
+    """Synchronously reloads the capability snapshot of a netbox"""
+    return _capability_cache.load(netbox_id)
@@ -0,0 +1,205 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.  You should have received a copy of the GNU General Public
+# License along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""Buffered logging of finished jobs to the database and to Graphite.
+
+Rather than writing a job log row and sending a Carbon packet as each job
+finishes, job log records and job metrics are queued in memory and written
+periodically: All queued records are inserted by a single multi-row INSERT
+statement in a database thread, and all queued metrics are sent together.
+
+Only one database flush is ever in progress; records keep queueing while a
+slow database is busy, but the queue is bounded, and the oldest records are
+discarded when it overflows.
+
+"""
+from collections import deque, namedtuple
+import datetime
+import logging
+
+from twisted.internet import defer, reactor
+from twisted.internet.task import LoopingCall
+
+from nav.metrics.carbon import send_metrics
+from nav.models import manage
+from nav.util import parse_interval
+from nav.ipdevpoll import db
+from . import storage
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_MAX_QUEUE = 10000
+
+JobLogRecord = namedtuple('JobLogRecord',
+                          'netbox_id job_name end_time duration success '
+                          'interval')
+
+
+class JobLogWriter(object):
+    """A bounded, periodically flushed queue of job log records and metrics.
+
+    :param interval: How often to flush the queues, in seconds.
+    :param max_queue: The maximum number of records, and of metrics, to
+                      queue. The oldest entries are discarded to make room
+                      for new ones.
+
+    """
+    def __init__(self, interval=DEFAULT_FLUSH_INTERVAL,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.interval = interval
+        self.records = deque(maxlen=max_queue)
+        self.metrics = deque(maxlen=max_queue)
+        self.dropped_records = 0
+        self.dropped_metrics = 0
+        self.loop = LoopingCall(self.flush)
+        self._flushing = None
+        self._shutdown_trigger = None
+
+    def start(self):
+        """Starts the periodic flushing task if it isn't running already"""
+        if not self.loop.running:
+            self.loop.start(self.interval, now=False)
+            self._shutdown_trigger = reactor.addSystemEventTrigger(
+                "before", "shutdown", self.stop)
+
+    def stop(self):
+        """Stops periodic flushing and flushes everything that is queued.
+
+        :returns: A deferred that fires when all queued records have been
+                  written.
+
+        """
+        if self.loop.running:
+            self.loop.stop()
+        return self._flush_all()
+
+    def add_record(self, netbox_id, job_name, timestamp, duration, success,
+                   interval):
+        """Queues a job log record for writing to the database"""
+        if len(self.records) == self.records.maxlen:
+            self.dropped_records += 1
+        self.records.append(JobLogRecord(
+            netbox_id, job_name, datetime.datetime.fromtimestamp(timestamp),
+            duration, success, interval))
+
+    def add_metrics(self, metric_tuples):
+        """Queues a list of metric tuples for sending to Graphite"""
+        for metric in metric_tuples:
+            if len(self.metrics) == self.metrics.maxlen:
+                self.dropped_metrics += 1
+            self.metrics.append(metric)
+
+    def flush(self):
+        """Sends all queued metrics, and starts writing all queued records to
+        the database unless a previous write is still in progress.
+
+        :returns: A deferred that fires when the database write is done.
+
+        """
+        self._log_dropped()
+        if self.metrics:
+            metrics = list(self.metrics)
+            self.metrics.clear()
+            send_metrics(metrics)
+
+        if self._flushing is not None:
+            _logger.debug("previous job log flush still in progress, "
+                          "%d records queued", len(self.records))
+            return self._flushing
+        if not self.records:
+            return defer.succeed(None)
+
+        records = list(self.records)
+        self.records.clear()
+        self._flushing = db.run_in_thread(write_job_log_records, records)
+        self._flushing.addErrback(self._write_failed, len(records))
+        self._flushing.addBoth(self._write_done)
+        return self._flushing
+
+    @defer.inlineCallbacks
+    def _flush_all(self):
+        yield self.flush()
+        while self.records:
+            yield self.flush()
+
+    def _write_failed(self, failure, count):
+        if not failure.check(db.ResetDBConnectionError):
+            _logger.warning("failed to log %d jobs to database: %s",
+                            count, failure.getErrorMessage())
+
+    def _write_done(self, _result):
+        self._flushing = None
+
+    def _log_dropped(self):
+        if self.dropped_records or self.dropped_metrics:
+            _logger.warning("job log queue overflowed, discarded %d job log "
+                            "records and %d metrics",
+                            self.dropped_records, self.dropped_metrics)
+            self.dropped_records = self.dropped_metrics = 0
+
+
+def write_job_log_records(records):
+    """Synchronously inserts job log records into the database.
+
+    Records of netboxes that have been deleted, or marked for deletion, are
+    not written, as a single such record would make the whole batch fail.
+
+    :param records: A list of JobLogRecord objects.
+
+    """
+    netbox_ids = set(record.netbox_id for record in records)
+    existing = set(manage.Netbox.objects.filter(
+        id__in=netbox_ids, deleted_at__isnull=True).values_list(
+            'id', flat=True))
+    missing = netbox_ids - existing
+    if missing:
+        _logger.info("Not logging jobs to db for %d IP devices that are "
+                     "deleted or whose delete was requested", len(missing))
+
+    meta = manage.IpdevpollJobLog._meta
+    fields = [meta.get_field(name) for name in
+              ('netbox', 'job_name', 'end_time', 'duration', 'success',
+               'interval')]
+    rows = [list(record) for record in records
+            if record.netbox_id in existing]
+    for index in range(0, len(rows), storage.BULK_BATCH_SIZE):
+        storage.bulk_insert(meta, fields,
+                            rows[index:index + storage.BULK_BATCH_SIZE])
+    db.django_debug_cleanup()
+
+
+_job_log_writer = None
+
+
+def get_job_log_writer():
+    """Returns the process-wide job log writer, starting it if necessary"""
+    global _job_log_writer  # pylint: disable=W0603
+    if _job_log_writer is None:
+        _job_log_writer = make_job_log_writer_from_config()
+    _job_log_writer.start()
+    return _job_log_writer
+
+
+def make_job_log_writer_from_config(config=None):
+    """Creates a JobLogWriter from the [ipdevpoll] configuration"""
+    if config is None:
+        from nav.ipdevpoll.config import ipdevpoll_conf as config
+
+    interval = parse_interval(
+        config.get('ipdevpoll', 'joblog_flush_interval'))
+    max_queue = config.getint('ipdevpoll', 'joblog_max_queue')
+    return JobLogWriter(interval=interval or DEFAULT_FLUSH_INTERVAL,
+                        max_queue=max_queue)
@@ -28,19 +28,21 @@ from twisted.internet.error import TimeoutError
 from nav.ipdevpoll import ContextLogger
 from nav.ipdevpoll.snmp import snmpprotocol, AgentProxy
 from nav.ipdevpoll.snmp.common import SnmpError
-from nav.metrics.carbon import send_metrics
 from nav.metrics.templates import metric_prefix_for_ipdevpoll_job
-from nav.models import manage
 from nav.util import splitby
 from nav.ipdevpoll import db
 from .plugins import plugin_registry
-from . import storage, shadows, dataloader
+from . import storage, shadows, dataloader, joblog
 from .utils import log_unhandled_failure
 from .snmp.common import snmp_parameter_factory
 
 _logger = logging.getLogger(__name__)
 ports = cycle([snmpprotocol.port() for i in range(50)])
 
+# Shadow classes whose saved data makes up a netbox' capability snapshot
+CAPABILITY_SHADOWS = (shadows.Interface, shadows.Sensor,
+                      shadows.PowerSupplyOrFan)
+
 
 class AbortedJobError(Exception):
     """Signals an aborted collection job."""
@@ -93,6 +95,7 @@ class JobHandler(object):
         self.storage_queue = []
 
         self.agent = None
+        self._request_stats = None
 
     def _create_agentproxy(self):
         if self.agent:
@@ -121,6 +124,7 @@ class JobHandler(object):
                 error, session_count, job_count)
             raise AbortedJobError("Cannot open SNMP session", cause=error)
         else:
+            self._request_stats = self.agent.request_stats
             self._logger.debug("AgentProxy created for %s: %s",
                                self.netbox.sysname, self.agent)
 
@@ -375,6 +379,21 @@ class JobHandler(object):
                         (self.name, self.netbox.sysname))
 
         self._timing_logger.debug("\n".join(log_text))
+        self._log_request_stats()
+
+    def _log_request_stats(self):
+        """Logs the number of SNMP requests sent by this job and the total
+        time spent waiting for responses.
+
+        """
+        stats = self._request_stats
+        if not stats:
+            return
+        self._timing_logger.debug(
+            "Job %r sent %d SNMP requests to %s, total round-trip time %.3fs "
+            "(%d table cache hits, %d misses)",
+            self.name, stats.requests, self.netbox.sysname,
+            stats.round_trip_time, stats.cache_hits, stats.cache_misses)
 
     def get_current_runtime(self):
         """Returns time elapsed since the start of the job as a timedelta."""
@@ -398,10 +417,19 @@ class JobHandler(object):
             self._log_timed_result(result, "Storing to database complete")
             # Do cleanup for the known container classes.
             self._cleanup_containers_after_save()
+            self._refresh_capabilities()
 
         df = db.run_in_thread(complete_save_cycle)
         return df
 
+    def _refresh_capabilities(self):
+        """Refreshes the netbox' capability snapshot if this job saved any of
+        the inventory data it is made from.
+
+        """
+        if any(cls in self.containers for cls in CAPABILITY_SHADOWS):
+            dataloader.refresh_capabilities(self.netbox.id)
+
     def _prepare_containers_for_save(self):
         """Runs every queued manager's prepare routine"""
         for manager in self.storage_queue:
@@ -437,14 +465,19 @@ class JobHandler(object):
         try:
             self._log_containers("containers before save")
 
+            save_times = []
             for manager in self.storage_queue:
                 self._raise_if_cancelled()
+                manager_start = time.time()
                 manager.save()
+                save_times.append(
+                    (manager, (time.time() - manager_start) * 1000.0))
 
             end_time = time.time()
             total_time = (end_time - start_time) * 1000.0
 
             self._log_containers("containers after save")
+            self._log_save_timings(save_times)
 
             return total_time
         except AbortedJobError:
@@ -459,6 +492,21 @@ class JobHandler(object):
                                    django.db.connection.queries[-1])
             raise
 
+    def _log_save_timings(self, save_times):
+        """Logs the time spent and rows written by each storage manager"""
+        log = self._timing_logger
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        log_text = ["Job %r save timings for %s:" %
+                    (self.name, self.netbox.sysname)]
+        for manager, msecs in save_times:
+            counts = getattr(manager, 'counts', {})
+            count_text = " ".join("%s=%d" % (key, counts[key])
+                                  for key in sorted(counts) if counts[key])
+            log_text.append("%-30s: %10.3f ms %s" %
+                            (manager.cls.__name__, msecs, count_text))
+        log.debug("\n".join(log_text))
+
     def _log_containers(self, prefix=None):
         log = self._queue_logger
         if not log.isEnabledFor(logging.DEBUG):
@@ -497,44 +545,33 @@ class JobHandler(object):
         """
         return len([o for o in gc.get_objects() if isinstance(o, cls)])
 
-    # pylint: disable=W0703
-    @defer.inlineCallbacks
     def _log_job_externally(self, success=True):
-        """Logs a job to the database"""
+        """Queues a log record and runtime metrics of this job for writing to
+        the database and to Graphite.
+
+        """
         duration = self.get_current_runtime()
         duration_in_seconds = (duration.days * 86400 +
                                duration.seconds +
                                duration.microseconds / 1e6)
         timestamp = time.time()
 
-        def _create_record(timestamp):
-            netbox = manage.Netbox.objects.get(id=self.netbox.id)
-            if netbox.deleted_at:
-                _logger.info("Not logging job to db; delete of this IP device"
-                             " was requested at %s", netbox.deleted_at)
-                return
-
-            log = manage.IpdevpollJobLog(
-                netbox_id=self.netbox.id,
-                job_name=self.name,
-                end_time=datetime.datetime.fromtimestamp(timestamp),
-                duration=duration_in_seconds,
-                success=success,
-                interval=self.interval
-            )
-            log.save()
-
-        def _log_to_graphite():
-            prefix = metric_prefix_for_ipdevpoll_job(self.netbox.sysname,
-                                                     self.name)
-            runtime_path = prefix + ".runtime"
-            runtime = (runtime_path, (timestamp, duration_in_seconds))
-            send_metrics([runtime])
-
-        _log_to_graphite()
-        try:
-            yield db.run_in_thread(_create_record, timestamp)
-        except db.ResetDBConnectionError:
-            pass  # this is being logged all over the place at the moment
-        except Exception as error:
-            _logger.warning("failed to log job to database: %s", error)
+        prefix = metric_prefix_for_ipdevpoll_job(self.netbox.sysname,
+                                                 self.name)
+        metrics = [(prefix + ".runtime", (timestamp, duration_in_seconds))]
+        stats = self._request_stats
+        if stats:
+            metrics.extend([
+                (prefix + ".snmp_requests", (timestamp, stats.requests)),
+                (prefix + ".snmp_round_trip_time",
+                 (timestamp, stats.round_trip_time)),
+                (prefix + ".snmp_cache_hits",
+                 (timestamp, stats.cache_hits)),
+                (prefix + ".snmp_cache_misses",
+                 (timestamp, stats.cache_misses)),
+            ])
+
+        writer = joblog.get_job_log_writer()
+        writer.add_metrics(metrics)
+        writer.add_record(self.netbox.id, self.name, timestamp,
+                          duration_in_seconds, success, self.interval)
@@ -35,7 +35,6 @@ the name for historical reasons.
 
 """
 
-import operator
 from datetime import datetime, timedelta
 
 from IPy import IP
@@ -46,6 +45,7 @@ from nav.mibs.ipv6_mib import Ipv6Mib
 from nav.mibs.cisco_ietf_ip_mib import CiscoIetfIpMib
 
 from nav.models import manage
+from nav.prefixindex import PrefixIndex
 from nav.ipdevpoll import Plugin, db
 from nav.ipdevpoll import storage, shadows
 
@@ -54,7 +54,7 @@ INCOMPLETE_MAC = '00:00:00:00:00:00'
 
 class Arp(Plugin):
     """Collects ARP records for IPv4 devices and NDP cache for IPv6 devices."""
-    prefix_cache = [] # prefix cache, should be sorted by descending mask length
+    prefix_cache = PrefixIndex()  # longest-prefix-match index of prefix ids
     prefix_cache_update_time = datetime.min
     prefix_cache_max_age = timedelta(minutes=5)
 
@@ -162,14 +162,11 @@ class Arp(Plugin):
 
     @classmethod
     def _update_prefix_cache_with_result(cls, prefixes):
+        changed, removed = cls.prefix_cache.update(
+            (IP(p['net_address']), p['id']) for p in prefixes)
         cls._logger.debug(
-            "Populating prefix cache with %d prefixes", len(prefixes))
-
-        prefixes = [(IP(p['net_address']), p['id']) for p in prefixes]
-        prefixes.sort(key=operator.itemgetter(1), reverse=True)
-
-        del cls.prefix_cache[:]
-        cls.prefix_cache.extend(prefixes)
+            "Updated prefix cache with %d prefixes (%d added/changed, "
+            "%d removed)", len(prefixes), changed, removed)
 
     def _make_new_mappings(self, mappings):
         """Convert a sequence of (ip, mac) tuples into a Arp shadow containers.
@@ -211,15 +208,13 @@ class Arp(Plugin):
             arp.end_time = timestamp
 
     def _find_largest_matching_prefix(self, ip):
-        """Find the largest prefix that ip is part of.
+        """Find the most specific (longest) prefix that ip is part of.
 
         Returns:
 
           An integer prefix ID, or None if no matches were found.
         """
-        for prefix_addr, prefix_id in self.prefix_cache:
-            if ip in prefix_addr:
-                return prefix_id
+        return self.prefix_cache.longest_match(ip)
 
 
 def ipv6_address_in_mappings(mappings):
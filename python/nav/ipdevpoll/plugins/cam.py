@@ -19,11 +19,10 @@ from collections import defaultdict
 
 from twisted.internet import defer
 
-from nav.models import manage
 from nav.util import splitby
 from nav.mibs.bridge_mib import MultiBridgeMib
 from nav.mibs.qbridge_mib import QBridgeMib
-from nav.ipdevpoll import Plugin, db
+from nav.ipdevpoll import Plugin, db, dataloader
 from nav.ipdevpoll import shadows
 from nav.ipdevpoll import utils
 from nav.ipdevpoll.neighbor import get_netbox_macs
@@ -55,13 +54,8 @@ class Cam(Plugin):
     @defer.inlineCallbacks
     def can_handle(cls, netbox):
         daddy_says_ok = super(Cam, cls).can_handle(netbox)
-        has_ifcs = yield db.run_in_thread(cls._has_interfaces, netbox)
-        defer.returnValue(has_ifcs and daddy_says_ok)
-
-    @classmethod
-    def _has_interfaces(cls, netbox):
-        return manage.Interface.objects.filter(
-            netbox__id=netbox.id).count() > 0
+        capabilities = yield dataloader.get_capabilities(netbox)
+        defer.returnValue(capabilities.interfaces > 0 and daddy_says_ok)
 
     @defer.inlineCallbacks
     def handle(self):
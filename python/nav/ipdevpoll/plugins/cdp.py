@@ -16,8 +16,7 @@
 "ipdevpoll plugin to collect CDP (Cisco Discovery Protocol) information"
 from twisted.internet import defer
 
-from nav.models import manage
-from nav.ipdevpoll import Plugin, shadows
+from nav.ipdevpoll import Plugin, shadows, dataloader
 from nav.mibs.cisco_cdp_mib import CiscoCDPMib
 from nav.ipdevpoll.neighbor import CDPNeighbor
 from nav.ipdevpoll.db import run_in_thread
@@ -43,13 +42,8 @@ class CDP(Plugin):
     @defer.inlineCallbacks
     def can_handle(cls, netbox):
         daddy_says_ok = super(CDP, cls).can_handle(netbox)
-        has_ifcs = yield run_in_thread(cls._has_interfaces, netbox)
-        defer.returnValue(has_ifcs and daddy_says_ok)
-
-    @classmethod
-    def _has_interfaces(cls, netbox):
-        return manage.Interface.objects.filter(
-            netbox__id=netbox.id).count() > 0
+        capabilities = yield dataloader.get_capabilities(netbox)
+        defer.returnValue(capabilities.interfaces > 0 and daddy_says_ok)
 
     @defer.inlineCallbacks
     def handle(self):
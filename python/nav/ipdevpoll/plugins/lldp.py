@@ -18,9 +18,8 @@ from pprint import pformat
 
 from twisted.internet import defer
 
-from nav.models import manage
 from nav.mibs.lldp_mib import LLDPMib
-from nav.ipdevpoll import Plugin, shadows
+from nav.ipdevpoll import Plugin, shadows, dataloader
 from nav.ipdevpoll.neighbor import LLDPNeighbor
 from nav.ipdevpoll.db import run_in_thread
 from nav.ipdevpoll.timestamps import TimestampChecker
@@ -45,13 +44,8 @@ class LLDP(Plugin):
     @defer.inlineCallbacks
     def can_handle(cls, netbox):
         daddy_says_ok = super(LLDP, cls).can_handle(netbox)
-        has_ifcs = yield run_in_thread(cls._has_interfaces, netbox)
-        defer.returnValue(has_ifcs and daddy_says_ok)
-
-    @classmethod
-    def _has_interfaces(cls, netbox):
-        return manage.Interface.objects.filter(
-            netbox__id=netbox.id).count() > 0
+        capabilities = yield dataloader.get_capabilities(netbox)
+        defer.returnValue(capabilities.interfaces > 0 and daddy_says_ok)
 
     @defer.inlineCallbacks
     def handle(self):
@@ -22,7 +22,8 @@ from twisted.internet import defer
 from nav.ipdevpoll import Plugin
 from nav.ipdevpoll import db
 from nav.metrics.carbon import send_metrics
-from nav.metrics.templates import metric_path_for_interface
+from nav.metrics.pathcache import (get_path_cache, encode_metric_name,
+                                   format_timestamp, format_line, INTERFACE)
 from nav.mibs import reduce_index
 from nav.mibs.if_mib import IfMib
 from nav.mibs.ip_mib import IpMib
@@ -66,6 +67,9 @@ IP_COUNTERS = (
 
 USED_COUNTERS = NON_HC_COUNTERS + HC_COUNTERS + OTHER_COUNTERS
 LOGGED_COUNTERS = USED_COUNTERS + IP_COUNTERS
+# Encoded metric names of the logged counters
+LOGGED_COUNTER_NAMES = tuple((key, encode_metric_name(key))
+                             for key in LOGGED_COUNTERS)
 
 
 class StatPorts(Plugin):
@@ -83,11 +87,15 @@ class StatPorts(Plugin):
         timestamp = time.time()
         stats = yield self._get_stats()
         netboxes = yield db.run_in_thread(self._get_netbox_list)
-        tuples = list(self._make_metrics(stats, netboxes=netboxes,
-                                         timestamp=timestamp))
-        if tuples:
+        start = time.time()
+        lines = list(self._make_metrics(stats, netboxes=netboxes,
+                                        timestamp=timestamp))
+        self._logger.debug("formatted %d counter values for %d interfaces "
+                           "in %.1f ms", len(lines), len(stats),
+                           (time.time() - start) * 1000)
+        if lines:
             self._logger.debug("Counters collected")
-            send_metrics(tuples)
+            send_metrics(lines)
 
     @defer.inlineCallbacks
     def _get_stats(self):
@@ -107,23 +115,31 @@ class StatPorts(Plugin):
         defer.returnValue(stats)
 
     def _make_metrics(self, stats, netboxes, timestamp=None):
-        timestamp = timestamp or time.time()
+        """Generates Carbon line protocol lines for all logged counters of
+        all interfaces in stats.
+
+        """
+        timestamp = format_timestamp(timestamp or time.time())
+        cache = get_path_cache()
         hc_counters = False
 
         for row in itervalues(stats):
             hc_counters = use_hc_counters(row) or hc_counters
-            for key in LOGGED_COUNTERS:
-                if key not in row:
-                    continue
-                value = row[key]
+            ifname = row['ifName'] or row['ifDescr']
+            # duplicate metrics for all involved netboxes
+            prefixes = [cache.get_interface_prefix(netbox, ifname)
+                        for netbox in netboxes]
+            for key, name in LOGGED_COUNTER_NAMES:
+                value = row.get(key)
                 if value is not None:
-                    for netbox in netboxes:
-                        # duplicate metrics for all involved netboxes
-                        path = metric_path_for_interface(
-                            netbox, row['ifName'] or row['ifDescr'], key)
-                        yield (path, (timestamp, value))
+                    for prefix in prefixes:
+                        yield format_line(prefix, name, value, timestamp)
 
         if stats:
+            ifnames = [row['ifName'] or row['ifDescr']
+                       for row in itervalues(stats)]
+            for netbox in netboxes:
+                cache.retain(netbox, INTERFACE, ifnames)
             if hc_counters:
                 self._logger.debug("High Capacity counters used")
             else:
@@ -22,9 +22,11 @@ from django.utils.six import iteritems
 
 from nav.ipdevpoll import Plugin
 from nav.ipdevpoll import db
+from nav.ipdevpoll import dataloader
 from nav.ipdevpoll.db import run_in_thread
 from nav.metrics.carbon import send_metrics
-from nav.metrics.templates import metric_path_for_sensor
+from nav.metrics.pathcache import (get_path_cache, format_timestamp,
+                                   format_line, SENSOR)
 from nav.models.manage import Sensor
 
 # Ask for no more than this number of values in a single SNMP GET operation
@@ -42,14 +44,10 @@ class StatSensors(Plugin):
         base_can_handle = yield defer.maybeDeferred(
             super(StatSensors, cls).can_handle, netbox)
         if base_can_handle:
-            i_can_handle = yield run_in_thread(cls._has_sensors, netbox)
-            defer.returnValue(i_can_handle)
+            capabilities = yield dataloader.get_capabilities(netbox)
+            defer.returnValue(capabilities.sensors > 0)
         defer.returnValue(base_can_handle)
 
-    @classmethod
-    def _has_sensors(cls, netbox):
-        return Sensor.objects.filter(netbox=netbox.id).count() > 0
-
     @defer.inlineCallbacks
     def handle(self):
         if self.netbox.master:
@@ -57,6 +55,9 @@ class StatSensors(Plugin):
         netboxes = yield db.run_in_thread(self._get_netbox_list)
         sensors = yield run_in_thread(self._get_sensors)
         self._logger.debug("retrieving data from %d sensors", len(sensors))
+        names = [sensor['internal_name'] for sensor in sensors.values()]
+        for netbox in netboxes:
+            get_path_cache().retain(netbox, SENSOR, names)
         oids = sensors.keys()
         requests = [oids[x:x+MAX_SENSORS_PER_REQUEST]
                     for x in range(0, len(oids), MAX_SENSORS_PER_REQUEST)]
@@ -71,15 +72,15 @@ class StatSensors(Plugin):
 
     def _response_to_metrics(self, result, sensors, netboxes):
         metrics = []
-        timestamp = time.time()
+        timestamp = format_timestamp(time.time())
+        cache = get_path_cache()
         data = ((sensors[oid], value) for oid, value in iteritems(result)
                 if oid in sensors)
         for sensor, value in data:
             value = convert_to_precision(value, sensor)
             for netbox in netboxes:
-                path = metric_path_for_sensor(netbox,
-                                              sensor['internal_name'])
-                metrics.append((path, (timestamp, value)))
+                path = cache.get_sensor_path(netbox, sensor['internal_name'])
+                metrics.append(format_line(path, b"", value, timestamp))
         send_metrics(metrics)
         return metrics
 
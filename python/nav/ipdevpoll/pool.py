@@ -17,9 +17,10 @@
 from __future__ import print_function
 import os
 import sys
+import time
 
 from twisted.protocols import amp
-from twisted.internet import reactor, protocol
+from twisted.internet import reactor, protocol, task
 from twisted.internet.defer import inlineCallbacks, returnValue
 from twisted.internet.endpoints import ProcessEndpoint, StandardIOEndpoint
 import twisted.internet.endpoints
@@ -27,6 +28,16 @@ import twisted.internet.endpoints
 from nav.ipdevpoll import ContextLogger
 from . import control, jobs
 
+# The runtime assumed for jobs that have no recorded history
+DEFAULT_RUNTIME = 10.0
+# The weight given to each newly observed runtime in a runtime estimate
+RUNTIME_SMOOTHING = 0.3
+# How often runtime history is reloaded from the job log
+RUNTIME_RELOAD_INTERVAL = 30 * 60
+# How much more expected work (in seconds) the worker that last ran a job for
+# a netbox may have than the least loaded worker, and still be preferred
+DEFAULT_AFFINITY_SLACK = 30.0
+
 
 def initialize_worker():
     handler = JobHandler()
@@ -115,6 +126,8 @@ class JobHandler(amp.CommandLocator):
     @Shutdown.responder
     def shutdown(self):
         self.done = True
+        if not self.jobs:
+            reactor.callLater(3, reactor.stop)
         return {}
 
     def log_jobs(self):
@@ -176,6 +189,65 @@ class InlinePool(object):
             self.active_jobs[deferred].cancel()
 
 
+class RuntimeEstimator(object):
+    """Keeps estimates of how long each job takes to run for each netbox.
+
+    Estimates are seeded from the ipdevpoll job log, and adjusted from the
+    runtimes observed by the worker pool.
+
+    """
+
+    _logger = ContextLogger()
+
+    def __init__(self, default=DEFAULT_RUNTIME):
+        self.default = default
+        self.runtimes = {}
+        self.job_runtimes = {}
+
+    def get(self, netbox, job):
+        """Returns the expected runtime of job for netbox, in seconds"""
+        runtime = self.runtimes.get((netbox, job))
+        if runtime is None:
+            runtime = self.job_runtimes.get(job, self.default)
+        return runtime
+
+    def update(self, netbox, job, runtime):
+        """Adjusts the estimate of job for netbox by an observed runtime"""
+        key = (netbox, job)
+        if key in self.runtimes:
+            runtime = (RUNTIME_SMOOTHING * runtime +
+                       (1 - RUNTIME_SMOOTHING) * self.runtimes[key])
+        self.runtimes[key] = runtime
+
+    def set_history(self, runtimes):
+        """Replaces all estimates with historic runtimes.
+
+        :param runtimes: A dict of {(netboxid, job_name): runtime}, as
+                         returned by dataloader.load_job_runtimes()
+
+        """
+        self.runtimes = dict(runtimes)
+        per_job = {}
+        for (_netbox, job), runtime in self.runtimes.items():
+            per_job.setdefault(job, []).append(runtime)
+        self.job_runtimes = dict((job, sum(values) / len(values))
+                                 for job, values in per_job.items())
+        self._logger.debug("loaded runtime history of %d jobs",
+                           len(self.runtimes))
+
+    def reload(self):
+        """Reloads historic runtimes from the job log in a thread"""
+        from nav.ipdevpoll import dataloader, db
+        deferred = db.run_in_thread(dataloader.load_job_runtimes)
+        deferred.addCallback(self.set_history)
+        deferred.addErrback(self._reload_failed)
+        return deferred
+
+    def _reload_failed(self, failure):
+        self._logger.warning("could not load job runtime history: %s",
+                             failure.getErrorMessage())
+
+
 class Worker(object):
     """This class holds information about one worker process as seen from
     the worker pool"""
@@ -189,6 +261,8 @@ class Worker(object):
         self.pool = pool
         self.threadpoolsize = threadpoolsize
         self.max_jobs = max_jobs
+        self.retired = False
+        self.running = {}
 
     @inlineCallbacks
     def start(self):
@@ -205,7 +279,38 @@ class Worker(object):
         returnValue(self)
 
     def done(self):
-        return self.max_jobs and (self.total_jobs >= self.max_jobs)
+        return self.retired or bool(
+            self.max_jobs and (self.total_jobs >= self.max_jobs))
+
+    @property
+    def load(self):
+        """The sum of the expected runtimes of the jobs currently running on
+        this worker.
+
+        """
+        return sum(self.running.values())
+
+    @property
+    def pid(self):
+        transport = getattr(self.process, 'transport', None)
+        return getattr(transport, 'pid', None)
+
+    def get_rss(self):
+        """Returns the resident set size of the worker process in bytes, or
+        None if it cannot be determined on this platform.
+
+        """
+        try:
+            with open('/proc/%d/statm' % self.pid) as statm:
+                pages = int(statm.read().split()[1])
+        except (TypeError, IOError, OSError, ValueError, IndexError):
+            return None
+        return pages * os.sysconf('SC_PAGE_SIZE')
+
+    def retire(self):
+        """Lets the worker finish its running jobs, and then exit"""
+        self.retired = True
+        return self.process.callRemote(Shutdown)
 
     def _worker_died(self, worker, reason):
         if not self.done():
@@ -223,8 +328,9 @@ class Worker(object):
                                .format(worker=worker))
         self.pool.worker_died(self)
 
-    def execute(self, serial, command, **kwargs):
+    def execute(self, serial, command, expected_runtime=0, **kwargs):
         self.active_jobs += 1
+        self.running[serial] = expected_runtime
         self.total_jobs += 1
         self.max_concurrent_jobs = max(self.active_jobs,
                                        self.max_concurrent_jobs)
@@ -243,19 +349,31 @@ class WorkerPool(object):
 
     _logger = ContextLogger()
 
-    def __init__(self, workers, max_jobs, threadpoolsize=None):
+    def __init__(self, workers, max_jobs, threadpoolsize=None, max_rss=None,
+                 affinity_slack=DEFAULT_AFFINITY_SLACK):
         twisted.internet.endpoints.log = HackLog
         self.workers = set()
         self.target_count = workers
         self.max_jobs = max_jobs
         self.threadpoolsize = threadpoolsize
+        self.max_rss = max_rss
+        self.affinity_slack = affinity_slack
+        self.runtimes = RuntimeEstimator()
+        self.affinity = dict()
         for i in range(self.target_count):
             self._spawn_worker()
         self.serial = 0
         self.jobs = dict()
+        if workers:
+            self._runtime_loop = task.LoopingCall(self.runtimes.reload)
+            reactor.callWhenRunning(self._runtime_loop.start,
+                                    RUNTIME_RELOAD_INTERVAL)
 
     def worker_died(self, worker):
-        self.workers.remove(worker)
+        self.workers.discard(worker)
+        for netbox, sticky in list(self.affinity.items()):
+            if sticky is worker:
+                del self.affinity[netbox]
         if not worker.done():
             self._spawn_worker()
 
@@ -265,21 +383,60 @@ class WorkerPool(object):
         self.workers.add(worker)
 
     def _cleanup(self, result, deferred):
-        serial, worker = self.jobs[deferred]
+        serial, worker, key, start_time = self.jobs[deferred]
         del self.jobs[deferred]
         worker.active_jobs -= 1
+        worker.running.pop(serial, None)
+        if key:
+            self.runtimes.update(key[0], key[1], time.time() - start_time)
+        self._check_rss(worker)
         return result
 
-    def _execute(self, command, **kwargs):
+    def _check_rss(self, worker):
+        if not self.max_rss or worker.done():
+            return
+        rss = worker.get_rss()
+        if rss and rss > self.max_rss:
+            self._logger.info("Retiring worker %s, its RSS of %d bytes "
+                              "exceeds %d bytes", worker.pid, rss,
+                              self.max_rss)
+            worker.retire()
+            self._spawn_worker()
+
+    def _select_worker(self, netbox):
+        """Selects the worker to run a job for netbox.
+
+        The worker with the least expected work is chosen, unless the worker
+        that last ran a job for the same netbox has no more than
+        affinity_slack seconds more work than it, in which case that worker
+        is chosen to keep its caches warm.
+
+        """
         ready_workers = [w for w in self.workers if not w.done()]
         if not ready_workers:
             raise RuntimeError("No ready workers")
-        worker = min(ready_workers, key=lambda x: x.active_jobs)
+        worker = min(ready_workers, key=lambda x: (x.load, x.active_jobs))
+        sticky = self.affinity.get(netbox)
+        if (sticky is not None and sticky is not worker and
+                not sticky.done() and sticky in self.workers and
+                sticky.load <= worker.load + self.affinity_slack):
+            worker = sticky
+        return worker
+
+    def _execute(self, command, **kwargs):
+        netbox = kwargs.get('netbox')
+        job = kwargs.get('job')
+        key = (netbox, job) if netbox is not None else None
+        expected_runtime = self.runtimes.get(netbox, job) if key else 0
+        worker = self._select_worker(netbox)
+        if netbox is not None:
+            self.affinity[netbox] = worker
         self.serial += 1
-        deferred = worker.execute(self.serial, command, **kwargs)
+        deferred = worker.execute(self.serial, command,
+                                  expected_runtime=expected_runtime, **kwargs)
         if worker.done():
             self._spawn_worker()
-        self.jobs[deferred] = (self.serial, worker)
+        self.jobs[deferred] = (self.serial, worker, key, time.time())
         deferred.addBoth(self._cleanup, deferred)
         return deferred
 
@@ -287,7 +444,7 @@ class WorkerPool(object):
         if deferred not in self.jobs:
             self._logger.debug("Cancelling job that isn't known")
             return
-        serial, worker = self.jobs[deferred]
+        serial, worker, _key, _start_time = self.jobs[deferred]
         return worker.cancel(serial)
 
     def execute_job(self, job, netbox, plugins=None, interval=None):
@@ -310,11 +467,14 @@ class WorkerPool(object):
             target=self.target_count))
         for worker in self.workers:
             self._logger.info(" - ready {ready} active {active}"
-                              " max {max} total {total}".format(
+                              " max {max} total {total}"
+                              " load {load:.1f}s rss {rss}".format(
                                   ready=not worker.done(),
                                   active=worker.active_jobs,
                                   max=worker.max_concurrent_jobs,
-                                  total=worker.total_jobs))
+                                  total=worker.total_jobs,
+                                  load=worker.load,
+                                  rss=worker.get_rss()))
 
 
 class HackLog(object):
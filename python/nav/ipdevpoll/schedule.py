@@ -17,7 +17,10 @@
 
 import logging
 import datetime
+import heapq
 import time
+import zlib
+from itertools import count
 from operator import itemgetter
 from collections import defaultdict
 from random import randint
@@ -33,18 +36,120 @@ from django.utils.six import iteritems
 from nav import ipdevpoll
 from nav.ipdevpoll import db
 from nav.ipdevpoll.snmp import SnmpError, AgentProxy
-from nav.metrics.carbon import send_metrics
 from nav.metrics.templates import metric_prefix_for_ipdevpoll_job
 from nav.tableformat import SimpleTableFormatter
 
 from nav.ipdevpoll.utils import log_unhandled_failure
 
-from . import shadows, config, signals
+from . import shadows, config, signals, joblog
 from .dataloader import NetboxLoader
 from .jobs import JobHandler, AbortedJobError, SuggestedReschedule
 
 _logger = logging.getLogger(__name__)
 
+# Jobs for netboxes that are overdue, or have never been polled, are spread
+# over at most this many seconds when their schedules start
+MAX_INITIAL_SPREAD = 5*60
+
+
+class TimerQueue(object):
+    """A heap of scheduled calls, served by a single reactor timer.
+
+    Rather than having each of the thousands of NetboxJobScheduler instances
+    keep its own reactor DelayedCall, their calls are kept in a single heap,
+    and a reactor DelayedCall is only armed for the earliest of them.
+
+    """
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        self._heap = []
+        self._sequence = count()
+        self._next_call = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def callLater(self, delay, func, *args, **kwargs):
+        """Schedules a call, like reactor.callLater()
+
+        :returns: A Timer object, which supports the same methods as an
+                  IDelayedCall.
+        """
+        timer = Timer(self, func, args, kwargs)
+        self._push(timer, self.clock.seconds() + delay)
+        return timer
+
+    def _push(self, timer, when):
+        timer.when = when
+        timer.generation += 1
+        heapq.heappush(self._heap,
+                       (when, next(self._sequence), timer.generation, timer))
+        self._arm()
+
+    def _is_stale(self, entry):
+        _when, _seq, generation, timer = entry
+        return not timer.pending or timer.generation != generation
+
+    def _arm(self):
+        while self._heap and self._is_stale(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return
+
+        delay = max(0, self._heap[0][0] - self.clock.seconds())
+        if self._next_call and self._next_call.active():
+            if self._next_call.getTime() <= self._heap[0][0]:
+                return
+            self._next_call.reset(delay)
+        else:
+            self._next_call = self.clock.callLater(delay, self._fire)
+
+    def _fire(self):
+        now = self.clock.seconds()
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_stale(entry):
+                continue
+            timer = entry[3]
+            timer.pending = False
+            try:
+                timer.func(*timer.args, **timer.kwargs)
+            except Exception:  # pylint: disable=W0703
+                _logger.exception("Unhandled error in scheduled call %r",
+                                  timer.func)
+        self._arm()
+
+
+class Timer(object):
+    """A call scheduled in a TimerQueue"""
+    def __init__(self, queue, func, args, kwargs):
+        self.queue = queue
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.when = None
+        self.generation = 0
+        self.pending = True
+
+    def getTime(self):
+        """Returns the time at which this call will run"""
+        return self.when
+
+    def active(self):
+        """Returns True if this call has neither run nor been cancelled"""
+        return self.pending
+
+    def cancel(self):
+        """Cancels this call"""
+        self.pending = False
+
+    def reset(self, delay):
+        """Reschedules this call to run delay seconds from now"""
+        self.queue._push(self, self.queue.clock.seconds() + delay)
+
+
+_timer_queue = TimerQueue()
+
 
 class NetboxJobScheduler(object):
     """Netbox job schedule handler.
@@ -70,11 +175,12 @@ class NetboxJobScheduler(object):
         self.cancelled = False
         self._deferred = Deferred()
         self._next_call = None
+        self._due_time = None
         self._last_job_started_at = 0
         self.running = False
         self._start_time = None
         self._current_job = None
-        self.callLater = reactor.callLater
+        self.callLater = _timer_queue.callLater
 
     def get_current_runtime(self):
         """Returns time elapsed since the start of the job as a timedelta."""
@@ -82,9 +188,68 @@ class NetboxJobScheduler(object):
 
     def start(self):
         """Start polling schedule."""
+        delay = self._get_initial_delay()
+        self._logger.debug("First %r job for %s will be in %.1f seconds",
+                           self.job.name, self.netbox.sysname, delay)
+        self._due_time = time.time() + delay
+        self._next_call = self.callLater(delay, self.run_job)
+        return self._deferred
+
+    def resume(self):
+        """Runs a job that was queued by an intensity limit as soon as
+        possible.
+
+        """
         self._next_call = self.callLater(0, self.run_job)
         return self._deferred
 
+    def _get_phase(self):
+        """Returns this netbox' fixed offset into the job interval.
+
+        The offset is derived from the job name and netbox id, so that runs
+        of the same job for different netboxes are spread evenly across the
+        interval, and stay that way across restarts.
+
+        """
+        key = "%s:%s" % (self.job.name, self.netbox.id)
+        checksum = zlib.crc32(key.encode('utf-8')) & 0xffffffff
+        return (checksum % (self.job.interval * 1000)) / 1000.0
+
+    def _get_next_slot(self, earliest):
+        """Returns the first time at or after earliest that is on this
+        netbox' phase of the job interval.
+
+        """
+        return earliest + (self._get_phase() - earliest) % self.job.interval
+
+    def _get_initial_delay(self):
+        """Returns the delay before the first job run.
+
+        Netboxes that were polled recently wait for their slot of the job
+        interval, while netboxes that are overdue or have never been polled
+        are spread over at most MAX_INITIAL_SPREAD seconds.
+
+        """
+        now = time.time()
+        interval = self.job.interval
+        last_run = self._get_last_run_time()
+        if last_run is not None and last_run + interval > now:
+            earliest = max(now, last_run + interval / 2.0)
+            return self._get_next_slot(earliest) - now
+
+        spread = min(interval, MAX_INITIAL_SPREAD)
+        return self._get_phase() / interval * spread
+
+    def _get_last_run_time(self):
+        """Returns the time of the last successful job run as a Unix
+        timestamp, or None if unknown.
+
+        """
+        last_updated = getattr(self.netbox, 'last_updated', None) or {}
+        last_run = last_updated.get(self.job.name)
+        if isinstance(last_run, datetime.datetime):
+            return time.mktime(last_run.timetuple())
+
     def cancel(self):
         """Cancel scheduling of this job for this box.
 
@@ -147,6 +312,7 @@ class NetboxJobScheduler(object):
 
         self.count_job()
         self._last_job_started_at = time.time()
+        self._log_lag()
 
         deferred.addErrback(self._adjust_intensity_on_snmperror)
         deferred.addCallbacks(self._reschedule_on_success,
@@ -171,6 +337,21 @@ class NetboxJobScheduler(object):
                 cls.global_intensity = new_limit
         return failure
 
+    def _log_lag(self):
+        """Sends the time between the scheduled and the actual start of the
+        current job run to Graphite.
+
+        """
+        if self._due_time is None:
+            return
+        lag = max(0, self._last_job_started_at - self._due_time)
+        self._logger.debug("%r job for %s started %.1f seconds late",
+                           self.job.name, self.netbox.sysname, lag)
+        prefix = metric_prefix_for_ipdevpoll_job(self.netbox.sysname,
+                                                 self.job.name)
+        joblog.get_job_log_writer().add_metrics(
+            [(prefix + ".schedule-lag", (self._last_job_started_at, lag))])
+
     def _update_counters(self, success):
         prefix = metric_prefix_for_ipdevpoll_job(self.netbox.sysname,
                                                  self.job.name)
@@ -180,9 +361,16 @@ class NetboxJobScheduler(object):
         _COUNTERS.start()
 
     def _reschedule_on_success(self, result):
-        """Reschedules the next normal run of this job."""
-        delay = max(0, self.job.interval - self.get_runtime())
-        self.reschedule(delay)
+        """Reschedules the next normal run of this job.
+
+        The next run is placed on this netbox' slot of the job interval, at
+        least half an interval after the start of the last run, so that runs
+        that were delayed return to their slot.
+
+        """
+        next_slot = self._get_next_slot(
+            self._last_job_started_at + self.job.interval / 2.0)
+        self.reschedule(max(0, next_slot - time.time()))
         if result:
             self._log_finished_job(True)
         else:
@@ -234,6 +422,7 @@ class NetboxJobScheduler(object):
             return
 
         next_time = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        self._due_time = time.time() + delay
 
         self._logger.debug("Next %r job for %s will be in %d seconds (%s)",
                            self.job.name, self.netbox.sysname, delay, next_time)
@@ -298,7 +487,7 @@ class NetboxJobScheduler(object):
         queue = self.get_job_queue()
         if queue and not self.is_job_limit_reached():
             handler = queue.pop(0)
-            return handler.start()
+            return handler.resume()
 
     @classmethod
     def unqueue_next_global_job(cls):
@@ -307,7 +496,7 @@ class NetboxJobScheduler(object):
             for index, handler in enumerate(cls.global_job_queue):
                 if not handler.is_job_limit_reached():
                     del cls.global_job_queue[index]
-                    return handler.start()
+                    return handler.resume()
 
     def get_job_queue(self):
         if self.job.name not in self.job_queues:
@@ -481,7 +670,8 @@ class CounterFlusher(defaultdict):
 
     def flush(self):
         """
-        Flushes all the counters to the Carbon backend and resets them to zero
+        Queues all the counters for sending to the Carbon backend and resets
+        them to zero
         """
         if not self:
             _logger.debug("no counters to flush yet")
@@ -493,6 +683,6 @@ class CounterFlusher(defaultdict):
             metrics.append((counter, (timestamp, count)))
             self[counter] = 0
 
-        send_metrics(metrics)
+        joblog.get_job_log_writer().add_metrics(metrics)
 
 _COUNTERS = CounterFlusher()
@@ -49,9 +49,11 @@ from collections import namedtuple
 
 from nav.models import manage
 from nav.models.fields import INFINITY
+import django.db
 from django.db.models import Q
 from django.db import transaction
-from nav.ipdevpoll.storage import DefaultManager
+from nav.ipdevpoll.storage import (DefaultManager, BULK_BATCH_SIZE,
+                                   bulk_insert)
 from .netbox import Netbox
 from .interface import Interface
 
@@ -63,6 +65,15 @@ Cam.sentinel = Cam(None, None)
 
 CamDetails = namedtuple('CamDetails', 'id end_time miss_count')
 
+# Closes a set of missing cam records, as described in the module docstring.
+# misscnt becomes NULL when it reaches MAX_MISS_COUNT or is already NULL.
+CLOSE_MISSING_SQL = """
+UPDATE cam
+SET end_time = CASE WHEN end_time >= 'infinity' THEN %s ELSE end_time END,
+    misscnt = CASE WHEN misscnt + 1 < %s THEN misscnt + 1 END
+WHERE camid = ANY(%s)
+"""
+
 
 class CamManager(DefaultManager):
     """Manages Cam records"""
@@ -123,12 +134,21 @@ class CamManager(DefaultManager):
         record = manage.Cam(
             netbox_id=self.netbox.id, sysname=self.netbox.sysname,
             start_time=datetime.datetime.now(), end_time=INFINITY)
+        meta = manage.Cam._meta
+        fields = [field for field in meta.concrete_fields
+                  if not field.primary_key]
+        connection = django.db.connection
+        rows = []
         for cam in self._new:
-            record.id = None
             record.port = self._get_port_for(cam.ifindex)
             record.ifindex = cam.ifindex
             record.mac = cam.mac
-            record.save()
+            rows.append([
+                field.get_db_prep_save(field.pre_save(record, True),
+                                       connection)
+                for field in fields])
+        for start in range(0, len(rows), BULK_BATCH_SIZE):
+            bulk_insert(meta, fields, rows[start:start + BULK_BATCH_SIZE])
 
         # reclaim recently closed records
         keepers = (self._previously_open[cam] for cam in self._keepers)
@@ -161,23 +181,17 @@ class CamManager(DefaultManager):
         return self._ifnames.get(ifindex, '')
 
     def cleanup(self):
-        for cam_detail in self._missing:
-            self._close_missing(cam_detail)
+        self._close_missing(self._missing)
 
     @classmethod
-    def _close_missing(cls, cam_detail):
-        upd = {}
-        cls._logger.debug("closing %r", cam_detail)
-        if cam_detail.end_time >= INFINITY:
-            upd['end_time'] = datetime.datetime.now()
-
-        if cam_detail.miss_count >= 0:
-            miss_count = cam_detail.miss_count + 1
-            upd['miss_count'] = (miss_count if miss_count < MAX_MISS_COUNT
-                                 else None)
-
-        if upd:
-            manage.Cam.objects.filter(id=cam_detail.id).update(**upd)
+    def _close_missing(cls, cam_details):
+        ids = sorted(cam_detail.id for cam_detail in cam_details)
+        if not ids:
+            return
+        cls._logger.debug("closing %d missing records: %r", len(ids), ids)
+        cursor = django.db.connection.cursor()
+        cursor.execute(CLOSE_MISSING_SQL,
+                       [datetime.datetime.now(), MAX_MISS_COUNT, ids])
 
     @classmethod
     def add_sentinel(cls, containers):
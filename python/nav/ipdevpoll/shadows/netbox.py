@@ -30,9 +30,16 @@ class Netbox(Shadow):
         super(Netbox, self).__init__(*args, **kwargs)
         if args:
             obj = args[0]
-            self.snmp_up = getattr(obj, 'snmp_up', not obj.is_snmp_down())
-            self.last_updated = getattr(obj, 'last_updated',
-                                        self._translate_last_jobs(obj))
+            snmp_up = getattr(obj, 'snmp_up', None)
+            if snmp_up is None:
+                snmp_up = not obj.is_snmp_down()
+            self.snmp_up = snmp_up
+            # the model's last_updated is a method, unless a dict of times
+            # was attached by the dataloader
+            last_updated = getattr(obj, 'last_updated', None)
+            if not isinstance(last_updated, dict):
+                last_updated = self._translate_last_jobs(obj)
+            self.last_updated = last_updated
 
     @staticmethod
     def _translate_last_jobs(netbox):
@@ -23,6 +23,8 @@ from twisted.internet import reactor
 from twisted.internet.defer import succeed
 from twisted.internet.task import deferLater
 
+from .tablecache import get_table_cache
+
 _logger = logging.getLogger(__name__)
 
 
@@ -48,13 +50,50 @@ def _cache_result(result, cache, key):
     return result
 
 
+def cache_across_jobs(func):
+    """Decorator for AgentProxyMixIn.getTable to share responses between
+    agent proxies for the same device, as configured by the table cache.
+
+    """
+    def _wrapper(*args, **kwargs):
+        self, oids = args[0], args[1]
+        cache = get_table_cache()
+        max_age = cache.get_max_age(oids) if cache is not None else 0
+        if not max_age:
+            return func(*args, **kwargs)
+
+        key = (self.ip, self.port, self.community, self.snmpVersion,
+               tuple(str(oid) for oid in oids))
+        result = cache.get(key, max_age)
+        if result is not None:
+            self.request_stats.cache_hits += 1
+            return succeed(result)
+
+        self.request_stats.cache_misses += 1
+        df = func(*args, **kwargs)
+        if df:
+            df.addCallback(_put_result, cache, key)
+        return df
+
+    return wraps(func)(_wrapper)
+
+
+def _put_result(result, cache, key):
+    cache.put(key, result)
+    return result
+
+
 def throttled(func):
     """Decorator for AgentProxyMixIn.getTable to throttle requests"""
     def _wrapper(*args, **kwargs):
         self = args[0]
+        # requests may be issued concurrently, so each request is scheduled
+        # at least throttle_delay seconds after the previously scheduled one
+        now = time.time()
         last_request = getattr(self, '_last_request')
-        delay = (last_request + self.throttle_delay) - time.time()
-        setattr(self, '_last_request', time.time())
+        send_time = max(now, last_request + self.throttle_delay)
+        setattr(self, '_last_request', send_time)
+        delay = send_time - now
 
         if delay > 0:
             _logger.debug("%sss delay due to throttling: %r", delay, self)
@@ -65,6 +104,52 @@ def throttled(func):
     return wraps(func)(_wrapper)
 
 
+def counted(func):
+    """Decorator for AgentProxyMixIn request methods to count sent requests
+    and their round-trip times.
+
+    """
+    def _wrapper(*args, **kwargs):
+        self = args[0]
+        stats = self.request_stats
+        start = time.time()
+
+        def _count(result):
+            stats.add(time.time() - start)
+            return result
+
+        df = func(*args, **kwargs)
+        if df:
+            df.addBoth(_count)
+        return df
+
+    return wraps(func)(_wrapper)
+
+
+class RequestStatistics(object):
+    """Counts SNMP request PDUs sent to an agent, the total time spent
+    waiting for their responses, and the table walks answered from or missed
+    by the shared table cache.
+
+    """
+    def __init__(self):
+        self.requests = 0
+        self.round_trip_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, round_trip_time):
+        """Counts a single request with the given round-trip time"""
+        self.requests += 1
+        self.round_trip_time += round_trip_time
+
+    def __repr__(self):
+        return ("<RequestStatistics requests=%d round_trip_time=%.3fs "
+                "cache_hits=%d cache_misses=%d>" % (
+                    self.requests, self.round_trip_time,
+                    self.cache_hits, self.cache_misses))
+
+
 # pylint: disable=R0903
 class AgentProxyMixIn(object):
     """Common AgentProxy mix-in class.
@@ -89,6 +174,7 @@ class AgentProxyMixIn(object):
             self.snmp_parameters = SNMP_DEFAULTS
         self._result_cache = {}
         self._last_request = 0
+        self.request_stats = RequestStatistics()
         self.throttle_delay = self.snmp_parameters.throttle_delay
 
         super(AgentProxyMixIn, self).__init__(*args, **kwargs)
@@ -107,6 +193,7 @@ class AgentProxyMixIn(object):
     # hey, we're mimicking someone else's API here, never mind the bollocks:
     # pylint: disable=C0111,C0103
     @cache_for_session
+    @cache_across_jobs
     def getTable(self, *args, **kwargs):
         kwargs['maxRepetitions'] = self.snmp_parameters.max_repetitions
         return super(AgentProxyMixIn, self).getTable(*args, **kwargs)
@@ -114,28 +201,33 @@ class AgentProxyMixIn(object):
     # hey, we're mimicking someone else's API here, never mind the bollocks:
     # pylint: disable=C0111,C0103
     @throttled
+    @counted
     def _get(self, *args, **kwargs):
         return super(AgentProxyMixIn, self)._get(*args, **kwargs)
 
     # hey, we're mimicking someone else's API here, never mind the bollocks:
     # pylint: disable=C0111,C0103
     @throttled
+    @counted
     def _walk(self, *args, **kwargs):
         return super(AgentProxyMixIn, self)._walk(*args, **kwargs)
 
     # hey, we're mimicking someone else's API here, never mind the bollocks:
     # pylint: disable=C0111,C0103
     @throttled
+    @counted
     def _getbulk(self, *args, **kwargs):
         return super(AgentProxyMixIn, self)._getbulk(*args, **kwargs)
 
 
 # pylint: disable=C0103
 SNMPParameters = namedtuple('SNMPParameters',
-                            'timeout max_repetitions throttle_delay')
+                            'timeout max_repetitions throttle_delay '
+                            'max_concurrent_columns columns_per_request')
 
 SNMP_DEFAULTS = SNMPParameters(timeout=1.5, max_repetitions=50,
-                               throttle_delay=0)
+                               throttle_delay=0, max_concurrent_columns=1,
+                               columns_per_request=1)
 
 
 # pylint: disable=W0212
@@ -155,6 +247,8 @@ def snmp_parameter_factory(host=None):
             ('max-repetitions', config.getint),
             ('timeout', config.getfloat),
             ('throttle-delay', config.getfloat),
+            ('max-concurrent-columns', config.getint),
+            ('columns-per-request', config.getint),
     ]:
         if config.has_option(section, var):
             key = var.replace('-', '_')
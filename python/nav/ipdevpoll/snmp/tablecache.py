@@ -0,0 +1,156 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.  You should have received a copy of the GNU General Public
+# License along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""A cache of SNMP table walks shared between ipdevpoll jobs.
+
+Several jobs will often walk the same tables of the same device within
+minutes of each other. Walks of slowly changing objects, such as interface
+names, may be answered from this cache instead, as configured in the
+[snmpcache] and [snmpcache:oids] sections of ipdevpoll.conf.
+
+Only objects explicitly listed in [snmpcache:oids] are ever cached, so that
+e.g. counter values are always retrieved fresh from the device.
+
+"""
+from collections import OrderedDict
+import logging
+import time
+
+from nav.oids import OID
+from nav.util import parse_interval
+
+_logger = logging.getLogger(__name__)
+
+SECTION = 'snmpcache'
+OID_SECTION = 'snmpcache:oids'
+DEFAULT_MAX_VALUES = 500000
+
+
+class TableCache(object):
+    """A cache of getTable() results, shared between agent proxies.
+
+    :param max_ages: A dict of {oid_prefix: max_age_in_seconds}. A walk of a
+                     set of OIDs is only cached if every OID is matched by a
+                     prefix, and for no longer than the smallest matching
+                     max_age.
+    :param max_values: The maximum number of values kept in the cache. The
+                       least recently used walks are discarded first when
+                       this limit is exceeded.
+
+    """
+    def __init__(self, max_ages, max_values=DEFAULT_MAX_VALUES):
+        self.max_ages = sorted(((OID(oid), age)
+                                for oid, age in max_ages.items()),
+                               key=lambda item: len(item[0]), reverse=True)
+        self.max_values = max_values
+        self._entries = OrderedDict()
+        self._value_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_max_age(self, oids):
+        """Returns the number of seconds a walk of oids may be cached, or 0
+        if it must not be cached at all.
+
+        """
+        ages = [self._get_oid_max_age(OID(oid)) for oid in oids]
+        return min(ages) if ages else 0
+
+    def _get_oid_max_age(self, oid):
+        for prefix, age in self.max_ages:
+            if prefix == oid or prefix.is_a_prefix_of(oid):
+                return age
+        return 0
+
+    def get(self, key, max_age):
+        """Returns the cached result for key, or None if there is no result
+        younger than max_age seconds.
+
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        timestamp, result, size = entry
+        if time.time() - timestamp > max_age:
+            self._value_count -= size
+            return None
+        self._entries[key] = entry
+        return result
+
+    def put(self, key, result):
+        """Caches a getTable() result under key"""
+        size = _count_values(result)
+        if size > self.max_values:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self._value_count -= old[2]
+        self._entries[key] = (time.time(), result, size)
+        self._value_count += size
+        while self._value_count > self.max_values:
+            _key, (_timestamp, _result, old_size) = self._entries.popitem(
+                last=False)
+            self._value_count -= old_size
+
+
+def _count_values(result):
+    return sum(len(values) if hasattr(values, '__len__') else 1
+               for values in result.values())
+
+
+_table_cache = None
+
+
+def get_table_cache():
+    """Returns the process-wide table cache, or None if table caching is not
+    enabled in ipdevpoll.conf.
+
+    """
+    global _table_cache  # pylint: disable=W0603
+    if _table_cache is None:
+        _table_cache = make_table_cache_from_config()
+    return _table_cache if _table_cache is not False else None
+
+
+def make_table_cache_from_config(config=None):
+    """Creates a TableCache from the [snmpcache] configuration.
+
+    :returns: A TableCache instance, or False if table caching is disabled.
+              An empty TableCache is also false in a boolean context, so
+              compare explicitly.
+
+    """
+    if config is None:
+        from nav.ipdevpoll.config import ipdevpoll_conf as config
+
+    if not (config.has_section(SECTION) and
+            config.getboolean(SECTION, 'enabled')):
+        return False
+
+    max_values = DEFAULT_MAX_VALUES
+    if config.has_option(SECTION, 'max-values'):
+        max_values = config.getint(SECTION, 'max-values')
+
+    max_ages = {}
+    if config.has_section(OID_SECTION):
+        for oid in config.options(OID_SECTION):
+            # zero entries are kept, as they disable caching of objects
+            # below a cached prefix
+            max_ages[oid] = parse_interval(config.get(OID_SECTION, oid))
+
+    _logger.debug("SNMP table cache enabled for %d OIDs, max %d values",
+                  len(max_ages), max_values)
+    return TableCache(max_ages, max_values)
@@ -14,13 +14,21 @@
 # License along with NAV. If not, see <http://www.gnu.org/licenses/>.
 #
 """Storage layer for ipdevpoll"""
+from collections import defaultdict
+from itertools import islice
 
+import django.db
 import django.db.models
 from django.db import transaction
+from django.db.models import Q
 from django.utils import six
 
 from nav import toposort
 from nav import ipdevpoll
+from nav.ipdevpoll.config import ipdevpoll_conf
+
+# Maximum number of rows to write in a single multi-row statement
+BULK_BATCH_SIZE = 500
 
 
 class MetaShadow(type):
@@ -76,6 +84,8 @@ class DefaultManager(object):
         """
         self.cls = cls
         self.containers = containers
+        self.bulk = is_bulk_save_enabled() and cls.supports_bulk_save()
+        self.counts = dict(inserted=0, updated=0, deleted=0, unchanged=0)
 
     def prepare(self):
         """Prepares managed shadows in containers"""
@@ -83,8 +93,107 @@ class DefaultManager(object):
 
     def save(self):
         """Saves managed shadows in containers"""
-        for obj in self.get_managed():
-            obj.save(self.containers)
+        if self.bulk:
+            self.bulk_save()
+        else:
+            for obj in self.get_managed():
+                obj.save(self.containers)
+
+    @transaction.atomic()
+    def bulk_save(self):
+        """Saves all managed shadows in containers using set-based
+        statements.
+
+        Existing rows are resolved by one query per lookup, after which new
+        rows are written using multi-row INSERT statements and changed rows
+        using UPDATE ... FROM (VALUES ...) statements.
+
+        """
+        managed = list(self.get_managed())
+        if not managed:
+            return
+        self.cls.resolve_existing_models(managed, self.containers)
+
+        inserts, updates, deletes = [], [], []
+        for obj in managed:
+            existing = obj.get_existing_model(self.containers)
+            if obj.delete and existing:
+                deletes.append(existing.pk)
+            elif existing:
+                diff = obj.get_diff_attrs(existing)
+                if diff:
+                    updates.append((obj, diff))
+                else:
+                    self.counts['unchanged'] += 1
+            else:
+                inserts.append(obj)
+
+        if deletes:
+            self.cls.__shadowclass__.objects.filter(pk__in=deletes).delete()
+            self.counts['deleted'] = len(deletes)
+        self.counts['updated'] = self._bulk_update(updates)
+        self.counts['inserted'] = self._bulk_insert(inserts)
+        self._log_counts()
+
+    def _bulk_update(self, updates):
+        """Updates changed rows, grouped by the set of changed columns"""
+        meta = self.cls._meta
+        by_columns = defaultdict(list)
+        for obj, diff in updates:
+            model = obj.convert_to_model(self.containers)
+            by_columns[tuple(sorted(diff))].append((obj, model))
+
+        for attrs, rows in by_columns.items():
+            fields = [meta.get_field(attr) for attr in attrs]
+            for batch in _chunks(rows, BULK_BATCH_SIZE):
+                values = [[model.pk] + [_get_db_value(field, model)
+                                        for field in fields]
+                          for _obj, model in batch]
+                bulk_update(meta, fields, values)
+                for obj, _model in batch:
+                    obj._touched.clear()
+        return len(updates)
+
+    def _bulk_insert(self, inserts):
+        """Inserts new rows, grouped by whether their primary keys are to be
+        allocated by the database.
+
+        """
+        meta = self.cls._meta
+        by_auto_pk = defaultdict(list)
+        for obj in inserts:
+            model = obj.convert_to_model(self.containers)
+            if model:
+                by_auto_pk[model.pk is None].append((obj, model))
+
+        count = 0
+        for auto_pk, rows in by_auto_pk.items():
+            fields = [field for field in meta.local_concrete_fields
+                      if not (auto_pk and field.primary_key)]
+            for batch in _chunks(rows, BULK_BATCH_SIZE):
+                values = [[_get_db_value(field, model, add=True)
+                           for field in fields]
+                          for _obj, model in batch]
+                pkeys = bulk_insert(meta, fields, values)
+                # Store the newly allocated primary keys in both the models
+                # and the shadows, so that shadows referring to these will
+                # know about them.
+                for (obj, model), pkey in zip(batch, pkeys):
+                    model.pk = pkey
+                    if not obj.get_primary_key():
+                        obj.set_primary_key(pkey)
+                    obj._cached_nonexistence = False
+                    obj._cached_existing_model = model
+                    obj._touched.clear()
+                count += len(batch)
+        return count
+
+    def _log_counts(self):
+        self._logger.debug("bulk saved %s: inserted=%d updated=%d deleted=%d "
+                           "unchanged=%d",
+                           self.cls.__name__, self.counts['inserted'],
+                           self.counts['updated'], self.counts['deleted'],
+                           self.counts['unchanged'])
 
     def cleanup(self):
         """Runs any necessary cleanup hooks after save is done"""
@@ -159,6 +268,7 @@ class Shadow(object):
         self.update_only = False
         self._cached_converted_model = None
         self._cached_existing_model = None
+        self._cached_nonexistence = False
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
@@ -334,6 +444,8 @@ class Shadow(object):
         if hasattr(self, '_cached_existing_model') and \
                 self._cached_existing_model:
             return self._cached_existing_model
+        if getattr(self, '_cached_nonexistence', False):
+            return None
         if containers is None:
             containers = {}
 
@@ -411,6 +523,135 @@ class Shadow(object):
         setattr(self, pkey.name, getattr(django_object, pkey.name))
         self._cached_existing_model = django_object
 
+    @classmethod
+    def supports_bulk_save(cls):
+        """Returns True if instances of this class can be written by the
+        set-based storage mode of DefaultManager.
+
+        Classes that override the per-instance save(), update(),
+        get_existing_model() or set_existing_model() methods must be saved one
+        by one to retain their custom logic.
+
+        """
+        return all(six.get_unbound_function(getattr(cls, name)) is
+                   six.get_unbound_function(getattr(Shadow, name))
+                   for name in ('save', 'update', 'get_existing_model',
+                                'set_existing_model'))
+
+    @classmethod
+    def resolve_existing_models(cls, shadows, containers=None):
+        """Resolves the existing Django model instances of a list of shadows
+        of this class, using one query per primary key or lookup set instead
+        of one query per shadow.
+
+        Shadows found to have no database counterpart are marked as such, so
+        that get_existing_model() will not look them up again.  Shadows whose
+        lookup values cannot be resolved in bulk (e.g. because they refer to
+        unsaved shadows) are left for get_existing_model() to look up on its
+        own.
+
+        """
+        unresolved = [obj for obj in shadows
+                      if not getattr(obj, '_cached_existing_model', None)
+                      and not getattr(obj, '_cached_nonexistence', False)]
+        unresolved = cls._resolve_by_primary_key(unresolved)
+        for lookup in cls.__lookups__:
+            if not unresolved:
+                break
+            unresolved = cls._resolve_by_lookup(lookup, unresolved)
+
+        for obj in unresolved:
+            obj._cached_nonexistence = True
+
+    @classmethod
+    def _resolve_by_primary_key(cls, shadows):
+        """Resolves shadows with a set primary key. Returns the shadows that
+        have no primary key set.
+
+        """
+        remaining = []
+        by_pkey = defaultdict(list)
+        for obj in shadows:
+            pkey = obj.get_primary_key()
+            if pkey is None:
+                remaining.append(obj)
+            elif not isinstance(pkey, (Shadow, django.db.models.Model)):
+                by_pkey[pkey].append(obj)
+
+        if not by_pkey:
+            return remaining
+
+        models = cls.__shadowclass__.objects.in_bulk(list(by_pkey))
+        pkey_type = cls._meta.pk.__class__
+        for pkey, objs in by_pkey.items():
+            model = models.get(pkey)
+            if model:
+                for obj in objs:
+                    obj.set_existing_model(model)
+            elif pkey_type == django.db.models.fields.AutoField:
+                raise cls.__shadowclass__.DoesNotExist(
+                    "%s matching pk=%r does not exist" %
+                    (cls.__shadowclass__.__name__, pkey))
+            else:
+                for obj in objs:
+                    obj._cached_nonexistence = True
+        return remaining
+
+    @classmethod
+    def _resolve_by_lookup(cls, lookup, shadows):
+        """Resolves shadows by a single entry from the __lookups__ list.
+        Returns the shadows that were not found using this lookup.
+
+        """
+        fields = lookup if isinstance(lookup, tuple) else (lookup,)
+        remaining = []
+        by_key = defaultdict(list)
+        for obj in shadows:
+            values = [getattr(obj, field) for field in fields]
+            if not isinstance(lookup, tuple) and values[0] is None:
+                remaining.append(obj)
+                continue
+            key = _get_bulk_lookup_key(values)
+            if key is not None:
+                by_key[key].append(obj)
+
+        attnames = [cls._meta.get_field(field).attname for field in fields]
+        found = defaultdict(list)
+        for keys in _chunks(list(by_key), BULK_BATCH_SIZE):
+            if len(fields) == 1:
+                filtr = Q(**{fields[0] + '__in': [key[0] for key in keys]})
+            else:
+                filtr = Q()
+                for key in keys:
+                    filtr |= Q(**dict(zip(fields, key)))
+            for model in cls.__shadowclass__.objects.filter(filtr):
+                key = tuple(getattr(model, attname) for attname in attnames)
+                found[key].append(model)
+
+        if any(key not in by_key for key in found):
+            # Some values did not compare equal to their database
+            # counterparts in Python; leave the lot to get_existing_model()
+            cls._logger.debug("cannot resolve %s by %r in bulk",
+                              cls.__name__, lookup)
+            return remaining
+
+        for key, objs in by_key.items():
+            models = found.get(key)
+            if not models:
+                remaining.extend(objs)
+            elif len(models) > 1:
+                cls._logger.error("Multiple %s objects returned while "
+                                  "looking up %r. Lookup args used: %r",
+                                  cls.__shadowclass__.__name__, objs,
+                                  dict(zip(fields, key)))
+                raise cls.__shadowclass__.MultipleObjectsReturned(
+                    "Multiple %s objects match %r" %
+                    (cls.__shadowclass__.__name__, dict(zip(fields, key))))
+            else:
+                for obj in objs:
+                    obj.set_existing_model(models[0])
+        return remaining
+
     @classmethod
     def prepare_for_save(cls, containers):
         """This method is run in a separate thread before saving containers,
@@ -626,3 +867,124 @@ def get_shadow_sort_order():
     graph = toposort.build_graph(shadow_classes, _get_dependencies)
     sorted_classes = toposort.topological_sort(graph)
     return sorted_classes
+
+
+def is_bulk_save_enabled():
+    """Returns True if ipdevpoll is configured to use set-based saving of
+    shadow containers.
+
+    """
+    return ipdevpoll_conf.getboolean('ipdevpoll', 'bulk_save')
+
+
+def _get_bulk_lookup_key(values):
+    """Converts a list of lookup values from a shadow into a tuple of values
+    comparable to the attributes of a Django model.
+
+    Returns None if any value is unsuitable for a bulk lookup, such as NULL
+    values or references to shadows without a primary key.
+
+    """
+    key = []
+    for value in values:
+        if isinstance(value, Shadow):
+            value = value.get_primary_key()
+        elif isinstance(value, django.db.models.Model):
+            value = value.pk
+        if value is None or isinstance(value, Shadow):
+            return None
+        key.append(value)
+    return tuple(key)
+
+
+def _get_db_value(field, model, add=False):
+    """Returns the database-ready value of field from a Django model"""
+    return field.get_db_prep_save(field.pre_save(model, add),
+                                  django.db.connection)
+
+
+def _chunks(items, size):
+    """Splits a list of items into lists of at most size elements"""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(meta, fields, rows):
+    """Inserts multiple rows into a model's table using a single statement.
+
+    :param meta: The _meta attribute of a Django model class.
+    :param fields: A list of the model fields to insert values for.
+    :param rows: A list of value lists, one value per field.
+    :returns: A list of the primary keys of the inserted rows, in the same
+              order as rows.
+
+    """
+    quote = django.db.connection.ops.quote_name
+    placeholders = "(%s)" % ", ".join(["%s"] * len(fields))
+    sql = "INSERT INTO %s (%s) VALUES %s RETURNING %s" % (
+        quote(meta.db_table),
+        ", ".join(quote(field.column) for field in fields),
+        ", ".join([placeholders] * len(rows)),
+        quote(meta.pk.column))
+    cursor = django.db.connection.cursor()
+    cursor.execute(sql, [value for row in rows for value in row])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def bulk_update(meta, fields, rows):
+    """Updates multiple rows of a model's table using a single
+    UPDATE ... FROM (VALUES ...) statement.
+
+    :param meta: The _meta attribute of a Django model class.
+    :param fields: A list of the model fields to update.
+    :param rows: A list of value lists. The first value of each list is the
+                 primary key of the row to update, the rest are the new values
+                 of fields.
+
+    """
+    quote = django.db.connection.ops.quote_name
+    types = get_column_types(meta.db_table)
+    pkey = meta.pk.column
+    columns = [pkey] + [field.column for field in fields]
+    placeholders = "(%s)" % ", ".join(["%s"] * len(columns))
+    assignments = ", ".join(
+        "{col} = v.{col}::{type}".format(col=quote(field.column),
+                                         type=types[field.column])
+        for field in fields)
+    sql = ("UPDATE {table} AS t SET {assignments} "
+           "FROM (VALUES {values}) AS v ({columns}) "
+           "WHERE t.{pkey} = v.{pkey}::{pkey_type}").format(
+               table=quote(meta.db_table),
+               assignments=assignments,
+               values=", ".join([placeholders] * len(rows)),
+               columns=", ".join(quote(col) for col in columns),
+               pkey=quote(pkey),
+               pkey_type=types[pkey])
+    cursor = django.db.connection.cursor()
+    cursor.execute(sql, [value for row in rows for value in row])
+
+
+_column_types = {}
+
+
+def get_column_types(table):
+    """Returns a dict of the SQL data types of a table's columns.
+
+    Values in a VALUES list have no type information of their own, so these
+    are needed to cast them to the actual column types, which may differ from
+    what the Django fields report (e.g. for inet/cidr columns).
+
+    """
+    if table not in _column_types:
+        cursor = django.db.connection.cursor()
+        cursor.execute(
+            """SELECT attname, format_type(atttypid, atttypmod)
+               FROM pg_attribute
+               WHERE attrelid = %s::regclass AND attnum > 0
+                 AND NOT attisdropped""", [table])
+        _column_types[table] = dict(cursor.fetchall())
+    return _column_types[table]
@@ -22,10 +22,15 @@ Syslog messages will be read from the configured file, parsed and
 inserted into structured NAV database tables.  Messages that cannot be
 parsed as Cisco syslog messages are ignored.
 
-The syslog file is truncated upon the exit of this program.  If you
-wish to keep a copy of the syslog messages on file, you should
-configure your syslog daemon to log the messages to two separate
-files, one of which this program will have exclusive access to.
+The contents of the syslog file are moved to a spool file, and the syslog
+file is truncated, when this program starts.  If you wish to keep a copy
+of the syslog messages on file, you should configure your syslog daemon
+to log the messages to two separate files, one of which this program will
+have exclusive access to.
+
+The spool file is only removed once all its messages have been committed
+to the database.  If this program crashes, the spool file is processed
+again on the next run.
 
 """
 
@@ -34,11 +39,6 @@ files, one of which this program will have exclusive access to.
 ## to make it more maintainable.  Feel free to refactor it further,
 ## where it makes sense.
 
-## BUGS: This program has one glaring problem: All the log lines are
-## read into memory, and the logfile is subsequently truncated.  If
-## the program crashes before the lines are inserted into the
-## database, all the read log lines are lost.
-
 ## TODO: Possible future enhancement is the ability to tail a log file
 ## continually, instead of reading and truncating as a cron job.
 
@@ -52,8 +52,11 @@ import os.path
 import errno
 import atexit
 import logging
+import shutil
+from collections import OrderedDict
 from configparser import ConfigParser
 import datetime
+from itertools import islice
 import optparse
 
 from django.utils import six
@@ -135,6 +138,16 @@ _not_so_typical_match_re = re.compile(
 
 _type_match_re = re.compile(r"\w+-\d+-?\S*:")
 
+# The suffix added to the syslog file name to form the spool file name
+SPOOL_SUFFIX = '.spool'
+# The number of log lines that are parsed and inserted at a time
+BATCH_SIZE = 1000
+
+
+def looks_like_cisco_message(line):
+    """Returns True if line shows signs of being a Cisco syslog message"""
+    return bool(_type_match_re.search(line))
+
 
 def create_message(line, database=None):
 
@@ -164,8 +177,7 @@ def create_message(line, database=None):
                           exc_info=True)
 
     # if this message shows sign of cisco format, put it in the error log
-    typematch = _type_match_re.search(line)
-    if typematch and database:
+    if looks_like_cisco_message(line) and database:
         database.execute("INSERT INTO errorerror (message) "
                          "VALUES (%s)", (line,))
 
@@ -289,24 +301,25 @@ def get_types(cursor):
     return types
 
 
-def read_log_lines(config):
-    """Read and yield message lines from the watched cisco log file.
+def spool_log_file(config):
+    """Moves the contents of the watched cisco log file to a spool file.
 
-    Once the log file has been read, it is truncated. The watched file
-    is configured using the syslog option in the paths section of
+    The log file is only locked while its contents are being copied to the
+    spool file, after which it is truncated. If a spool file has been left
+    behind by a previous run, the contents are appended to it. The watched
+    file is configured using the syslog option in the paths section of
     logger.conf.
 
+    :returns: The name of the spool file, or None if there is no spool file.
+
     """
     filename = config.get("paths", "syslog")
-    if config.has_option("paths", "charset"):
-        charset = config.get("paths", "charset")
-    else:
-        charset = "ISO-8859-1"
+    spoolname = filename + SPOOL_SUFFIX
 
     logfile = None
     ## open log
     try:
-        logfile = open(filename, "r+")
+        logfile = open(filename, "rb+")
     except IOError as err:
         # If logfile can't be found, we ignore it.  We won't needlessly
         # spam the NAV admin every minute with a file not found error!
@@ -315,27 +328,38 @@ def read_log_lines(config):
 
     ## if the file exists
     if logfile:
+        with logfile:
+            ## lock logfile
+            fcntl.flock(logfile, fcntl.LOCK_EX)
+            try:
+                ## move the contents to the spool file, then truncate
+                with open(spoolname, "ab") as spool:
+                    shutil.copyfileobj(logfile, spool)
+                logfile.truncate(0)
+            finally:
+                ## unlock logfile
+                fcntl.flock(logfile, fcntl.LOCK_UN)
+
+    if os.path.exists(spoolname):
+        return spoolname
+
+
+def read_log_lines(filename, charset="ISO-8859-1"):
+    """Reads and yields message lines from a spooled cisco log file, one line
+    at a time.
 
-        ## lock logfile
-        fcntl.flock(logfile, fcntl.LOCK_EX)
-
-        ## read log
-        fcon = logfile.readlines()
-
-        ## truncate logfile
-        logfile.truncate(0)
+    """
+    with open(filename, "rb") as logfile:
+        for line in logfile:
+            yield line.decode(charset, 'replace')
 
-        ## unlock logfile
-        fcntl.flock(logfile, fcntl.LOCK_UN)
-        ##close log
-        logfile.close()
 
-        for line in fcon:
-            # Make sure the data is encoded as UTF-8 before we begin work on it
-            line = line.decode(charset).encode("UTF-8")
-            yield line
+def get_charset(config):
+    """Returns the configured charset of the watched cisco log file"""
+    if config.has_option("paths", "charset"):
+        return config.get("paths", "charset")
     else:
-        raise StopIteration
+        return "ISO-8859-1"
 
 
 # pylint: disable=W0703
@@ -362,6 +386,51 @@ def parse_and_insert(line, database,
             raise
 
 
+def parse_and_insert_batch(lines, database,
+                           categories, origins, types,
+                           exceptionorigin, exceptiontype,
+                           exceptiontypeorigin):
+    """Parse a batch of cisco log lines and insert them into db.
+
+    New categories, origins and types referenced by the batch are added
+    using one query for each, and the messages are inserted using a single
+    multi-row INSERT.
+
+    """
+    messages = []
+    errors = []
+    for line in lines:
+        try:
+            message = create_message(line)
+        except Exception:
+            _logger.exception("Unhandled exception during message parse: %s",
+                              line)
+            continue
+        if message:
+            messages.append(message)
+        elif looks_like_cisco_message(line):
+            errors.append((line,))
+
+    if errors:
+        insert_rows(database, "errorerror", ("message",), errors)
+    if not messages:
+        return
+
+    add_missing_origins(messages, categories, origins, database)
+    add_missing_types(messages, types, database)
+
+    rows = []
+    for message in messages:
+        set_priority_exception(message, exceptionorigin, exceptiontype,
+                               exceptiontypeorigin)
+        rows.append((str(message.time), origins[message.origin],
+                     message.priorityid,
+                     types[message.facility][message.mnemonic],
+                     message.description))
+    insert_rows(database, "log_message",
+                ("time", "origin", "newpriority", "type", "message"), rows)
+
+
 def insert_message(message, database,
                    categories, origins, types,
                    exceptionorigin, exceptiontype, exceptiontypeorigin):
@@ -379,6 +448,21 @@ def insert_message(message, database,
                  database)
     typeid = types[message.facility][message.mnemonic]
 
+    set_priority_exception(message, exceptionorigin, exceptiontype,
+                           exceptiontypeorigin)
+
+    ## insert message into database
+    database.execute("INSERT INTO log_message (time, origin, "
+                     "newpriority, type, message) "
+                     "VALUES (%s, %s, %s, %s, %s)",
+                     (str(message.time), originid,
+                      message.priorityid, typeid,
+                      message.description))
+
+
+def set_priority_exception(message, exceptionorigin, exceptiontype,
+                           exceptiontypeorigin):
+    """Overrides the priority of message if any priority exceptions apply"""
     ## overload priority if exceptions are set
     m_type = message.type.lower()
     origin = message.origin.lower()
@@ -401,13 +485,71 @@ def insert_message(message, database,
         except ValueError:
             pass
 
-    ## insert message into database
-    database.execute("INSERT INTO log_message (time, origin, "
-                     "newpriority, type, message) "
-                     "VALUES (%s, %s, %s, %s, %s)",
-                     (str(message.time), originid,
-                      message.priorityid, typeid,
-                      message.description))
+
+def add_missing_origins(messages, categories, origins, database):
+    """Adds all origins referenced by messages, but not present in origins,
+    along with any missing categories.
+
+    """
+    missing = OrderedDict()
+    for message in messages:
+        if message.origin not in origins:
+            missing.setdefault(message.origin, message.category)
+    if not missing:
+        return
+
+    new_categories = [(category,) for category in OrderedDict.fromkeys(
+        missing.values()) if category not in categories]
+    if new_categories:
+        insert_rows(database, "category", ("category",), new_categories)
+        for category, in new_categories:
+            categories[category] = category
+
+    rows = insert_rows(database, "origin", ("name", "category"),
+                       list(missing.items()), returning="origin, name")
+    for originid, name in rows:
+        origins[name] = int(originid)
+
+
+def add_missing_types(messages, types, database):
+    """Adds all message types referenced by messages, but not present in
+    types.
+
+    """
+    missing = OrderedDict()
+    for message in messages:
+        if (message.facility not in types or
+                message.mnemonic not in types[message.facility]):
+            missing.setdefault((message.facility, message.mnemonic),
+                               message.priorityid)
+    if not missing:
+        return
+
+    rows = insert_rows(database, "log_message_type",
+                       ("facility", "mnemonic", "priority"),
+                       [key + (priority,) for key, priority in missing.items()],
+                       returning="type, facility, mnemonic")
+    for typeid, facility, mnemonic in rows:
+        types.setdefault(facility, {})[mnemonic] = int(typeid)
+
+
+def insert_rows(database, table, columns, rows, returning=None):
+    """Inserts multiple rows into table using a single statement.
+
+    :param rows: A list of value tuples, one value per column.
+    :param returning: An optional list of columns to return from the
+                      inserted rows.
+    :returns: The list of returned rows, if returning was given.
+
+    """
+    placeholders = "(%s)" % ", ".join(["%s"] * len(columns))
+    sql = "INSERT INTO %s (%s) VALUES %s" % (
+        table, ", ".join(columns), ", ".join([placeholders] * len(rows)))
+    if returning:
+        sql += " RETURNING " + returning
+    database.execute(sql, [value for row in rows for value in row])
+    if returning:
+        return database.fetchall()
 
 
 def add_category(category, categories, database):
@@ -459,16 +601,76 @@ def logengine(config, options):
      exceptiontypeorigin) = get_exception_dicts(config)
 
     ## add new records
+    spoolname = spool_log_file(config)
+    if not spoolname:
+        return
     _logger.info("Reading new log entries")
-    my_parse_and_insert = swallow_all_but_db_exceptions(parse_and_insert)
-    for line in read_log_lines(config):
-        my_parse_and_insert(line, database,
-                            categories, origins, types,
-                            exceptionorigin, exceptiontype,
-                            exceptiontypeorigin)
+    lines = read_log_lines(spoolname, get_charset(config))
+    for batch in iter(lambda: list(islice(lines, BATCH_SIZE)), []):
+        insert_batch(batch, database,
+                     categories, origins, types,
+                     exceptionorigin, exceptiontype, exceptiontypeorigin)
 
     # Make sure it all sticks
     connection.commit()
+    os.remove(spoolname)
+
+
+def insert_batch(lines, database,
+                 categories, origins, types,
+                 exceptionorigin, exceptiontype, exceptiontypeorigin):
+    """Parse and insert a batch of cisco log lines into db.
+
+    If the batch cannot be inserted, it is rolled back and inserted one line
+    at a time instead, skipping only the lines that cannot be inserted. This
+    ensures a few bad lines cannot prevent the spool file from ever being
+    processed.
+
+    """
+    database.execute("SAVEPOINT logengine_batch")
+    try:
+        parse_and_insert_batch(lines, database,
+                               categories, origins, types,
+                               exceptionorigin, exceptiontype,
+                               exceptiontypeorigin)
+    except Exception:  # pylint: disable=W0703
+        _logger.warning("Batch insert failed, retrying one line at a time",
+                        exc_info=True)
+        database.execute("ROLLBACK TO SAVEPOINT logengine_batch")
+        database.execute("RELEASE SAVEPOINT logengine_batch")
+        reload_caches(database, categories, origins, types)
+    else:
+        database.execute("RELEASE SAVEPOINT logengine_batch")
+        return
+
+    my_parse_and_insert = swallow_all_but_db_exceptions(parse_and_insert)
+    for line in lines:
+        database.execute("SAVEPOINT logengine_line")
+        try:
+            my_parse_and_insert(line, database,
+                                categories, origins, types,
+                                exceptionorigin, exceptiontype,
+                                exceptiontypeorigin)
+        except db.driver.Error:
+            _logger.error("Skipping log line that could not be inserted: %s",
+                          line)
+            database.execute("ROLLBACK TO SAVEPOINT logengine_line")
+            reload_caches(database, categories, origins, types)
+        # Keep the number of open subtransactions down, since the whole
+        # spool file is inserted in a single transaction
+        database.execute("RELEASE SAVEPOINT logengine_line")
+
+
+def reload_caches(database, categories, origins, types):
+    """Reloads the category, origin and type dictionaries from the database,
+    e.g. after a rollback has discarded some of their recent additions.
+
+    """
+    for cache, loader in ((categories, get_categories),
+                          (origins, get_origins),
+                          (types, get_types)):
+        cache.clear()
+        cache.update(loader(database))
 
 
 def swallow_all_but_db_exceptions(func):
@@ -26,6 +26,11 @@ class GraphiteConfigParser(NAVConfigParser):
 [carbon]
 host = 127.0.0.1
 port = 2003
+protocol = udp
+queue-size = 100000
+batch-size = 500
+timeout = 5
+reconnect-interval = 10
 
 [graphiteweb]
 base=http://localhost:8000/
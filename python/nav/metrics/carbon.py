@@ -1,5 +1,5 @@
 #
-# Copyright (C) 2013 UNINETT
+# Copyright (C) 2013, 2018 UNINETT
 #
 # This file is part of Network Administration Visualized (NAV).
 #
@@ -15,13 +15,34 @@
 #
 """
 This module implements various common API to send metrics to a
-Graphite/Carbon backend. It currently only supports the UDP line protocol,
-as it's the easiest to implement, and will also work without vodoo in
-asynchronous programs (i .e. such as ipdevpoll, which is implemented using
-Twisted).
+Graphite/Carbon backend.
+
+Metrics are sent through a transport, selected by the protocol option of the
+[carbon] section of graphite.conf:
+
+udp
+  Carbon's UDP line protocol. Datagrams that are lost, or that overflow the
+  receive buffer of carbon-cache, are silently dropped. This is the default.
+
+tcp
+  Carbon's line protocol over a persistent TCP connection.
+
+pickle
+  Carbon's pickle protocol over a persistent TCP connection.
+
+The TCP based transports keep a bounded queue of metrics that are waiting to
+be sent, and reconnect automatically when the connection is lost. These
+transports may be shared by several threads, but block while writing to the
+socket, so they must never be used from a Twisted reactor thread, such as the
+one running servicemon's asynchronous checkers. Twisted based programs can
+use the transport from nav.metrics.twistedcarbon instead.
 """
+from collections import deque
 import logging
+import pickle
 import socket
+import struct
+import threading
 import time
 import warnings
 from nav.metrics import CONFIG
@@ -38,15 +59,254 @@ MAX_UDP_PAYLOAD = 1400
 # Minimum interval between socket error log entries, in seconds
 SOCKET_ERROR_MESSAGE_INTERVAL = 1
 
+# Default settings of the TCP based transports
+DEFAULT_QUEUE_SIZE = 100000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_RECONNECT_INTERVAL = 10.0
+
 
 class CarbonWarning(UserWarning):
     """Custom warning class for Carbon connection related warnings"""
     pass
 
 
+class CarbonTransport(object):
+    """Base class for transports that send metrics to a Carbon backend.
+
+    Transports keep these counters:
+
+    sent
+      The number of datapoints sent.
+    dropped
+      The number of datapoints discarded, because they could not be sent or
+      queued.
+    batches
+      The number of packets or batches written.
+    latency
+      The total number of seconds spent waiting for the backend.
+
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.sent = 0
+        self.dropped = 0
+        self.batches = 0
+        self.latency = 0.0
+
+    def send(self, metric_tuples):
+        """Sends, or queues for sending, a list of metric tuples in the form
+        [(path, (timestamp, value)), ...]
+
+        Any element of the list may also be a preformatted line protocol
+        line, as a byte string, such as b"nav.foo.bar 42 1500000000\\n".
+
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """Sends as many queued metrics as possible"""
+        pass
+
+    def close(self):
+        """Closes the connection to the backend"""
+        pass
+
+    def report_error(self, error):
+        """Logs a connection error, unless one was logged very recently"""
+        _handle_error(error, self.host, self.port)
+
+    def get_statistics(self):
+        """Returns the counters of this transport as a dict"""
+        return dict(sent=self.sent, dropped=self.dropped,
+                    batches=self.batches, latency=self.latency,
+                    queued=self.get_queue_length())
+
+    def get_queue_length(self):
+        """Returns the number of datapoints waiting to be sent"""
+        return 0
+
+
+class UDPTransport(CarbonTransport):
+    """Sends metrics using Carbon's UDP line protocol"""
+    def __init__(self, host, port=2003):
+        super(UDPTransport, self).__init__(host, port)
+        self.socket = None
+
+    def send(self, metric_tuples):
+        metric_tuples = list(metric_tuples)
+        _logger.debug("sending carbon metrics to [%s]:%s: %r",
+                      self.host, self.port, metric_tuples)
+        try:
+            if self.socket is None:
+                self.socket = socket.socket(_socktype_from_addr(self.host),
+                                            socket.SOCK_DGRAM)
+                self.socket.connect((self.host, self.port))
+            for packet in metrics_to_packets(metric_tuples):
+                self.socket.send(packet)
+                self.batches += 1
+        except socket.error as error:
+            self.dropped += len(metric_tuples)
+            self.report_error(error)
+        else:
+            self.sent += len(metric_tuples)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+class QueueingTransport(CarbonTransport):
+    """Base class for transports that queue metrics and send them in
+    batches over a stream connection.
+
+    :param framing: A function that converts a list of metric tuples to a
+                    string of bytes to write to the connection, such as
+                    format_lines or format_pickle.
+    :param queue_size: The maximum number of queued datapoints. The oldest
+                       datapoints are discarded when the queue overflows.
+    :param batch_size: The maximum number of datapoints per batch.
+
+    """
+    def __init__(self, host, port, framing, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        super(QueueingTransport, self).__init__(host, port)
+        self.framing = framing
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.queue = deque()
+        self._drop_log_timestamp = 0
+        self._logged_drops = 0
+
+    def send(self, metric_tuples):
+        self.enqueue(metric_tuples)
+        self.flush()
+
+    def enqueue(self, metric_tuples):
+        """Adds metric tuples to the queue, discarding the oldest queued
+        datapoints if the queue overflows.
+
+        """
+        queue = self.queue
+        queue.extend(metric_tuples)
+        overflow = len(queue) - self.queue_size
+        if overflow > 0:
+            for _ in range(overflow):
+                queue.popleft()
+            self.dropped += overflow
+            self._log_drops()
+
+    def get_queue_length(self):
+        return len(self.queue)
+
+    def next_batch(self):
+        """Removes and returns the next batch of datapoints from the queue"""
+        queue = self.queue
+        return [queue.popleft()
+                for _ in range(min(self.batch_size, len(queue)))]
+
+    def requeue(self, batch):
+        """Puts an unsent batch back at the head of the queue"""
+        self.queue.extendleft(reversed(batch))
+
+    def _log_drops(self):
+        now = time.time()
+        if now - self._drop_log_timestamp >= 60:
+            _logger.warning("carbon send queue for [%s]:%s is full, "
+                            "discarded %d datapoints",
+                            self.host, self.port,
+                            self.dropped - self._logged_drops)
+            self._drop_log_timestamp = now
+            self._logged_drops = self.dropped
+
+
+class TCPTransport(QueueingTransport):
+    """Sends metrics over a persistent TCP connection, using blocking
+    sockets.
+
+    The transport may be used by several threads at once, but since writes
+    block, it must not be used from a Twisted reactor thread.
+
+    :param timeout: Connect and write timeout, in seconds.
+    :param reconnect_interval: The minimum number of seconds between
+                               connection attempts.
+
+    """
+    def __init__(self, host, port, framing, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, timeout=DEFAULT_TIMEOUT,
+                 reconnect_interval=DEFAULT_RECONNECT_INTERVAL):
+        super(TCPTransport, self).__init__(host, port, framing, queue_size,
+                                           batch_size)
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.socket = None
+        self._last_connect_attempt = 0
+        # Serializes access to the queue and the socket, so that concurrent
+        # writes cannot interleave on the connection
+        self._lock = threading.RLock()
+
+    def send(self, metric_tuples):
+        with self._lock:
+            super(TCPTransport, self).send(metric_tuples)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        while self.queue and self._connect():
+            batch = self.next_batch()
+            data = self.framing(batch)
+            start = time.time()
+            try:
+                self.socket.sendall(data)
+            except socket.error as error:
+                # A partially written batch will be resent in full; Carbon
+                # simply overwrites any duplicate datapoints
+                self.requeue(batch)
+                self.close()
+                self.report_error(error)
+                return
+            finally:
+                self.latency += time.time() - start
+            self.sent += len(batch)
+            self.batches += 1
+
+    def _connect(self):
+        if self.socket is not None:
+            return True
+        now = time.time()
+        if now - self._last_connect_attempt < self.reconnect_interval:
+            return False
+        self._last_connect_attempt = now
+        try:
+            self.socket = socket.create_connection((self.host, self.port),
+                                                   self.timeout)
+        except socket.error as error:
+            self.report_error(error)
+            return False
+        _logger.debug("connected to carbon at [%s]:%s", self.host, self.port)
+        return True
+
+    def close(self):
+        with self._lock:
+            if self.socket is not None:
+                try:
+                    self.socket.close()
+                except socket.error:
+                    pass
+                self.socket = None
+
+
+_udp_transports = {}
+
+
 def send_metrics_to(metric_tuples, host, port=2003):
     """
-    Sends a list of metric tuples to a carbon backend.
+    Sends a list of metric tuples to a carbon backend, using the UDP line
+    protocol.
 
     :param metric_tuples: A list of metric tuples in the form
                           [(path, (timestamp, value)), ...]
@@ -54,21 +314,10 @@ def send_metrics_to(metric_tuples, host, port=2003):
     :param port: The carbon backend UDP port
 
     """
-    # pylint: disable=W0601
-    global carbon
-    try:
-        carbon
-    except NameError:
-        carbon = socket.socket(_socktype_from_addr(host), socket.SOCK_DGRAM)
-        carbon.connect((host, port))
-
-    _logger.debug("sending carbon metrics to [%s]:%s: %r",
-                  host, port, metric_tuples)
-    try:
-        for packet in metrics_to_packets(metric_tuples):
-            carbon.send(packet)
-    except socket.error as error:
-        _handle_error(error, host, port)
+    transport = _udp_transports.get((host, port))
+    if transport is None:
+        transport = _udp_transports[(host, port)] = UDPTransport(host, port)
+    transport.send(metric_tuples)
 
 
 def _handle_error(error, host, port):
@@ -116,9 +365,59 @@ def send_metrics(metric_tuples):
                           [(path, (timestamp, value)), ...]
 
     """
-    host = CONFIG.get("carbon", "host")
-    port = CONFIG.getint("carbon", "port")
-    return send_metrics_to(metric_tuples, host, port)
+    return get_transport().send(metric_tuples)
+
+
+_transport = None
+
+
+def get_transport():
+    """Returns the process-wide transport to the pre-configured carbon
+    backend.
+
+    """
+    global _transport  # pylint: disable=W0603
+    if _transport is None:
+        _transport = make_transport_from_config()
+    return _transport
+
+
+def set_transport(transport):
+    """Replaces the process-wide transport used by send_metrics()"""
+    global _transport  # pylint: disable=W0603
+    if _transport is not None and _transport is not transport:
+        _transport.close()
+    _transport = transport
+
+
+def get_transport_options(config=None):
+    """Returns the transport options of the [carbon] configuration section
+    as a dict.
+
+    """
+    if config is None:
+        config = CONFIG
+    return dict(
+        host=config.get("carbon", "host"),
+        port=config.getint("carbon", "port"),
+        protocol=config.get("carbon", "protocol").strip().lower(),
+        queue_size=config.getint("carbon", "queue-size"),
+        batch_size=config.getint("carbon", "batch-size"),
+        timeout=config.getfloat("carbon", "timeout"),
+        reconnect_interval=config.getfloat("carbon", "reconnect-interval"),
+    )
+
+
+def make_transport_from_config(config=None):
+    """Creates a transport from the [carbon] configuration section"""
+    options = get_transport_options(config)
+    protocol = options.pop('protocol')
+    framing = FRAMINGS.get(protocol)
+    if framing is None:
+        if protocol != 'udp':
+            _logger.error("unknown carbon protocol %r, using udp", protocol)
+        return UDPTransport(options['host'], options['port'])
+    return TCPTransport(framing=framing, **options)
 
 
 def _socktype_from_addr(addr):
@@ -128,11 +427,44 @@ def _socktype_from_addr(addr):
 
 
 def _metric_to_line(metric_tuple):
+    if isinstance(metric_tuple, bytes):
+        return metric_tuple
     path, (timestamp, value) = metric_tuple
     line = "%s %s %s\n" % (path, value, int(timestamp))
     return line.encode('utf-8')
 
 
+def format_lines(metric_tuples):
+    """Frames a batch of metric tuples using Carbon's line protocol"""
+    return b"".join([_metric_to_line(metric) for metric in metric_tuples])
+
+
+def format_pickle(metric_tuples):
+    """Frames a batch of metric tuples using Carbon's pickle protocol.
+
+    Datapoints whose values are not numeric are left out.
+
+    """
+    datapoints = []
+    for metric in metric_tuples:
+        if isinstance(metric, bytes):
+            path, value, timestamp = metric.decode('utf-8').split()
+        else:
+            path, (timestamp, value) = metric
+        try:
+            datapoints.append((str(path), (int(timestamp), float(value))))
+        except (TypeError, ValueError):
+            continue
+    payload = pickle.dumps(datapoints, protocol=2)
+    return struct.pack("!L", len(payload)) + payload
+
+
+FRAMINGS = {
+    'tcp': format_lines,
+    'pickle': format_pickle,
+}
+
+
 def metrics_to_packets(metric_tuples):
     """
     Converts a list of metric tuples to a series of Graphite/Carbon
@@ -0,0 +1,194 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.  You should have received a copy of the GNU General Public License
+# along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""A local index of known Graphite metric names.
+
+Walking a metric hierarchy using nav.metrics.names.nodewalk() costs one
+Graphite query per node in the hierarchy. The index in this module instead
+loads entire subtrees (such as everything below a single device) using one
+wildcard query per tree level, and keeps the results in a trie for a limited
+time.
+
+"""
+from collections import OrderedDict
+import datetime
+import logging
+import threading
+
+from nav.metrics.names import raw_metric_query
+
+_logger = logging.getLogger(__name__)
+
+# The number of path elements that identify a subtree that is loaded as a
+# whole, e.g. the three elements of "nav.devices.some-gw_example_org"
+ROOT_DEPTH = 3
+# The maximum depth of any subtree, as a safeguard against runaway loading
+MAX_LOAD_DEPTH = 10
+# How long a loaded subtree is considered valid
+INDEX_MAX_AGE = datetime.timedelta(minutes=5)
+# The maximum number of subtrees kept in the index
+INDEX_MAX_ROOTS = 500
+
+
+class _Node(object):
+    """A single node of the metric trie"""
+    __slots__ = ('children', 'leaf')
+
+    def __init__(self):
+        self.children = {}
+        self.leaf = False
+
+    def add(self, elements, leaf):
+        """Adds the descendant described by a list of path elements"""
+        node = self
+        for element in elements:
+            if element not in node.children:
+                node.children[element] = _Node()
+            node = node.children[element]
+        node.leaf = node.leaf or leaf
+
+    def find(self, elements):
+        """Returns the descendant described by a list of path elements, or
+        None if no such descendant is known.
+
+        """
+        node = self
+        for element in elements:
+            node = node.children.get(element)
+            if node is None:
+                return None
+        return node
+
+    def walk(self, path, ignored):
+        """Generates the full paths of all leaves below this node.
+
+        The leaves immediately below a node are generated before the leaves
+        of any of its non-leaf children, like nodewalk() would.
+
+        """
+        children = sorted(
+            (path + '.' + name, child)
+            for name, child in self.children.items())
+        children = [(name, child) for name, child in children
+                    if name not in ignored]
+        for name, child in children:
+            if child.leaf:
+                yield name
+        for name, child in children:
+            if child.children:
+                for leaf in child.walk(name, ignored):
+                    yield leaf
+
+
+class MetricIndex(object):
+    """A cache of Graphite metric hierarchies.
+
+    Subtrees are loaded on demand, are discarded when they become older than
+    max_age, and at most max_roots subtrees are kept, discarding the least
+    recently used subtree first.
+
+    """
+    def __init__(self, max_age=INDEX_MAX_AGE, max_roots=INDEX_MAX_ROOTS):
+        self.max_age = max_age
+        self.max_roots = max_roots
+        self._roots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_all_leaves_below(self, top, ignored=None):
+        """Gets a list of all leaf nodes in the metric hierarchy below top.
+
+        Works like nav.metrics.names.get_all_leaves_below(), but answers from
+        the index, loading the subtree containing top if necessary.
+
+        :param top: Path to the node to find leaves below.
+        :param ignored: A list of node IDs whose subtrees should be ignored.
+
+        """
+        elements = top.split('.')
+        root_elements = elements[:ROOT_DEPTH]
+        root = self._get_root('.'.join(root_elements))
+        node = root.find(elements[len(root_elements):])
+        if node is None:
+            return []
+        return list(node.walk(top, set(ignored or [])))
+
+    def invalidate(self, root=None):
+        """Discards a single subtree from the index, or all of them if root
+        is None.
+
+        """
+        with self._lock:
+            if root is None:
+                self._roots.clear()
+            else:
+                self._roots.pop(root, None)
+
+    def _get_root(self, path):
+        now = datetime.datetime.now()
+        with self._lock:
+            cached = self._roots.pop(path, None)
+            if cached and now - cached[0] <= self.max_age:
+                self._roots[path] = cached
+                return cached[1]
+
+        root = load_metric_tree(path)
+        with self._lock:
+            self._roots[path] = (now, root)
+            while len(self._roots) > self.max_roots:
+                self._roots.popitem(last=False)
+        return root
+
+
+def load_metric_tree(top):
+    """Loads the entire metric hierarchy below top from Graphite.
+
+    Graphite is queried once per level of the hierarchy, using one more
+    wildcard element for each level, until a level without any non-leaf
+    nodes is found.
+
+    :returns: A trie node representing top.
+
+    """
+    root = _Node()
+    prefix_length = len(top) + 1
+    query = top
+    for _depth in range(MAX_LOAD_DEPTH):
+        query += '.*'
+        nodes = raw_metric_query(query)
+        for node in nodes:
+            root.add(node['id'][prefix_length:].split('.'),
+                     node.get('leaf', False))
+        if not any(not node.get('leaf', False) for node in nodes):
+            break
+    else:
+        _logger.warning("metric hierarchy below %s is deeper than %d levels, "
+                        "ignoring the remainder", top, MAX_LOAD_DEPTH)
+    return root
+
+
+_metric_index = MetricIndex()
+
+
+def get_metric_index():
+    """Returns the process-wide metric index"""
+    return _metric_index
+
+
+def get_all_leaves_below(top, ignored=None):
+    """Gets a list of all leaf nodes in the metric hierarchy below top, using
+    the process-wide metric index.
+
+    """
+    return _metric_index.get_all_leaves_below(top, ignored)
@@ -0,0 +1,153 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.  You should have received a copy of the GNU General Public License
+# along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""A cache of metric path prefixes, for collectors that send many metrics
+per device.
+
+Collectors like ipdevpoll's port and sensor statistics plugins send several
+metrics for each interface or sensor of a device at every run. Rather than
+escaping the device and interface names and formatting the full metric path
+for every single value, they can look up a cached, preformatted prefix, and
+use it to build Carbon line protocol lines directly::
+
+  >>> cache = MetricPathCache()
+  >>> prefix = cache.get_interface_prefix('example-sw', 'Gi1/1')
+  >>> format_line(prefix, b'ifInOctets', 42, format_timestamp(1500000000))
+  b'nav.devices.example-sw.ports.Gi1_1.ifInOctets 42 1500000000\\n'
+
+"""
+from collections import OrderedDict
+
+from nav.metrics.names import escape_metric_name
+from nav.metrics.templates import (metric_prefix_for_interface,
+                                   metric_path_for_sensor)
+
+# The maximum number of devices to keep cached prefixes for
+DEFAULT_MAX_DEVICES = 5000
+
+INTERFACE = 'interface'
+SENSOR = 'sensor'
+
+
+class MetricPathCache(object):
+    """Caches the metric path prefixes of the interfaces of devices, and the
+    metric paths of their sensors, as UTF-8 encoded byte strings. Interface
+    prefixes end with a period.
+
+    Prefixes are cached per device sysname. A renamed device gets a fresh
+    set of prefixes, while the prefixes of its old name are eventually
+    discarded, as the least recently used devices are discarded first. The
+    prefixes of renamed interfaces or sensors are discarded by retain().
+
+    """
+    def __init__(self, max_devices=DEFAULT_MAX_DEVICES):
+        self.max_devices = max_devices
+        self._devices = OrderedDict()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def get_interface_prefix(self, sysname, ifname):
+        """Returns the metric path prefix of an interface"""
+        return self._get_prefix(sysname, INTERFACE, ifname)
+
+    def get_sensor_path(self, sysname, sensor):
+        """Returns the metric path of a sensor"""
+        return self._get_prefix(sysname, SENSOR, sensor)
+
+    def retain(self, sysname, kind, names):
+        """Discards all cached prefixes of one kind for a device, except
+        those of the listed names.
+
+        :param kind: Either INTERFACE or SENSOR.
+        :param names: The names of the interfaces or sensors that still
+                      exist on the device.
+
+        """
+        entries = self._devices.get(sysname)
+        if not entries:
+            return
+        names = set(names)
+        for key in [key for key in entries
+                    if key[0] == kind and key[1] not in names]:
+            del entries[key]
+
+    def invalidate(self, sysname=None):
+        """Discards the cached prefixes of a single device, or of all
+        devices if sysname is None.
+
+        """
+        if sysname is None:
+            self._devices.clear()
+        else:
+            self._devices.pop(sysname, None)
+
+    def _get_prefix(self, sysname, kind, name):
+        entries = self._devices.pop(sysname, None)
+        if entries is None:
+            entries = {}
+            while len(self._devices) >= self.max_devices:
+                self._devices.popitem(last=False)
+        self._devices[sysname] = entries
+
+        key = (kind, name)
+        prefix = entries.get(key)
+        if prefix is None:
+            prefix = entries[key] = _make_prefix(sysname, kind, name)
+        return prefix
+
+
+def _make_prefix(sysname, kind, name):
+    if kind == INTERFACE:
+        path = metric_prefix_for_interface(sysname, name) + "."
+    else:
+        path = metric_path_for_sensor(sysname, name)
+    return path.encode('utf-8')
+
+
+def encode_metric_name(name):
+    """Escapes and encodes a metric name element for use with prefixes from
+    a MetricPathCache.
+
+    """
+    return escape_metric_name(name).encode('utf-8')
+
+
+def format_timestamp(timestamp):
+    """Formats a timestamp as the end of a Carbon line protocol line"""
+    return (" %d\n" % int(timestamp)).encode('ascii')
+
+
+def format_line(prefix, name, value, timestamp):
+    """Formats a Carbon line protocol line.
+
+    :param prefix: An interface prefix from a MetricPathCache, or a full
+                   metric path if name is b''.
+    :param name: An encoded metric name, as returned by encode_metric_name(),
+                 to append to prefix.
+    :param value: The metric value.
+    :param timestamp: A timestamp, as returned by format_timestamp().
+
+    """
+    return b"".join((prefix, name, b" ", str(value).encode('ascii'),
+                     timestamp))
+
+
+_path_cache = MetricPathCache()
+
+
+def get_path_cache():
+    """Returns the process-wide metric path cache"""
+    return _path_cache
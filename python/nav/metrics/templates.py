@@ -22,6 +22,21 @@ from nav.metrics.names import escape_metric_name
 # pylint: disable=C0111
 
 
+def metric_prefix_for_eventengine():
+    return "nav.eventengine"
+
+
+def metric_path_for_eventengine_plugin_runtime(plugin):
+    tmpl = "{prefix}.plugins.{plugin}.runtime"
+    return tmpl.format(prefix=metric_prefix_for_eventengine(),
+                       plugin=escape_metric_name(plugin))
+
+
+def metric_prefix_for_statemon(source):
+    tmpl = "nav.statemon.{source}"
+    return tmpl.format(source=escape_metric_name(source))
+
+
 def metric_prefix_for_ipdevpoll_job(sysname, job_name):
     tmpl = "{device}.ipdevpoll.{job_name}"
     return tmpl.format(device=metric_prefix_for_device(sysname),
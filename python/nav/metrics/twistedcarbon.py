@@ -0,0 +1,166 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.  You should have received a copy of the GNU General Public License
+# along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""A Carbon transport for Twisted based programs, such as ipdevpoll.
+
+Metrics are queued and written to a persistent TCP connection managed by the
+reactor, so that sending metrics never blocks. While the connection is down,
+or its write buffer is full, metrics keep queueing, up to the configured
+queue size.
+"""
+import logging
+import time
+
+from twisted.internet import reactor, protocol
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
+
+from nav.metrics import carbon
+
+_logger = logging.getLogger(__name__)
+
+
+class CarbonProtocol(protocol.Protocol):
+    """A write-only connection to a Carbon receiver"""
+    def connectionMade(self):
+        self.factory.carbon.connected(self)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.factory.carbon.disconnected(self, reason)
+
+
+class CarbonClientFactory(protocol.ReconnectingClientFactory):
+    """Keeps a connection to a Carbon receiver for a TwistedCarbonTransport"""
+    protocol = CarbonProtocol
+
+    def __init__(self, carbon_transport, reconnect_interval):
+        self.carbon = carbon_transport
+        self.maxDelay = reconnect_interval
+        self.noisy = False
+
+    def buildProtocol(self, addr):
+        self.resetDelay()
+        return protocol.ReconnectingClientFactory.buildProtocol(self, addr)
+
+    def clientConnectionFailed(self, connector, reason):
+        self.carbon.report_error(reason.getErrorMessage())
+        protocol.ReconnectingClientFactory.clientConnectionFailed(
+            self, connector, reason)
+
+
+@implementer(IPushProducer)
+class TwistedCarbonTransport(carbon.QueueingTransport):
+    """Sends metrics over a persistent TCP connection, without blocking the
+    reactor.
+
+    The transport registers itself as a producer on the connection. When the
+    connection's write buffer fills up, writing pauses until Twisted has
+    drained it; the time spent paused is counted as latency.
+
+    """
+    def __init__(self, host, port, framing,
+                 queue_size=carbon.DEFAULT_QUEUE_SIZE,
+                 batch_size=carbon.DEFAULT_BATCH_SIZE,
+                 timeout=carbon.DEFAULT_TIMEOUT,
+                 reconnect_interval=carbon.DEFAULT_RECONNECT_INTERVAL,
+                 clock=reactor):
+        super(TwistedCarbonTransport, self).__init__(
+            host, port, framing, queue_size, batch_size)
+        self.timeout = timeout
+        self.clock = clock
+        self.factory = CarbonClientFactory(self, reconnect_interval)
+        self.connection = None
+        self.connector = None
+        self._paused_at = None
+        self._flush_call = None
+
+    def send(self, metric_tuples):
+        self.enqueue(metric_tuples)
+        if self.connector is None:
+            self.connect()
+        elif self._flush_call is None and self.connection is not None:
+            # coalesce the sends of a single reactor iteration
+            self._flush_call = self.clock.callLater(0, self.flush)
+
+    def connect(self):
+        """Starts connecting to the Carbon receiver"""
+        self.connector = self.clock.connectTCP(self.host, self.port,
+                                               self.factory,
+                                               timeout=self.timeout)
+
+    def flush(self):
+        self._flush_call = None
+        while (self.queue and self.connection is not None and
+               self._paused_at is None):
+            batch = self.next_batch()
+            self.connection.transport.write(self.framing(batch))
+            self.sent += len(batch)
+            self.batches += 1
+
+    def close(self):
+        self.factory.stopTrying()
+        if self.connection is not None:
+            self.connection.transport.loseConnection()
+
+    def connected(self, connection):
+        """Called when a connection to Carbon has been established"""
+        _logger.debug("connected to carbon at [%s]:%s", self.host, self.port)
+        self.connection = connection
+        self._paused_at = None
+        connection.transport.registerProducer(self, True)
+        self.flush()
+
+    def disconnected(self, connection, reason):
+        """Called when the connection to Carbon has been lost"""
+        if connection is not self.connection:
+            return
+        self.connection = None
+        self.resumeProducing()
+        # Data in the lost connection's write buffer is gone
+        self.report_error(reason.getErrorMessage())
+
+    # IPushProducer implementation
+
+    def pauseProducing(self):
+        if self._paused_at is None:
+            self._paused_at = time.time()
+
+    def resumeProducing(self):
+        if self._paused_at is not None:
+            self.latency += time.time() - self._paused_at
+            self._paused_at = None
+        if self.connection is not None:
+            self.flush()
+
+    def stopProducing(self):
+        pass
+
+
+def install_from_config(config=None):
+    """Installs a TwistedCarbonTransport as the process-wide Carbon
+    transport, if a TCP based protocol is configured.
+
+    :returns: The installed transport, or None if the configured protocol
+              does not block, and was left alone.
+
+    """
+    options = carbon.get_transport_options(config)
+    framing = carbon.FRAMINGS.get(options.pop('protocol'))
+    if framing is None:
+        return None
+    transport = TwistedCarbonTransport(framing=framing, **options)
+    carbon.set_transport(transport)
+    reactor.addSystemEventTrigger("before", "shutdown", transport.flush)
+    return transport
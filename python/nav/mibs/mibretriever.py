@@ -369,72 +369,140 @@ class MibRetriever(object):
             self._logger.debug("%s is not a table column", column_name)
 
         def _result_formatter(result):
-            formatted_result = {}
-            # result keys may be OID objects/tuples or strings, depending on
-            # snmp library used
-            if node.oid not in result and str(node.oid) not in result:
-                self._logger.debug("%s (%s) seems to be unsupported, result "
-                                   "keys were: %r",
-                                   column_name, node.oid, result.keys())
-                return {}
-            varlist = result.get(node.oid, result.get(str(node.oid), None))
-
-            for oid, value in varlist.items():
-                # Extract index information from oid
-                row_index = OID(oid).strip_prefix(node.oid)
-                formatted_result[row_index] = value
-
-            return formatted_result
+            return self._format_column_result(result, column_name)
 
         def _valueerror_handler(failure):
-            failure.trap(ValueError)
-            self._logger.warning("got a possibly strange response from device "
-                                 "when asking for %s::%s, ignoring: %s",
-                                 self.mib.get('moduleName', ''), column_name,
-                                 failure.getErrorMessage())
+            self._handle_column_valueerror(failure, [column_name])
             return {}  # alternative is to retry or raise a Timeout exception
 
         deferred = self.agent_proxy.getTable([str(node.oid)])
         deferred.addCallbacks(_result_formatter, _valueerror_handler)
         return deferred
 
+    def _retrieve_column_group(self, column_names):
+        """Retrieve the contents of several MIB table columns using a single
+        getTable operation, which lets the SNMP library walk all the columns
+        in parallel, using multiple varbinds in each request.
+
+        Returns a deferred whose result is a dictionary:
+
+          { column_name: { row_index: column_value } }
+
+        """
+        if len(column_names) == 1:
+            column_name = column_names[0]
+            deferred = self.retrieve_column(column_name)
+            deferred.addCallback(lambda result: {column_name: result})
+            return deferred
+
+        def _result_formatter(result):
+            return dict((column, self._format_column_result(result, column))
+                        for column in column_names)
+
+        def _valueerror_handler(failure):
+            self._handle_column_valueerror(failure, column_names)
+            return dict((column, {}) for column in column_names)
+
+        oids = [str(self.nodes[column].oid) for column in column_names]
+        deferred = self.agent_proxy.getTable(oids)
+        deferred.addCallbacks(_result_formatter, _valueerror_handler)
+        return deferred
+
+    def _format_column_result(self, result, column_name):
+        """Extracts the values of a single column from a getTable result.
+
+        :returns: A dictionary of { row_index: column_value }
+
+        """
+        node = self.nodes[column_name]
+        formatted_result = {}
+        # result keys may be OID objects/tuples or strings, depending on
+        # snmp library used
+        if node.oid not in result and str(node.oid) not in result:
+            self._logger.debug("%s (%s) seems to be unsupported, result "
+                               "keys were: %r",
+                               column_name, node.oid, result.keys())
+            return {}
+        varlist = result.get(node.oid, result.get(str(node.oid), None))
+
+        for oid, value in varlist.items():
+            # Extract index information from oid
+            row_index = OID(oid).strip_prefix(node.oid)
+            formatted_result[row_index] = value
+
+        return formatted_result
+
+    def _handle_column_valueerror(self, failure, column_names):
+        failure.trap(ValueError)
+        self._logger.warning("got a possibly strange response from device "
+                             "when asking for %s::%s, ignoring: %s",
+                             self.mib.get('moduleName', ''),
+                             ", ".join(column_names),
+                             failure.getErrorMessage())
+
     def retrieve_columns(self, column_names):
         """Retrieve a set of table columns.
 
         The table columns may come from different tables, as long as
         the table rows are indexed the same way.
 
+        Up to max_concurrent_columns column retrievals are kept in flight
+        at the same time, and columns_per_request columns are walked
+        together in each retrieval, as configured by the agent proxy's SNMP
+        parameters.
+
         Returns a deferred whose result is a dictionary:
 
           { row_index: MibTableResultRow instance }
 
         """
+        params = getattr(self.agent_proxy, 'snmp_parameters', None)
+        window = max(1, getattr(params, 'max_concurrent_columns', 1))
+        group_size = max(1, getattr(params, 'columns_per_request', 1))
+
         def _sortkey(col):
             return self.nodes[col].oid
-        columns = iter(sorted(column_names, key=_sortkey))
+        columns = sorted(column_names, key=_sortkey)
+        groups = iter([columns[i:i + group_size]
+                       for i in range(0, len(columns), group_size)])
 
         final_result = {}
+        in_flight = [0]
         my_deferred = defer.Deferred()
 
-        def _result_aggregate(result, column):
-            for row_index, value in result.items():
-                if row_index not in final_result:
-                    final_result[row_index] = \
-                        MibTableResultRow(row_index, column_names)
-                final_result[row_index][column] = value
+        def _result_aggregate(result):
+            for column, values in result.items():
+                for row_index, value in values.items():
+                    if row_index not in final_result:
+                        final_result[row_index] = \
+                            MibTableResultRow(row_index, column_names)
+                    final_result[row_index][column] = value
             return True
 
-        # schedule the next iteration (i.e. collect next column)
+        def _group_done(_result):
+            in_flight[0] -= 1
+            _schedule_next()
+
+        def _group_failed(failure):
+            if not my_deferred.called:
+                my_deferred.errback(failure)
+
+        # schedule the next iterations (i.e. fill up the in-flight window)
         def _schedule_next(_result=None):
-            try:
-                column = next(columns)
-            except StopIteration:
-                my_deferred.callback(final_result)
+            if my_deferred.called:
                 return
-            deferred = self.retrieve_column(column)
-            deferred.addCallback(_result_aggregate, column)
-            deferred.addCallback(_schedule_next)
-            deferred.addErrback(my_deferred.errback)
+            while in_flight[0] < window:
+                try:
+                    group = next(groups)
+                except StopIteration:
+                    break
+                in_flight[0] += 1
+                deferred = self._retrieve_column_group(group)
+                deferred.addCallback(_result_aggregate)
+                deferred.addCallbacks(_group_done, _group_failed)
+
+            if not in_flight[0] and not my_deferred.called:
+                my_deferred.callback(final_result)
 
         reactor.callLater(0, _schedule_next)
         return my_deferred
@@ -669,6 +737,7 @@ class MultiMibMixIn(MibRetriever):
             community=community,
             snmpVersion=agent.snmpVersion,
             snmp_parameters=agent.snmp_parameters)
+        alt_agent.request_stats = agent.request_stats
         if hasattr(agent, 'protocol'):
             alt_agent.protocol = agent.protocol
 
@@ -38,7 +38,7 @@ from nav.adapters import HStoreField
 from nav.bitvector import BitVector
 from nav.metrics.data import get_netboxes_availability
 from nav.metrics.graphs import get_simple_graph_url
-from nav.metrics.names import get_all_leaves_below
+from nav.metrics.index import get_all_leaves_below
 from nav.metrics.templates import (
     metric_prefix_for_interface,
     metric_prefix_for_ports,
@@ -104,6 +104,8 @@ class Netbox(models.Model):
     up_to_date = models.BooleanField(db_column='uptodate', default=False)
     discovered = models.DateTimeField(auto_now_add=True)
     deleted_at = models.DateTimeField(blank=True, null=True, default=None)
+    # Maintained by a database trigger whenever the row actually changes
+    last_modified = models.DateTimeField(auto_now=True)
     master = models.ForeignKey('Netbox', db_column='masterid', null=True,
                                blank=True, default=None,
                                related_name='instances')
@@ -182,13 +184,14 @@ class Netbox(models.Model):
                   MAX(end_time) AS end_time
                 FROM
                   ipdevpoll_job_log
+                WHERE netboxid = %s
                 GROUP BY netboxid, job_name
               ) AS foo USING (netboxid, job_name, end_time)
             JOIN netbox ON (ijl.netboxid = netbox.netboxid)
             WHERE ijl.netboxid = %s
             ORDER BY end_time
         """
-        logs = IpdevpollJobLog.objects.raw(query, [self.id])
+        logs = IpdevpollJobLog.objects.raw(query, [self.id, self.id])
         return list(logs)
 
     def get_gwport_count(self):
@@ -809,11 +809,55 @@ class Filter(models.Model):
         """
         logger = logging.getLogger('nav.alertengine.filter.check')
 
+        filtr, exclude, extra = self.get_query_arguments()
+
+        # Limit ourselves to our alert
+        filtr['id'] = alert.id
+
+        logger.debug(
+            'alert %d: checking against filter %d with filter: %s, exclude: '
+            '%s and extra: %s',
+            alert.id, self.id, filtr, exclude, extra)
+
+        # Check the alert maches whith a SELECT COUNT(*) FROM .... so that the
+        # db doesn't have to work as much.
+        if AlertQueue.objects.filter(**filtr).exclude(**exclude).extra(
+                **extra).count():
+            logger.debug('alert %d: matches filter %d', alert.id, self.id)
+            return True
+
+        logger.debug('alert %d: did not match filter %d', alert.id, self.id)
+        return False
+
+    def get_matching_alert_ids(self, alert_ids, expressions=None):
+        """Returns the subset of alert_ids whose alerts match this filter, using
+        a single query.
+
+        :type alert_ids: list
+        :param expressions: The Expressions of this filter, if already loaded.
+        :rtype: set
+        """
+        filtr, exclude, extra = self.get_query_arguments(expressions)
+        filtr['id__in'] = alert_ids
+        return set(AlertQueue.objects.filter(**filtr).exclude(
+            **exclude).extra(**extra).values_list('id', flat=True))
+
+    def get_query_arguments(self, expressions=None):
+        """Builds the arguments for the ORM .filter(), .exclude() and .extra()
+        methods that select the alerts matching this filter.
+
+        :param expressions: The Expressions of this filter. Will be loaded from
+                            the database if not supplied.
+        :returns: A tuple of three dicts: (filter, exclude, extra)
+        """
+        if expressions is None:
+            expressions = self.expression_set.all()
+
         filtr = {}
         exclude = {}
         extra = {'where': [], 'params': []}
 
-        for expression in self.expression_set.all():
+        for expression in expressions:
             # Handle IP datatypes:
             if expression.match_field.data_type == MatchField.IP:
                 # Trick the ORM into joining the tables we want
@@ -878,26 +922,10 @@ class Filter(models.Model):
                 else:
                     filtr[lookup] = expression.value
 
-        # Limit ourselves to our alert
-        filtr['id'] = alert.id
-
         if not extra['where']:
             extra = {}
 
-        logger.debug(
-            'alert %d: checking against filter %d with filter: %s, exclude: '
-            '%s and extra: %s',
-            alert.id, self.id, filtr, exclude, extra)
-
-        # Check the alert maches whith a SELECT COUNT(*) FROM .... so that the
-        # db doesn't have to work as much.
-        if AlertQueue.objects.filter(**filtr).exclude(**exclude).extra(
-                **extra).count():
-            logger.debug('alert %d: matches filter %d', alert.id, self.id)
-            return True
-
-        logger.debug('alert %d: did not match filter %d', alert.id, self.id)
-        return False
+        return filtr, exclude, extra
 
 
 @python_2_unicode_compatible
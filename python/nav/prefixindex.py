@@ -0,0 +1,197 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.  You should have received a copy of the GNU General Public
+# License along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""Longest-prefix-match index of IPv4 and IPv6 prefixes.
+
+The index is a binary trie per address family, keyed by the integer value of
+the prefix address.  A lookup walks at most one node per bit of the looked up
+address, regardless of how many prefixes are stored in the index.
+
+Example:
+
+>>> index = PrefixIndex([('10.0.0.0/8', 1), ('10.0.42.0/24', 2)])
+>>> index.longest_match('10.0.42.1')
+2
+>>> index.longest_match('10.1.0.1')
+1
+>>> index.longest_match('192.168.0.1') is None
+True
+
+"""
+from IPy import IP
+
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+class _Node(object):
+    """A single trie node"""
+    __slots__ = ('children', 'prefix', 'value')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.prefix = None
+        self.value = None
+
+
+class PrefixIndex(object):
+    """A longest-prefix-match index of IP prefixes, each associated with an
+    arbitrary value (such as a database primary key).
+
+    """
+    def __init__(self, items=()):
+        """Initializes an index.
+
+        :param items: An iterable of (prefix, value) tuples to populate the
+                      index with. Prefixes may be IP objects or strings.
+
+        """
+        self._roots = self._entries = None
+        self.clear()
+        for prefix, value in items:
+            self.add(prefix, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, prefix):
+        return _make_key(_to_ip(prefix)) in self._entries
+
+    def __repr__(self):
+        return "<%s with %d prefixes>" % (self.__class__.__name__, len(self))
+
+    def add(self, prefix, value):
+        """Adds a prefix to the index, replacing its value if the prefix is
+        already present.
+
+        """
+        prefix = _to_ip(prefix)
+        key = _make_key(prefix)
+        version, address, prefixlen = key
+        node = self._roots[version]
+        bits = ADDRESS_BITS[version]
+        for depth in range(prefixlen):
+            bit = (address >> (bits - 1 - depth)) & 1
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        node.prefix = prefix
+        node.value = value
+        self._entries[key] = value
+
+    def remove(self, prefix):
+        """Removes a prefix from the index.
+
+        :raises KeyError: if the prefix is not in the index.
+
+        """
+        key = _make_key(_to_ip(prefix))
+        del self._entries[key]
+        self._remove_node(key)
+
+    def _remove_node(self, key):
+        version, address, prefixlen = key
+        bits = ADDRESS_BITS[version]
+
+        path = [self._roots[version]]
+        for depth in range(prefixlen):
+            bit = (address >> (bits - 1 - depth)) & 1
+            path.append(path[-1].children[bit])
+        node = path[-1]
+        node.prefix = node.value = None
+
+        # prune nodes that no longer lead anywhere
+        for depth in range(prefixlen, 0, -1):
+            node = path[depth]
+            if node.prefix is not None or any(node.children):
+                break
+            bit = (address >> (bits - depth)) & 1
+            path[depth - 1].children[bit] = None
+
+    def update(self, items):
+        """Incrementally replaces the contents of the index with items.
+
+        Only prefixes that have disappeared, appeared or changed their values
+        are touched.
+
+        :param items: An iterable of (prefix, value) tuples.
+        :returns: A tuple of the number of (added/changed, removed) prefixes.
+
+        """
+        wanted = {}
+        for prefix, value in items:
+            prefix = _to_ip(prefix)
+            wanted[_make_key(prefix)] = (prefix, value)
+
+        removed = [key for key in self._entries if key not in wanted]
+        for key in removed:
+            del self._entries[key]
+            self._remove_node(key)
+
+        changed = 0
+        for key, (prefix, value) in wanted.items():
+            if key not in self._entries or self._entries[key] != value:
+                self.add(prefix, value)
+                changed += 1
+        return changed, len(removed)
+
+    def clear(self):
+        """Removes all prefixes from the index"""
+        self._roots = dict((version, _Node()) for version in ADDRESS_BITS)
+        self._entries = {}
+
+    def longest_match(self, addr, proper=False):
+        """Returns the value of the longest (i.e. most specific) prefix that
+        contains addr.
+
+        :param addr: An IP address or prefix, either as an IP object or a
+                     string.
+        :param proper: If True, only prefixes that are proper supernets of
+                       addr will match, i.e. a prefix will not match itself.
+        :returns: The value associated with the matching prefix, or None if no
+                  prefixes match.
+
+        """
+        match = self.longest_match_item(addr, proper)
+        return match[1] if match else None
+
+    def longest_match_item(self, addr, proper=False):
+        """Like longest_match(), but returns a (prefix, value) tuple, or None
+        if no prefixes match.
+
+        """
+        addr = _to_ip(addr)
+        version = addr.version()
+        address = addr.int()
+        bits = ADDRESS_BITS[version]
+        depth_limit = addr.prefixlen() - 1 if proper else addr.prefixlen()
+
+        node = self._roots[version]
+        best = node if node.prefix is not None else None
+        for depth in range(depth_limit):
+            node = node.children[(address >> (bits - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node.prefix is not None:
+                best = node
+        if best is not None and not (proper and depth_limit < 0):
+            return best.prefix, best.value
+
+
+def _to_ip(addr):
+    return addr if isinstance(addr, IP) else IP(addr)
+
+
+def _make_key(prefix):
+    return prefix.version(), prefix.int(), prefix.prefixlen()
@@ -16,12 +16,16 @@
 #
 """Represents the meta information and result from a database query."""
 
+import uuid
+
 from nav import db
 import psycopg2
 
 
 class DatabaseResult(object):
     """The results obtained from the database"""
+    paged = False
+    streaming = False
 
     def __init__(self, report_config):
         """Does everything in the constructor. queries and returns the values
@@ -34,31 +38,124 @@ class DatabaseResult(object):
         self.result = []
         self.rowcount = 0
         self.sums = {}
+        self.totals = None
         self.error = ""
         self.hidden = []
 
         connection = db.getConnection('default')
         database = connection.cursor()
 
-        self.sql = report_config.make_sql()
+        self.sql = self._make_sql(report_config)
 
         ## Make a dictionary of which columns to summarize
         self.sums = dict([(sum_key, '') for sum_key in report_config.sum])
 
         try:
-            database.execute(self.sql)
-            self.result = database.fetchall()
-
-            # A list of the column headers.
-            col_head = []
-            for col in range(0, len(database.description)):
-                col_head.append(database.description[col][0])
-            report_config.sql_select = col_head
-
-            ## Total count of the rows returned.
-            self.rowcount = len(self.result)
+            self._execute(database, report_config)
 
         except psycopg2.ProgrammingError as error:
             #raise ProblemExistBetweenKeyboardAndChairException
             self.error = ("Configuration error! The report generator is not "
                           "able to do such things. " + str(error))
+
+    def _make_sql(self, report_config):
+        return report_config.make_sql()
+
+    def _execute(self, database, report_config):
+        database.execute(self.sql)
+        self.result = database.fetchall()
+        self._set_column_headers(database, report_config)
+
+        ## Total count of the rows returned.
+        self.rowcount = len(self.result)
+
+    @staticmethod
+    def _set_column_headers(database, report_config):
+        # A list of the column headers.
+        col_head = []
+        for col in range(0, len(database.description)):
+            col_head.append(database.description[col][0])
+        report_config.sql_select = col_head
+
+
+class PagedDatabaseResult(DatabaseResult):
+    """The results of a single page of a report query.
+
+    Only the rows of the requested page are fetched from the database. The
+    total row count and the totals of the summarized columns are obtained
+    using a separate aggregate query.
+
+    """
+    paged = True
+
+    def __init__(self, report_config, offset, limit):
+        """
+        :param report_config: a ReportConfig object containing the SQL query.
+        :param offset: the number of rows to skip.
+        :param limit: the maximum number of rows to fetch.
+
+        """
+        self.offset = offset
+        self.limit = limit
+        super(PagedDatabaseResult, self).__init__(report_config)
+
+    def _make_sql(self, report_config):
+        return report_config.make_sql(limit=self.limit, offset=self.offset)
+
+    def _execute(self, database, report_config):
+        database.execute(self.sql)
+        self.result = database.fetchall()
+        self._set_column_headers(database, report_config)
+
+        # only summarize columns that are actually present in the result
+        sum_columns = [column for column in report_config.sql_select
+                       if column in self.sums]
+        database.execute(report_config.make_aggregate_sql(sum_columns))
+        aggregates = database.fetchone()
+        self.rowcount = aggregates[0]
+        self.totals = dict(zip(sum_columns, aggregates[1:]))
+
+
+class StreamingDatabaseResult(DatabaseResult):
+    """The results of a report query, streamed from a server-side cursor.
+
+    The result attribute is an iterator that fetches rows from the database
+    in chunks as it is consumed, so that the full result never needs to be
+    held in memory. The total row count is not known in advance.
+
+    """
+    streaming = True
+    FETCH_SIZE = 2000
+
+    def _make_sql(self, report_config):
+        # A limit of 0 means everything, as requested by exportcsv
+        limit = int(report_config.limit or 0) or None
+        offset = int(report_config.offset or 0)
+        return report_config.make_sql(limit=limit, offset=offset)
+
+    def _execute(self, database, report_config):
+        connection = db.getConnection('default')
+        cursor = connection.cursor(name="report_%s" % uuid.uuid4().hex)
+        cursor.itersize = self.FETCH_SIZE
+        try:
+            cursor.execute(self.sql)
+            # the description of a named cursor is only available once
+            # something has been fetched
+            first = cursor.fetchmany(self.FETCH_SIZE)
+            self._set_column_headers(cursor, report_config)
+        except Exception:
+            cursor.close()
+            raise
+        self.rowcount = None
+        self.result = self._iter_rows(cursor, first)
+
+    @staticmethod
+    def _iter_rows(cursor, first):
+        try:
+            for row in first:
+                yield row
+            if len(first) == StreamingDatabaseResult.FETCH_SIZE:
+                for row in cursor:
+                    yield row
+        finally:
+            cursor.close()
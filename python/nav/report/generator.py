@@ -22,7 +22,8 @@ from django.utils import six
 from django.utils.six.moves.urllib.parse import unquote_plus
 
 import nav
-from nav.report.dbresult import DatabaseResult
+from nav.report.dbresult import (DatabaseResult, PagedDatabaseResult,
+                                StreamingDatabaseResult)
 from nav.report.report import Report
 
 
@@ -31,7 +32,8 @@ class Generator(object):
     sql = None
 
     def make_report(self, report_name, config_file, config_file_local,
-                    query_dict, config, dbresult):
+                    query_dict, config, dbresult, page=None,
+                    streaming=False):
         """Makes a report
 
         :param report_name: the name of the report that will be represented
@@ -41,6 +43,12 @@ class Generator(object):
         :param queryDict: mutable QueryDict
         :param config: the parsed configuration object, if cached
         :param dbresult: the database result, if cached
+        :param page: an (offset, limit) tuple. If given, and the query
+                     arguments do not specify their own offset or limit, only
+                     the rows of this page are fetched from the database.
+        :param streaming: if True, the report rows are streamed from the
+                          database while being consumed through
+                          Report.iter_table_rows().
 
         :returns: a formatted report object and search parameters. Also returns
                   a parsed ReportConfig object and a DatabaseResult object to
@@ -87,7 +95,12 @@ class Generator(object):
             return report, contents, neg, operator, advanced
 
         else:  # Not cached
-            dbresult = DatabaseResult(config)
+            if streaming:
+                dbresult = StreamingDatabaseResult(config)
+            elif page and not (config.offset or config.limit):
+                dbresult = PagedDatabaseResult(config, *page)
+            else:
+                dbresult = DatabaseResult(config)
             self.sql = dbresult.sql
 
             report = Report(config, dbresult, query_dict)
@@ -416,10 +429,26 @@ class ReportConfig(object):
         return template.format(self.sql, self.sql_select, self.where,
                                self.order_by)
 
-    def make_sql(self):
+    def make_sql(self, limit=None, offset=None):
         sql = "SELECT * FROM (%s) AS foo %s%s" % (self.sql,
                                                   self.wherestring(),
                                                   self.orderstring())
+        if limit is not None:
+            sql += " LIMIT %d" % int(limit)
+        if offset:
+            sql += " OFFSET %d" % int(offset)
+        return sql
+
+    def make_aggregate_sql(self, sum_columns=()):
+        """Makes a query for the total row count of the report, followed by
+        the totals of each of the columns in sum_columns.
+
+        """
+        sums = "".join(
+            ", SUM(CAST(CAST(%s AS TEXT) AS NUMERIC))" % _quote_name(column)
+            for column in sum_columns)
+        sql = "SELECT COUNT(*)%s FROM (%s) AS foo %s" % (sums, self.sql,
+                                                         self.wherestring())
         return sql
 
     def wherestring(self):
@@ -439,3 +468,8 @@ class ReportConfig(object):
 
         sort = [_transform(s) for s in self.order_by]
         return " ORDER BY %s" % ",".join(sort) if sort else ""
+
+
+def _quote_name(name):
+    """Quotes a column name for use as an SQL identifier"""
+    return '"%s"' % name.replace('"', '""')
@@ -53,11 +53,17 @@ class Report(object):
         self.offset = int(str(self.set_offset(configuration.offset)))
 
         # oh, the smell, it kills me!
-        if self.limit:
+        self.paged = database.paged
+        self.streaming = database.streaming
+        if self.paged or self.streaming:
+            # the database has already done the slicing for us
+            self.formatted = database.result
+        elif self.limit:
             self.formatted = database.result[self.offset:self.limit+self.offset]
         else:
             self.formatted = database.result
         self.dbresult = database.result
+        self.totals = database.totals
 
         self.query_args = self.strip_pagination_arguments(query_dict)
 
@@ -78,9 +84,13 @@ class Report(object):
 
         self.uri = self.remake_uri(self.uri)
 
-        self.table = self.make_table_contents()
-        footers = self.make_table_footers(self.sums)
-        self.table.set_footers(footers)
+        if self.streaming:
+            # rows can only be consumed once, using iter_table_rows()
+            self.table = Table()
+        else:
+            self.table = self.make_table_contents()
+            footers = self.make_table_footers(self.sums)
+            self.table.set_footers(footers)
         headers = self.make_table_headers(self.name, self.explain,
                                           configuration.order_by)
         self.table.set_headers(headers)
@@ -228,9 +238,14 @@ class Report(object):
                         part_sum += int(str(fmt[footer]))
 
                 total_sum = 0
-                for res in self.dbresult:
-                    if res[footer] is not None:
-                        total_sum += int(str(res[footer]))
+                if self.paged:
+                    total = (self.totals or {}).get(title)
+                    if total is not None:
+                        total_sum = int(total)
+                else:
+                    for res in self.dbresult:
+                        if res[footer] is not None:
+                            total_sum += int(str(res[footer]))
 
                 if part_sum == total_sum:
                     this_sum.set_sum(str(part_sum))
@@ -265,10 +280,19 @@ class Report(object):
         :returns: a table containing the data of the report (without header
                   and footer etc)
 
+        """
+        newtable = Table()
+        newtable.extend(self.iter_table_rows())
+        return newtable
+
+    def iter_table_rows(self):
+        """Generates the rows of the table of the report, one at a time.
+
+        :returns: a generator of Row objects
+
         """
         link_pattern = re.compile(r"\$(.+?)(?:$|\$|&|\"|\'|\s|;|/)", re.M)
 
-        newtable = Table()
         for line in self.formatted:
 
             newline = Row()
@@ -308,9 +332,7 @@ class Report(object):
 
                 newline.append(newfield)
 
-            newtable.append(newline)
-
-        return newtable
+            yield newline
 
     def make_form(self, name):
         form = []
@@ -20,6 +20,8 @@
 #
 """
 This module provides a threadpool and fair scheduling.
+
+The event loop based alternative is found in nav.statemon.asyncrunner.
 """
 from __future__ import absolute_import
 
@@ -92,9 +94,21 @@ class Worker(threading.Thread):
 
 # pylint: disable=invalid-name
 def RunQueue(*args, **kwargs):
-    """Instantiates or retrieves the RunQueue singleton"""
+    """Instantiates or retrieves the RunQueue singleton.
+
+    Depending on the 'checker runtime' configuration option, this is either
+    an AsyncRunQueue, which runs checkers in an event loop, or a thread pool
+    based _RunQueue.
+
+    """
     if getattr(_RunQueue, '_instance') is None:
-        setattr(_RunQueue, '_instance', _RunQueue(*args, **kwargs))
+        runtime = config.serviceconf().get('checker runtime', 'async')
+        if runtime == 'threads':
+            instance = _RunQueue(*args, **kwargs)
+        else:
+            from .asyncrunner import AsyncRunQueue
+            instance = AsyncRunQueue(*args, **kwargs)
+        setattr(_RunQueue, '_instance', instance)
     return getattr(_RunQueue, '_instance')
 
 
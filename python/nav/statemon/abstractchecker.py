@@ -63,6 +63,8 @@ class AbstractChecker(object):
         return Event.UP, version
     """
     IPV6_SUPPORT = False
+    # Set to True by checkers that implement execute_async()
+    ASYNC_SUPPORT = False
     DESCRIPTION = ""
     ARGS = ()
     OPTARGS = ()
@@ -105,6 +107,14 @@ class AbstractChecker(object):
         """
         orig_version = self.version
         status, info = self.execute_test()
+        self.process_result(orig_version, status, info)
+
+    def process_result(self, orig_version, status, info):
+        """
+        Processes the result of a test: Schedules a new test if the status
+        has changed, posts events for changed status or version, and updates
+        metrics.
+        """
         service = "%s:%s" % (self.sysname, self.get_type())
         LOGGER.info("%-20s -> %s", service, info)
 
@@ -196,6 +206,17 @@ class AbstractChecker(object):
         """Executes the actual service test implemented by a plugin"""
         raise NotImplementedError
 
+    def execute_async(self):
+        """
+        Executes the actual service test without blocking, if supported by
+        the plugin (see ASYNC_SUPPORT).
+
+        :returns: A Twisted deferred that fires with a (status, info) tuple,
+                  like the return value of execute().
+
+        """
+        raise NotImplementedError
+
     @property
     def sysname(self):
         """Returns the sysname of which this service is running on.
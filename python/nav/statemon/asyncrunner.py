@@ -0,0 +1,177 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.  You should have received a copy of the GNU General Public License
+# along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""An event loop based runtime for service checkers.
+
+Checkers are run by a Twisted reactor, running in a separate thread from the
+servicemon main loop. Checkers that support it are run as non-blocking
+coroutines, so thousands of checks can be in progress without a thread each.
+Legacy checkers, whose tests are blocking, are run in a bounded thread pool.
+
+Every check has a deadline, and the number of checks in progress at any time
+is limited by a global concurrency limit. Check results are processed in the
+thread pool too, since posting events and sending metrics may block.
+
+The AsyncRunQueue has the same interface as the threaded RunQueue, so
+checkers are enqueued and rescheduled the same way regardless of runtime.
+
+"""
+import logging
+import threading
+import time
+
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+from . import config, event
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 200
+DEFAULT_MAX_THREADS = 20
+# Grace time added to a checker's own timeout before a check is abandoned
+DEADLINE_GRACE = 1
+
+
+class AsyncRunQueue(object):
+    """Runs service checkers in a Twisted reactor thread"""
+
+    def __init__(self, clock=reactor, **kwargs):
+        self.conf = config.serviceconf()
+        self.clock = clock
+        self.max_concurrent = int(self.conf.get('max concurrent',
+                                                DEFAULT_MAX_CONCURRENT))
+        LOGGER.info("Setting max concurrent=%i", self.max_concurrent)
+        self.max_threads = int(self.conf.get('maxthreads',
+                                             DEFAULT_MAX_THREADS))
+        LOGGER.info("Setting maxthreads=%i", self.max_threads)
+        self._controller = kwargs.get('controller', self)
+        self.semaphore = defer.DeferredSemaphore(self.max_concurrent)
+        self.threadpool = ThreadPool(0, self.max_threads, name='checker')
+        self.running = 0
+        self._thread = None
+
+    def start(self):
+        """Starts the thread pool and the reactor thread, unless running"""
+        if self._thread is not None:
+            return
+        self.threadpool.start()
+        self._thread = threading.Thread(
+            target=self.clock.run, kwargs={'installSignalHandlers': False},
+            name='reactor')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def enq(self, runnable):
+        """
+        Enqueues a checker to be run. It accepts a checker, or a tuple
+        containing (timestamp, checker). If given in the last form, the
+        checker will be run as quickly as possible after time timestamp has
+        occured.
+
+        May be called from any thread.
+        """
+        self.start()
+        if isinstance(runnable, tuple):
+            timestamp, checker = runnable
+            self.clock.callFromThread(self._schedule, timestamp, checker)
+        else:
+            self.clock.callFromThread(self.run_checker, runnable)
+
+    def _schedule(self, timestamp, checker):
+        delay = max(timestamp - time.time(), 0)
+        self.clock.callLater(delay, self.run_checker, checker)
+
+    def run_checker(self, checker):
+        """
+        Runs a checker as soon as the concurrency limit allows it.
+
+        :returns: A deferred that fires when the checker has finished and its
+                  result has been processed.
+
+        """
+        deferred = self.semaphore.run(self._execute_test, checker)
+        deferred.addCallback(self._defer_to_thread, self._process_result,
+                             checker)
+        deferred.addErrback(self._log_failure, checker)
+        return deferred
+
+    def _execute_test(self, checker):
+        """Executes and times the test of a checker"""
+        self.running += 1
+        orig_version = checker.version
+        start = time.time()
+        if checker.ASYNC_SUPPORT:
+            deferred = defer.maybeDeferred(checker.execute_async)
+        else:
+            deferred = threads.deferToThreadPool(self.clock, self.threadpool,
+                                                 checker.execute)
+        deferred = with_deadline(deferred, checker.timeout + DEADLINE_GRACE,
+                                 self.clock)
+
+        def _timed(result):
+            self.running -= 1
+            checker.response_time = time.time() - start
+            return result
+
+        deferred.addErrback(_failed_result)
+        deferred.addCallback(_timed)
+        deferred.addCallback(lambda result: (orig_version, result))
+        return deferred
+
+    def _defer_to_thread(self, result, func, *args):
+        return threads.deferToThreadPool(self.clock, self.threadpool, func,
+                                         result, *args)
+
+    @staticmethod
+    def _process_result(result, checker):
+        orig_version, (status, info) = result
+        checker.process_result(orig_version, status, info)
+
+    @staticmethod
+    def _log_failure(failure, checker):
+        LOGGER.error("Unhandled error while running checker %r: %s",
+                     checker, failure.getTraceback())
+
+    def terminate(self):
+        """Stops the reactor and the thread pool"""
+        if self._thread is None:
+            return
+        LOGGER.info("Stopping checker runtime, %i checks in progress",
+                    self.running)
+        self.clock.callFromThread(self.clock.stop)
+        self._thread.join()
+        self.threadpool.stop()
+        LOGGER.info("Checker runtime has finished")
+
+
+def with_deadline(deferred, timeout, clock=reactor):
+    """Cancels a deferred if it hasn't fired within timeout seconds"""
+    call = clock.callLater(timeout, deferred.cancel)
+
+    def _cancel_deadline(result):
+        if call.active():
+            call.cancel()
+        return result
+
+    return deferred.addBoth(_cancel_deadline)
+
+
+def _failed_result(failure):
+    """Converts a failed test to a (status, info) tuple"""
+    if failure.check(defer.CancelledError):
+        return event.Event.DOWN, "Timed out"
+    return event.Event.DOWN, failure.getErrorMessage()
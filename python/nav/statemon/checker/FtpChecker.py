@@ -17,6 +17,9 @@
 import socket
 import ftplib
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
 from nav.statemon.event import Event
 
@@ -30,6 +33,7 @@ class FtpChecker(AbstractChecker):
         ('path', ''),
     )
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
 
     def __init__(self, service, **kwargs):
         AbstractChecker.__init__(self, service, port=0, **kwargs)
@@ -38,25 +42,61 @@ class FtpChecker(AbstractChecker):
         session = FTP(self.timeout)
         ip, port = self.get_address()
         output = session.connect(ip, port or 21)
+        self._parse_welcome(session.welcome)
+
+        username = self.args.get('username', '')
+        password = self.args.get('password', '')
+        path = self.args.get('path', '')
+        output = session.login(username, password, path)
+        return self._handle_login(output)
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        ip, port = self.get_address()
+        client = yield lineclient.connect(ip, port or 21, self.timeout)
+        try:
+            welcome = yield client.read_numeric_reply()
+            self._parse_welcome('\n'.join(welcome))
+
+            # Same defaults as ftplib.FTP.login
+            username = self.args.get('username', '') or 'anonymous'
+            password = self.args.get('password', '')
+            path = self.args.get('path', '')
+            if username == 'anonymous' and password in ('', '-'):
+                password = password + 'anonymous@'
 
+            output = yield _command(client, 'USER ' + username)
+            if output[0].startswith('3'):
+                output = yield _command(client, 'PASS ' + password)
+            if output[0].startswith('3'):
+                output = yield _command(client, 'ACCT ' + path)
+            client.write_line('QUIT')
+        finally:
+            client.close()
+        defer.returnValue(self._handle_login('\n'.join(output)))
+
+    def _parse_welcome(self, welcome):
         # Get server version from the banner.
         version = ''
-        for line in session.welcome.split('\n'):
+        for line in welcome.split('\n'):
             if line.startswith('220 '):
                 version = line[4:].strip()
         self.version = version
 
-        username = self.args.get('username', '')
-        password = self.args.get('password', '')
-        path = self.args.get('path', '')
-        output = session.login(username, password, path)
-
+    @staticmethod
+    def _handle_login(output):
         if output[:3] == '230':
             return Event.UP, 'code 230'
         else:
             return Event.DOWN, output.split('\n')[0]
 
 
+def _command(client, command):
+    """Sends an FTP command and returns a deferred reply"""
+    client.write_line(command)
+    return client.read_numeric_reply()
+
+
 # pylint: disable=R0913,W0221,R0904
 class FTP(ftplib.FTP):
     """Customized FTP protocol interface"""
@@ -14,8 +14,13 @@
 # License along with NAV. If not, see <http://www.gnu.org/licenses/>.
 #
 """HTTP Service Checker"""
+from base64 import b64encode
+
+from twisted.internet import defer
+
 from nav import buildconf
 
+from nav.statemon import lineclient
 from nav.statemon.event import Event
 from nav.statemon.abstractchecker import AbstractChecker
 from urlparse import urlsplit
@@ -38,6 +43,7 @@ class HTTPConnection(httplib.HTTPConnection):
 class HttpChecker(AbstractChecker):
     """HTTP"""
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
     DESCRIPTION = "HTTP"
     OPTARGS = (
         ('url', ''),
@@ -47,6 +53,7 @@ class HttpChecker(AbstractChecker):
         ('timeout', ''),
     )
     PORT = 80
+    TLS = False
 
     def __init__(self, service, **kwargs):
         AbstractChecker.__init__(self, service, port=0, **kwargs)
@@ -54,22 +61,26 @@ class HttpChecker(AbstractChecker):
     def connect(self, ip, port):
         return HTTPConnection(self.timeout, ip, port)
 
-    def execute(self):
-        ip, port = self.get_address()
+    def _get_request(self):
         url = self.args.get('url', '')
         username = self.args.get('username')
         password = self.args.get('password', '')
         if not url:
             url = "/"
         _protocol, vhost, path, query, _fragment = urlsplit(url)
+        if '?' in url:
+            path = path + '?' + query
+        return url, vhost, path, username, password
+
+    def execute(self):
+        ip, port = self.get_address()
+        url, vhost, path, username, password = self._get_request()
 
         i = self.connect(ip, port or self.PORT)
 
         if vhost:
             i.host = vhost
 
-        if '?' in url:
-            path = path + '?' + query
         i.putrequest('GET', path)
         i.putheader('User-Agent',
                     'NAV/servicemon; version %s' % buildconf.VERSION)
@@ -78,13 +89,63 @@ class HttpChecker(AbstractChecker):
             i.putheader("Authorization", "Basic %s" % auth.encode("base64"))
         i.endheaders()
         response = i.getresponse()
-        if 200 <= response.status < 400 or (response.status == 401 and not username):
+        return self._handle_response(response.status,
+                                     response.getheader('SERVER'),
+                                     url, username)
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        ip, port = self.get_address()
+        url, vhost, path, username, password = self._get_request()
+        port = port or self.PORT
+
+        host = vhost or ('[%s]' % ip if ':' in ip else ip)
+        if not vhost and port != self.PORT:
+            host = '%s:%s' % (host, port)
+        request = [
+            'GET %s HTTP/1.1' % (path or '/'),
+            'Host: %s' % host,
+            'User-Agent: NAV/servicemon; version %s' % buildconf.VERSION,
+            'Connection: close',
+        ]
+        if username:
+            auth = "%s:%s" % (username, password)
+            request.append("Authorization: Basic %s" % b64encode(
+                auth.encode('utf-8')).decode('ascii'))
+        request.append('')
+
+        client = yield lineclient.connect(ip, port, self.timeout,
+                                          tls=self.TLS)
+        try:
+            for line in request:
+                client.write_line(line)
+            status_line = yield client.read_line()
+            headers = yield client.read_reply(lambda line: not line)
+        finally:
+            client.close()
+
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            defer.returnValue((Event.DOWN,
+                               'Bad status line: %r' % status_line))
+        server = None
+        for header in headers:
+            name, _, value = header.partition(':')
+            if name.strip().lower() == 'server':
+                server = value.strip()
+        defer.returnValue(self._handle_response(status, server, url,
+                                                username))
+
+    def _handle_response(self, response_status, server, url, username):
+        if (200 <= response_status < 400
+                or (response_status == 401 and not username)):
             status = Event.UP
-            version = response.getheader('SERVER')
+            version = server
             self.version = version
-            info = 'OK (%s) %s' % (str(response.status), version)
+            info = 'OK (%s) %s' % (str(response_status), version)
         else:
             status = Event.DOWN
-            info = 'ERROR (%s) %s' % (str(response.status), url)
+            info = 'ERROR (%s) %s' % (str(response_status), url)
 
         return status, info
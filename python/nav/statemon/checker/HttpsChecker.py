@@ -20,6 +20,7 @@ import socket
 
 from ssl import wrap_socket
 
+from nav.statemon import lineclient
 from nav.statemon.checker.HttpChecker import HttpChecker
 
 
@@ -38,7 +39,9 @@ class HTTPSConnection(httplib.HTTPSConnection):
 
 class HttpsChecker(HttpChecker):
     """HTTPS"""
+    ASYNC_SUPPORT = lineclient.TLS_SUPPORT
     PORT = 443
+    TLS = True
 
     def connect(self, ip, port):
         return HTTPSConnection(self.timeout, ip, port)
@@ -18,6 +18,9 @@
 import socket
 import imaplib
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
 from nav.statemon.event import Event
 
@@ -43,6 +46,7 @@ class ImapChecker(AbstractChecker):
     password
     """
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
     DESCRIPTION = "Internet mail application protocol"
     ARGS = (
         ('username', ''),
@@ -65,14 +69,60 @@ class ImapChecker(AbstractChecker):
         if user:
             session.login(user, passwd)
             session.logout()
-        version = ''
-        ver = ver.split(' ')
-        if len(ver) >= 2:
-            for i in ver[2:]:
-                if i != "at":
-                    version += "%s " % i
-                else:
-                    break
-        self.version = version
-
-        return Event.UP, version
+        self.version = parse_version(ver)
+
+        return Event.UP, self.version
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        user = self.args.get("username", "")
+        ip, port = self.get_address()
+        passwd = self.args.get("password", "")
+        ver = yield check_imap(ip, port, self.timeout, user, passwd)
+        self.version = parse_version(ver)
+
+        defer.returnValue((Event.UP, self.version))
+
+
+def parse_version(welcome):
+    """Returns the server version from an IMAP welcome line"""
+    version = ''
+    ver = welcome.split(' ')
+    if len(ver) >= 2:
+        for i in ver[2:]:
+            if i != "at":
+                version += "%s " % i
+            else:
+                break
+    return version
+
+
+@defer.inlineCallbacks
+def check_imap(ip, port, timeout, user='', passwd='', tls=False):
+    """Connects to an IMAP server and logs in, if a user is given.
+
+    :returns: A deferred that fires with the welcome line of the server.
+    :raises imaplib.IMAP4.error: if the server does not greet or log in
+                                 the user.
+
+    """
+    client = yield lineclient.connect(ip, port, timeout, tls=tls)
+    try:
+        welcome = yield client.read_line()
+        if not welcome.startswith(('* OK', '* PREAUTH')):
+            raise imaplib.IMAP4.error(welcome)
+        if user:
+            client.write_line("A001 LOGIN %s %s" % (_quote(user),
+                                                    _quote(passwd)))
+            lines = yield client.read_reply(
+                lambda line: line.startswith('A001 '))
+            if not lines[-1].startswith('A001 OK'):
+                raise imaplib.IMAP4.error(lines[-1])
+            client.write_line("A002 LOGOUT")
+    finally:
+        client.close()
+    defer.returnValue(welcome)
+
+
+def _quote(arg):
+    return '"%s"' % arg.replace('\\', '\\\\').replace('"', '\\"')
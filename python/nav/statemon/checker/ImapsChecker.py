@@ -18,13 +18,18 @@
 import socket
 import imaplib
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
+from nav.statemon.checker.ImapChecker import check_imap, parse_version
 from nav.statemon.event import Event
 
 
 class ImapsChecker(AbstractChecker):
     """Internet mail application protocol (ssl)"""
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = lineclient.TLS_SUPPORT
     DESCRIPTION = "Internet mail application protocol (ssl)"
     ARGS = (
         ('username', ''),
@@ -47,17 +52,19 @@ class ImapsChecker(AbstractChecker):
         if user:
             session.login(user, passwd)
             session.logout()
-        version = ''
-        ver = ver.split(' ')
-        if len(ver) >= 2:
-            for i in ver[2:]:
-                if i != "at":
-                    version += "%s " % i
-                else:
-                    break
-        self.version = version
-
-        return Event.UP, version
+        self.version = parse_version(ver)
+
+        return Event.UP, self.version
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        user = self.args.get("username", "")
+        ip, port = self.get_address()
+        passwd = self.args.get("password", "")
+        ver = yield check_imap(ip, port, self.timeout, user, passwd, tls=True)
+        self.version = parse_version(ver)
+
+        defer.returnValue((Event.UP, self.version))
 
 
 # pylint: disable=R0904
@@ -17,6 +17,9 @@
 import socket
 import poplib
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
 from nav.statemon.event import Event
 
@@ -24,6 +27,7 @@ from nav.statemon.event import Event
 class Pop3Checker(AbstractChecker):
     """Post office protocol"""
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
     DESCRIPTION = "Post office protocol"
     ARGS = (
         ('username', ''),
@@ -48,6 +52,27 @@ class Pop3Checker(AbstractChecker):
             conn.pass_(passwd)
             len(conn.list()[1])
             conn.quit()
+        return self._handle_welcome(ver)
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        user = self.args.get("username", "")
+        passwd = self.args.get("password", "")
+        ip, port = self.get_address()
+        client = yield lineclient.connect(ip, port, self.timeout)
+        try:
+            ver = yield _command(client)
+            if user:
+                yield _command(client, "USER %s" % user)
+                yield _command(client, "PASS %s" % passwd)
+                yield _command(client, "LIST")
+                yield client.read_reply(lambda line: line == '.')
+                client.write_line("QUIT")
+        finally:
+            client.close()
+        defer.returnValue(self._handle_welcome(ver))
+
+    def _handle_welcome(self, ver):
         version = ''
         ver = ver.split(' ')
         if len(ver) >= 1:
@@ -61,6 +86,21 @@ class Pop3Checker(AbstractChecker):
         return Event.UP, version
 
 
+@defer.inlineCallbacks
+def _command(client, command=None):
+    """Sends a POP3 command, unless None, and reads the response.
+
+    :raises poplib.error_proto: if the response is an error.
+
+    """
+    if command:
+        client.write_line(command)
+    response = yield client.read_line()
+    if not response.startswith('+'):
+        raise poplib.error_proto(response)
+    defer.returnValue(response)
+
+
 class PopConnection(poplib.POP3):
     """Customized POP3 protocol interface"""
     # pylint: disable=W0231
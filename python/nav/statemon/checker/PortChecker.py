@@ -17,6 +17,9 @@
 import select
 import socket
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
 from nav.statemon.event import Event
 
@@ -24,6 +27,7 @@ from nav.statemon.event import Event
 class PortChecker(AbstractChecker):
     """Generic TCP port checker"""
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
     DESCRIPTION = "Generic port checker"
     ARGS = (
         ('port', ''),
@@ -43,3 +47,10 @@ class PortChecker(AbstractChecker):
         sock.close()
 
         return status, txt
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        ip, port = self.get_address()
+        client = yield lineclient.connect(ip, port, self.timeout)
+        client.close()
+        defer.returnValue((Event.UP, 'Alive'))
@@ -18,6 +18,9 @@ import re
 import socket
 import smtplib
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
 from nav.statemon.event import Event
 
@@ -25,6 +28,7 @@ from nav.statemon.event import Event
 class SmtpChecker(AbstractChecker):
     """SMTP"""
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
     DESCRIPTION = "Simple mail transport protocol"
     OPTARGS = (
         ('port', ''),
@@ -44,6 +48,21 @@ class SmtpChecker(AbstractChecker):
             smtp.quit()
         except smtplib.SMTPException:
             pass
+        return self._handle_greeting(code, msg)
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        ip, port = self.get_address()
+        client = yield lineclient.connect(ip, port, self.timeout)
+        try:
+            lines = yield client.read_numeric_reply()
+            client.write_line("QUIT")
+        finally:
+            client.close()
+        code, msg = parse_reply(lines)
+        defer.returnValue(self._handle_greeting(code, msg))
+
+    def _handle_greeting(self, code, msg):
         if code != 220:
             return Event.DOWN, msg
         try:
@@ -57,6 +76,21 @@ class SmtpChecker(AbstractChecker):
         return Event.UP, msg
 
 
+def parse_reply(lines):
+    """Parses the lines of an SMTP reply the same way smtplib does.
+
+    :returns: A (code, message) tuple, where code is -1 if the reply was
+              malformed.
+
+    """
+    try:
+        code = int(lines[-1][:3])
+    except ValueError:
+        code = -1
+    msg = "\n".join(line[4:].strip() for line in lines)
+    return code, msg
+
+
 # pylint: disable=R0904
 class SMTP(smtplib.SMTP):
     """A customized SMTP protocol interface"""
@@ -18,6 +18,9 @@
 
 import socket
 
+from twisted.internet import defer
+
+from nav.statemon import lineclient
 from nav.statemon.abstractchecker import AbstractChecker
 from nav.statemon.event import Event
 
@@ -25,6 +28,7 @@ from nav.statemon.event import Event
 class SshChecker(AbstractChecker):
     """Checks for SSH availability"""
     IPV6_SUPPORT = True
+    ASYNC_SUPPORT = True
     DESCRIPTION = "Secure shell server"
     OPTARGS = (
         ('port', ''),
@@ -51,3 +55,23 @@ class SshChecker(AbstractChecker):
         sock.close()
         self.version = version
         return Event.UP, version
+
+    @defer.inlineCallbacks
+    def execute_async(self):
+        ip, port = self.get_address()
+        client = yield lineclient.connect(ip, port, self.timeout)
+        try:
+            version = (yield client.read_line()).strip()
+            try:
+                protocol, major = version.split('-')[:2]
+            except ValueError as err:
+                defer.returnValue((
+                    Event.DOWN,
+                    "Failed to send version reply to %s: %s" % (
+                        self.get_address(), str(err))))
+            client.write_line("%s-%s-%s" % (protocol, major,
+                                            "NAV_Servicemon"))
+        finally:
+            client.close()
+        self.version = version
+        defer.returnValue((Event.UP, version))
@@ -34,18 +34,35 @@ from collections import defaultdict
 import logging
 
 import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from psycopg2.errorcodes import IN_FAILED_SQL_TRANSACTION
 from psycopg2.errorcodes import lookup as pg_err_lookup
 
 from nav.db import get_connection_string
 from nav.util import synchronized
 
-from . import checkermap
+from . import checkermap, statistics
 from .event import Event
 
 
 LOGGER = logging.getLogger(__name__)
 
+# PostgreSQL notification channels used to signal changes to the netboxes
+# and services being monitored. The payload of each notification is the id
+# of the changed netbox or service.
+NETBOX_CHANNEL = 'netbox_changed'
+SERVICE_CHANNEL = 'service_changed'
+
+# How often to reload everything, regardless of change notifications
+DEFAULT_RESYNC_INTERVAL = 1800
+
+# The maximum number of queued events to post in a single transaction
+EVENT_BATCH_SIZE = 500
+# How long to wait before retrying a batch of events that failed to post
+EVENT_RETRY_DELAY = 5
+# Errors that may go away by retrying on a new connection
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
 
 def db():
     """Returns a db singleton"""
@@ -135,20 +152,56 @@ class _DB(threading.Thread):
         return cursor
 
     def run(self):
-        """Runs the event posting loop, popping events from the queue"""
+        """Runs the event posting loop, popping batches of events from the
+        queue.
+        """
         self.connect()
+        pending = []
         while 1:
-            event = self.queue.get()
-            LOGGER.debug("Got event: [%s]", event)
+            events = self.get_event_batch(pending)
+            queue_length = len(events) + self.queue.qsize()
+            LOGGER.debug("Got %d events, %d queued", len(events),
+                         queue_length)
+            start = time.time()
             try:
-                self.commit_event(event)
-                self.db.commit()
+                self.commit_events(events)
             except Exception:
-                # If we fail to commit the event, place it
-                # back in our queue
-                LOGGER.debug("Failed to commit event, rescheduling...")
-                self.new_event(event)
-                time.sleep(5)
+                # Events are only left uncommitted if the database connection
+                # failed, so retry them, in order, before any newer events
+                LOGGER.debug("Failed to commit %d events, rescheduling...",
+                             len(events))
+                pending = events
+                time.sleep(EVENT_RETRY_DELAY)
+                continue
+            pending = []
+            self._send_queue_metrics(events[0].source, queue_length,
+                                     len(events), time.time() - start)
+
+    def get_event_batch(self, pending=()):
+        """
+        Returns a batch of up to EVENT_BATCH_SIZE events, starting with any
+        pending events, and followed by events popped from the queue. Blocks
+        until at least one event is available.
+
+        """
+        events = list(pending)
+        if not events:
+            events.append(self.queue.get())
+        while len(events) < EVENT_BATCH_SIZE:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    @staticmethod
+    def _send_queue_metrics(source, queue_length, batch_size, latency):
+        try:
+            statistics.send_event_queue_metrics(source, queue_length,
+                                                batch_size, latency)
+        except Exception:
+            LOGGER.debug("Failed to send event queue metrics",
+                         exc_info=True)
 
     @synchronized(_queryLock)
     def query(self, statement, values=None, commit=1):
@@ -213,43 +266,134 @@ class _DB(threading.Thread):
 
     def commit_event(self, event):
         """Commits an event to the database event queue"""
+        self.commit_events([event])
+
+    @synchronized(_queryLock)
+    def commit_events(self, events):
+        """
+        Commits a batch of events to the database event queue, in a single
+        transaction.
+
+        If the batch cannot be posted for any other reason than a connection
+        problem, e.g. because an event refers to a netbox that has since been
+        deleted, the events are posted one at a time instead, and the events
+        that cannot be posted are logged and discarded.
+
+        :raises: Any error that indicates a problem with the database
+                 connection, after rolling back, so that the batch may be
+                 retried.
+
+        """
+        events = [event for event in events if self._is_valid(event)]
+        cursor = self.cursor()
+        try:
+            self._post_events(cursor, events)
+            self.db.commit()
+        except CONNECTION_ERRORS:
+            LOGGER.critical("Failed to post %d events", len(events),
+                            exc_info=True)
+            self._rollback()
+            raise
+        except Exception:  # pylint: disable=W0703
+            LOGGER.warning("Failed to post %d events in one batch, posting "
+                           "them one at a time", len(events), exc_info=True)
+            self._rollback()
+            self._post_events_one_at_a_time(cursor, events)
+
+    @staticmethod
+    def _is_valid(event):
         if event.source not in ("serviceping", "pping"):
             LOGGER.critical("Invalid source for event: %s", event.source)
-            return
-        if event.eventtype == "version":
-            statement = """UPDATE service SET version = %s
-                           WHERE serviceid = %s"""
-            self.execute(statement, (event.version, event.serviceid))
-            return
-
-        if event.status == Event.UP:
-            value = 100
-            state = 'e'
-        elif event.status == Event.DOWN:
-            value = 1
-            state = 's'
-        else:
-            value = 1
-            state = 'x'
-
-        nextid = self.query("SELECT nextval('eventq_eventqid_seq')")[0][0]
-        statement = """INSERT INTO eventq
-                       (eventqid, subid, netboxid, eventtypeid,
-                        state, value, source, target)
-                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
-        values = (nextid, event.serviceid, event.netboxid,
-                  event.eventtype, state, value, event.source, "eventEngine")
-        self.execute(statement, values)
-
-        statement = """INSERT INTO eventqvar
-                       (eventqid, var, val) VALUES
-                       (%s, %s, %s)"""
-        values = (nextid, 'descr', event.info)
-        self.execute(statement, values)
-
-    def hosts_to_ping(self):
-        """Returns a list of netboxes to ping, from the database"""
+            return False
+        return True
+
+    def _post_events(self, cursor, events):
+        states = []
+        for event in events:
+            if event.eventtype == "version":
+                self._update_version(cursor, event)
+            else:
+                states.append(event)
+        if states:
+            self._insert_events(cursor, states)
+
+    def _post_events_one_at_a_time(self, cursor, events):
+        try:
+            for event in events:
+                cursor.execute("SAVEPOINT statemon_event")
+                try:
+                    self._post_events(cursor, [event])
+                except CONNECTION_ERRORS:
+                    raise
+                except Exception:  # pylint: disable=W0703
+                    LOGGER.error("Discarding event that could not be posted: "
+                                 "%s", event, exc_info=True)
+                    cursor.execute("ROLLBACK TO SAVEPOINT statemon_event")
+                cursor.execute("RELEASE SAVEPOINT statemon_event")
+            self.db.commit()
+        except Exception:
+            LOGGER.critical("Failed to post %d events", len(events),
+                            exc_info=True)
+            self._rollback()
+            raise
+
+    def _rollback(self):
+        try:
+            self.db.rollback()
+        except Exception:
+            LOGGER.critical("Failed to rollback")
+
+    @staticmethod
+    def _update_version(cursor, event):
+        statement = """UPDATE service SET version = %s
+                       WHERE serviceid = %s"""
+        cursor.execute(statement, (event.version, event.serviceid))
+
+    @staticmethod
+    def _insert_events(cursor, events):
+        cursor.execute("""SELECT nextval('eventq_eventqid_seq')
+                          FROM generate_series(1, %s)""", (len(events),))
+        ids = [row[0] for row in cursor.fetchall()]
+
+        eventq = []
+        eventqvar = []
+        for eventqid, event in zip(ids, events):
+            if event.status == Event.UP:
+                value = 100
+                state = 'e'
+            elif event.status == Event.DOWN:
+                value = 1
+                state = 's'
+            else:
+                value = 1
+                state = 'x'
+            eventq.append(cursor.mogrify(
+                "(%s, %s, %s, %s, %s, %s, %s, %s)",
+                (eventqid, event.serviceid, event.netboxid, event.eventtype,
+                 state, value, event.source, "eventEngine")))
+            eventqvar.append(cursor.mogrify(
+                "(%s, %s, %s)", (eventqid, 'descr', event.info)))
+
+        cursor.execute(b"""INSERT INTO eventq
+                           (eventqid, subid, netboxid, eventtypeid,
+                            state, value, source, target)
+                           VALUES """ + b", ".join(eventq))
+        cursor.execute(b"""INSERT INTO eventqvar
+                           (eventqid, var, val)
+                           VALUES """ + b", ".join(eventqvar))
+
+    def hosts_to_ping(self, netboxids=None):
+        """Returns a list of netboxes to ping, from the database.
+
+        :param netboxids: If given, only the netboxes with these ids are
+                          returned, and a DbError is raised if the database
+                          query fails.
+
+        """
         query = """SELECT netboxid, sysname, ip, up FROM netbox """
+        if netboxids is not None:
+            query += "WHERE netboxid IN %s"
+            return self.query(query, (tuple(netboxids) or (None,),))
         try:
             self._hosts_to_ping = self.query(query)
         except DbError:
@@ -262,15 +406,42 @@ class _DB(threading.Thread):
         service handler registry.
 
         """
-        query = """SELECT serviceid, property, value
-        FROM serviceproperty
-        order BY serviceid"""
-
-        properties = defaultdict(dict)
         try:
-            dbprops = self.query(query)
+            self._checkers = self.load_checkers(use_db_status, onlyactive)
         except DbError:
             return self._checkers
+        LOGGER.info("Returned %s checkers", len(self._checkers))
+        return self._checkers
+
+    def load_checkers(self, use_db_status, onlyactive=1, serviceids=None,
+                      netboxids=None):
+        """
+        Returns a list of service checker instances based on the database
+        service handler registry, raising a DbError if the database cannot be
+        queried.
+
+        :param serviceids: If given, only the services with these ids, or
+                           running on the netboxes in netboxids, are loaded.
+        :param netboxids: If given, only the services running on the
+                          netboxes with these ids, or having ids listed in
+                          serviceids, are loaded.
+
+        """
+        where = ""
+        values = None
+        if serviceids is not None or netboxids is not None:
+            where = """WHERE service.serviceid IN %s
+                       OR service.netboxid IN %s"""
+            values = (tuple(serviceids or ()) or (None,),
+                      tuple(netboxids or ()) or (None,))
+
+        query = """SELECT serviceid, property, value
+        FROM serviceproperty JOIN service USING (serviceid)
+        {where}
+        order BY serviceid""".format(where=where)
+
+        properties = defaultdict(dict)
+        dbprops = self.query(query, values)
         for serviceid, prop, value in dbprops:
             if value:
                 properties[serviceid][prop] = value
@@ -278,13 +449,12 @@ class _DB(threading.Thread):
         query = """SELECT serviceid ,service.netboxid,
         service.active, handler, version, ip, sysname, service.up
         FROM service JOIN netbox ON
-        (service.netboxid=netbox.netboxid) order by serviceid"""
-        try:
-            fromdb = self.query(query)
-        except DbError:
-            return self._checkers
+        (service.netboxid=netbox.netboxid)
+        {where}
+        order by serviceid""".format(where=where)
+        fromdb = self.query(query, values)
 
-        self._checkers = []
+        checkers = []
         for (serviceid, netboxid, active, handler, version, ip,
              sysname, upstate) in fromdb:
             checker = checkermap.get(handler)
@@ -321,6 +491,96 @@ class _DB(threading.Thread):
             else:
                 setattr(new_checker, 'active', active)
 
-            self._checkers += [new_checker]
-        LOGGER.info("Returned %s checkers", len(self._checkers))
-        return self._checkers
+            checkers.append(new_checker)
+        return checkers
+
+
+class ChangeListener(object):
+    """
+    Listens for change notifications from the NAV database, on a dedicated
+    connection, so that monitored hosts and services can be reloaded
+    incrementally.
+
+    Changes may go unnoticed if notifications are lost along with a broken
+    connection, so everything is periodically reloaded as a safety net.
+
+    :param channels: The notification channels to listen to.
+    :param script_name: The name of the listening daemon, used to look up
+                        its database connection parameters.
+    :param resync_interval: The number of seconds between full reloads.
+
+    """
+    def __init__(self, channels, script_name,
+                 resync_interval=DEFAULT_RESYNC_INTERVAL):
+        self.channels = channels
+        self.script_name = script_name
+        self.resync_interval = resync_interval
+        self.conn = None
+        self._last_resync = 0
+
+    def get_changes(self):
+        """
+        Returns the changes notified since the last call, as a dict mapping
+        each channel to the set of ids that were changed.
+
+        Returns None if changes may have been missed since the last call, or
+        if it's time for a periodic reload, in which case the caller should
+        reload everything.
+
+        """
+        if self.conn is None:
+            self._listen()
+            return self._resync()
+        try:
+            self.conn.poll()
+        except psycopg2.Error:
+            LOGGER.warning("Lost the change notification connection, "
+                           "reconnecting", exc_info=True)
+            self.close()
+            self._listen()
+            return self._resync()
+
+        if time.time() - self._last_resync >= self.resync_interval:
+            return self._resync()
+
+        changes = defaultdict(set)
+        for notify in self.conn.notifies:
+            try:
+                changes[notify.channel].add(int(notify.payload))
+            except ValueError:
+                LOGGER.debug("Ignoring notification with unknown payload: "
+                             "%r", notify)
+        del self.conn.notifies[:]
+        return changes
+
+    def request_resync(self):
+        """Makes the next call to get_changes() request a full reload"""
+        self._last_resync = 0
+
+    def close(self):
+        """Closes the listening connection"""
+        try:
+            if self.conn:
+                self.conn.close()
+        except psycopg2.InterfaceError:
+            pass
+        self.conn = None
+
+    def _listen(self):
+        try:
+            conn_str = get_connection_string(script_name=self.script_name)
+            self.conn = psycopg2.connect(conn_str)
+            self.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            cursor = self.conn.cursor()
+            for channel in self.channels:
+                cursor.execute('LISTEN ' + channel)
+        except Exception:
+            LOGGER.error("Could not listen for change notifications",
+                         exc_info=True)
+            self.close()
+
+    def _resync(self):
+        if self.conn is not None:
+            del self.conn.notifies[:]
+        self._last_resync = time.time()
+        return None
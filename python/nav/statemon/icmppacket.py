@@ -148,6 +148,36 @@ class PacketV6(Packet):
         super(PacketV6, self).__init__(packet, False)
 
 
+class PacketTemplate(object):
+    """A pre-built echo request, for sending the same payload over and over
+    again with different sequence numbers.
+
+    The one's complement sum of the constant part of the packet is computed
+    once, so that assembling a packet for a new sequence number only needs a
+    single addition to produce the checksum.
+
+    """
+    def __init__(self, packet):
+        """Initializes a template from a Packet instance.
+
+        The packet's current sequence number is ignored.
+
+        """
+        self.type = packet.type
+        self.code = packet.code
+        self.id = packet.id
+        self.data = packet.data
+        self._sum = ones_complement_sum(
+            struct.pack("BBHHH", self.type, self.code, 0, self.id, 0) +
+            self.data)
+
+    def assemble(self, sequence):
+        """Returns a raw ICMP packet string with the given sequence number"""
+        checksum = _fold(self._sum + sequence)
+        return struct.pack("BBHHH", self.type, self.code, checksum, self.id,
+                           sequence) + self.data
+
+
 def inet_checksum(packet):
     """Calculates the checksum of a (ICMP) packet.
 
@@ -156,19 +186,24 @@ def inet_checksum(packet):
 
     Based on in_chksum found in ping.c on FreeBSD.
     """
+    return _fold(ones_complement_sum(packet))
 
+
+def ones_complement_sum(packet):
+    """Returns the unfolded sum of all 16-bit words of a packet, for use in
+    checksum calculations.
+    """
     # add byte if not dividable by 2
     if len(packet) & 1:
         packet = packet + b'\0'
 
     # split into 16-bit word and insert into a binary array
-    words = array.array('h', packet)
-    sum_ = 0
+    words = array.array('H', packet)
+    return sum(words)
 
-    # perform ones complement arithmetic on 16-bit words
-    for word in words:
-        sum_ += (word & 0xffff)
 
+def _fold(sum_):
+    """Folds a 32-bit sum into 16 bits and returns its ones complement"""
     high = sum_ >> 16
     low = sum_ & 0xffff
     sum_ = high + low
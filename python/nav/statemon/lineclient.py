@@ -0,0 +1,182 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.  You should have received a copy of the GNU General Public License
+# along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""A non-blocking client for line based protocols, for asynchronous service
+checkers.
+
+Most of the protocols checked by servicemon (HTTP, SMTP, POP3, IMAP, FTP,
+SSH) are conversations of lines of text. An asynchronous checker connects
+with connect(), and then alternates between writing and reading lines::
+
+  @defer.inlineCallbacks
+  def execute_async(self):
+      client = yield lineclient.connect(self.ip, self.port, self.timeout)
+      banner = yield client.read_line()
+      client.close()
+      defer.returnValue((Event.UP, banner))
+
+Every connection has a deadline. If the conversation isn't finished by then,
+the connection is aborted and any pending read fails with a TimeoutError.
+
+"""
+from collections import deque
+
+from django.utils import six
+from twisted.internet import defer, protocol, reactor
+from twisted.internet.error import TimeoutError
+from twisted.protocols import basic
+from twisted.python.failure import Failure
+
+try:
+    from twisted.internet.ssl import ClientContextFactory
+except ImportError:
+    ClientContextFactory = None
+
+# Whether TLS connections are supported; this requires pyOpenSSL
+TLS_SUPPORT = ClientContextFactory is not None
+
+
+class LineClient(basic.LineReceiver):
+    """A client connection that reads and writes lines of text.
+
+    Lines are read as text, decoded as UTF-8, with line terminators stripped.
+
+    """
+    delimiter = b'\n'
+    MAX_LENGTH = 65536
+
+    def __init__(self):
+        self.lines = deque()
+        self._waiting = None
+        self._reason = None
+        self._timeout_call = None
+
+    def set_deadline(self, timeout, clock=reactor):
+        """Aborts the connection if it is still open after timeout
+        seconds.
+        """
+        self._timeout_call = clock.callLater(timeout, self.timed_out)
+
+    def timed_out(self):
+        """Aborts the connection because its deadline has passed"""
+        self._timeout_call = None
+        self._reason = Failure(TimeoutError("Timed out"))
+        abort = getattr(self.transport, 'abortConnection',
+                        self.transport.loseConnection)
+        abort()
+        self._fail_waiting()
+
+    def lineReceived(self, line):
+        line = line.rstrip(b'\r').decode('utf-8', 'replace')
+        if self._waiting is not None:
+            waiting, self._waiting = self._waiting, None
+            waiting.callback(line)
+        else:
+            self.lines.append(line)
+
+    def lineLengthExceeded(self, line):
+        self._reason = Failure(ValueError("Line too long"))
+        self.transport.loseConnection()
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        if self._reason is None:
+            self._reason = reason
+        if self._timeout_call is not None and self._timeout_call.active():
+            self._timeout_call.cancel()
+        self._timeout_call = None
+        self._fail_waiting()
+
+    def _fail_waiting(self):
+        if self._waiting is not None:
+            waiting, self._waiting = self._waiting, None
+            waiting.errback(self._reason)
+
+    def read_line(self):
+        """Returns a deferred that fires with the next line received"""
+        if self.lines:
+            return defer.succeed(self.lines.popleft())
+        if self._reason is not None:
+            return defer.fail(self._reason)
+        self._waiting = defer.Deferred()
+        return self._waiting
+
+    @defer.inlineCallbacks
+    def read_reply(self, is_last):
+        """Reads a possibly multi-line reply.
+
+        :param is_last: A function that returns True if a line is the last
+                        line of a reply.
+        :returns: A deferred that fires with a list of lines.
+
+        """
+        lines = []
+        while True:
+            line = yield self.read_line()
+            lines.append(line)
+            if is_last(line):
+                defer.returnValue(lines)
+
+    @defer.inlineCallbacks
+    def read_numeric_reply(self):
+        """Reads a possibly multi-line reply with a three-digit reply code,
+        as used by SMTP and FTP.
+
+        :returns: A deferred that fires with a list of lines.
+
+        """
+        line = yield self.read_line()
+        lines = [line]
+        if line[3:4] == '-':
+            last_prefix = line[:3] + ' '
+            more = yield self.read_reply(
+                lambda line: line.startswith(last_prefix))
+            lines.extend(more)
+        defer.returnValue(lines)
+
+    def write_line(self, line):
+        """Writes a line of text, terminated by CRLF"""
+        if isinstance(line, six.text_type):
+            line = line.encode('utf-8')
+        self.transport.write(line + b'\r\n')
+
+    def close(self):
+        """Closes the connection"""
+        self.transport.loseConnection()
+
+
+def connect(host, port, timeout, tls=False, clock=reactor):
+    """Connects to a TCP port.
+
+    :param timeout: The number of seconds the whole connection may last,
+                    including the time it takes to connect.
+    :param tls: Whether to speak TLS over the connection. Server certificates
+                are not verified.
+    :returns: A deferred that fires with a connected LineClient.
+
+    """
+    deadline = clock.seconds() + timeout
+    creator = protocol.ClientCreator(clock, LineClient)
+    if tls:
+        if not TLS_SUPPORT:
+            return defer.fail(RuntimeError("TLS support is not available"))
+        deferred = creator.connectSSL(host, port, ClientContextFactory(),
+                                      timeout=timeout)
+    else:
+        deferred = creator.connectTCP(host, port, timeout=timeout)
+
+    def _connected(client):
+        client.set_deadline(max(deadline - clock.seconds(), 0), clock)
+        return client
+    return deferred.addCallback(_connected)
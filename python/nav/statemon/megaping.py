@@ -14,9 +14,15 @@
 # details.  You should have received a copy of the GNU General Public License
 # along with NAV. If not, see <http://www.gnu.org/licenses/>.
 #
-"""Ping multiple hosts at once."""
+"""Ping multiple hosts at once.
+
+All echo requests are sent, and all replies received, by a single thread
+waiting for socket events. Requests are sent in bursts, at a configurable
+maximum rate of packets per second, so the time it takes to ping all hosts
+is decided by the rate limit rather than by a fixed delay between packets.
+
+"""
 
-import threading
 import time
 import socket
 import select
@@ -24,15 +30,27 @@ import os
 import random
 import logging
 import hashlib
+import errno
 
-from nav.daemon import safesleep as sleep
 from nav.statemon import config
 
-from .icmppacket import ICMP_MINLEN, PacketV4, PacketV6
+from .icmppacket import ICMP_MINLEN, PacketV4, PacketV6, PacketTemplate
 
 
 LOGGER = logging.getLogger(__name__)
 
+# The default delay between requests, in ms, if no rate is configured
+DEFAULT_DELAY = 2
+# The default maximum burst size, in seconds' worth of the rate
+DEFAULT_BURST_TIME = 0.01
+# Errors meaning that the socket send buffer is full
+_SEND_BUFFER_FULL = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS)
+_RECEIVE_QUEUE_EMPTY = (errno.EAGAIN, errno.EWOULDBLOCK)
+# How long to back off when the send buffer is full, in seconds
+SEND_RETRY_DELAY = 0.001
+# The maximum number of replies to read from a socket at a time
+MAX_RECEIVE_BATCH = 1000
+
 
 # pylint: disable=W0703
 def make_sockets():
@@ -83,6 +101,8 @@ class Host(object):
 
         self.packet.id = os.getpid() % 65536
         self.reply = None
+        self.cookie = None
+        self.template = None
 
     def make_packet(self, size, cookie=None):
         """Makes the next echo reply packet"""
@@ -91,6 +111,28 @@ class Host(object):
         self.packet.data = cookie.ljust(size-ICMP_MINLEN)
         return self.packet.assemble(), cookie
 
+    def make_template(self, size):
+        """Pre-builds the echo requests to send to this host.
+
+        Must be called again if the packet id is changed.
+
+        """
+        self.cookie = self.make_cookie()
+        self.packet.data = self.cookie.ljust(size-ICMP_MINLEN)
+        self.template = PacketTemplate(self.packet)
+
+    def get_packet(self):
+        """Returns the echo request for the current sequence number, as
+        built from the packet template.
+        """
+        return self.template.assemble(self.packet.sequence)
+
+    def get_request_key(self):
+        """Returns the (id, sequence) pair identifying the current echo
+        request.
+        """
+        return self.packet.id, self.packet.sequence
+
     def make_cookie(self):
         """Makes and returns a request identifier to be used as data in a ping
         packet.
@@ -139,6 +181,94 @@ class Host(object):
             self.ip, self.packet.sequence)
 
 
+class Poller(object):
+    """Waits for incoming packets on a set of sockets, using epoll where
+    available.
+    """
+    def __init__(self, sockets):
+        self._sockets = dict((sock.fileno(), sock) for sock in sockets)
+        if hasattr(select, 'epoll'):
+            self._epoll = select.epoll()
+            for fileno in self._sockets:
+                self._epoll.register(fileno, select.EPOLLIN)
+        else:
+            self._epoll = None
+
+    def wait(self, timeout):
+        """Returns the list of sockets that have become readable within
+        timeout seconds.
+        """
+        timeout = max(timeout, 0)
+        try:
+            if self._epoll is not None:
+                events = self._epoll.poll(timeout)
+                return [self._sockets[fileno] for fileno, _event in events]
+            readable, _wt, _er = select.select(
+                list(self._sockets.values()), [], [], timeout)
+            return readable
+        except (select.error, IOError, OSError) as error:
+            if error.args and error.args[0] == errno.EINTR:
+                return []
+            raise
+
+
+class TokenBucket(object):
+    """A token bucket rate limiter.
+
+    Tokens are added at a steady rate, up to the capacity of the bucket,
+    which decides the maximum size of a burst.
+
+    """
+    def __init__(self, rate, capacity, now=None):
+        self.rate = float(rate)
+        self.capacity = max(int(capacity), 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.time() if now is None else now
+
+    def take(self, wanted, now):
+        """Takes up to wanted tokens from the bucket, and returns the number
+        of tokens taken.
+        """
+        self._refill(now)
+        count = min(int(self.tokens), wanted)
+        self.tokens -= count
+        return count
+
+    def give_back(self, count):
+        """Returns unused tokens to the bucket"""
+        self.tokens = min(self.tokens + count, self.capacity)
+
+    def time_until_available(self, now):
+        """Returns the number of seconds until a token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def _refill(self, now):
+        elapsed = max(now - self.updated, 0)
+        self.tokens = min(self.tokens + elapsed * self.rate, self.capacity)
+        self.updated = now
+
+
+def get_rate_limits(conf):
+    """Returns the maximum rate, in packets per second, and the maximum burst
+    size configured for pinging.
+
+    If no rate is configured, it is derived from the delay option of older
+    configurations. A rate of None means no limit.
+
+    """
+    rate = float(conf.get('rate', 0))
+    if rate <= 0:
+        delay = float(conf.get('delay', DEFAULT_DELAY))
+        rate = 1000.0 / delay if delay > 0 else None
+    burst = int(conf.get('burst', 0))
+    if burst <= 0 and rate:
+        burst = int(rate * DEFAULT_BURST_TIME)
+    return rate, max(burst, 1)
+
+
 class MegaPing(object):
     """
     Sends icmp echo to multiple hosts in parallell.
@@ -147,8 +277,13 @@ class MegaPing(object):
     pinger.set_hosts(['127.0.0.1','10.0.0.1'])
     timeUsed = pinger.ping()
     results = pinger.results()
+
+    Each host is assigned its own ICMP echo id, and replies are matched to
+    outstanding requests by their (id, sequence) pair. The ids are unique as
+    long as less than 65536 hosts are pinged.
+
     """
-    _requests = _sender = _getter = _sender_finished = None
+    _requests = None
 
     def __init__(self, sockets, conf=None):
 
@@ -162,8 +297,8 @@ class MegaPing(object):
         else:
             self._conf = conf
 
-        # Delay between each packet is transmitted
-        self._delay = float(self._conf.get('delay', 2))/1000  # convert from ms
+        # Maximum number of packets per second, and per burst
+        self._rate, self._burst = get_rate_limits(self._conf)
         # Timeout before considering hosts as down
         self._timeout = int(self._conf.get('timeout', 5))
         # Dictionary with all the hosts, populated by set_hosts()
@@ -175,6 +310,7 @@ class MegaPing(object):
                               "cookie; Must be at least 44.") % packetsize)
         self._packetsize = packetsize
         self._pid = os.getpid() % 65536
+        self._next_id = self._pid
 
         # Global timing of the ppinger
         self._elapsedtime = 0
@@ -193,6 +329,10 @@ class MegaPing(object):
             self._sock4 = sockets[1]
             LOGGER.info("No sockets passed as argument, creating own")
 
+        for sock in (self._sock6, self._sock4):
+            sock.setblocking(False)
+        self._poller = Poller([self._sock6, self._sock4])
+
     def set_hosts(self, ips):
         """
         Specify a list of ip addresses to ping. If we alredy have the host
@@ -203,11 +343,31 @@ class MegaPing(object):
         currenthosts = {}
         for ip in ips:
             if ip not in self._hosts:
-                currenthosts[ip] = Host(ip)
+                currenthosts[ip] = self._make_host(ip)
             else:
                 currenthosts[ip] = self._hosts[ip]
         self._hosts = currenthosts
 
+    def add_hosts(self, ips):
+        """Adds ip addresses to the list of addresses to ping, keeping the
+        hosts already in the list as they are.
+        """
+        for ip in ips:
+            if ip not in self._hosts:
+                self._hosts[ip] = self._make_host(ip)
+
+    def remove_hosts(self, ips):
+        """Removes ip addresses from the list of addresses to ping"""
+        for ip in ips:
+            self._hosts.pop(ip, None)
+
+    def _make_host(self, ip):
+        host = Host(ip)
+        host.packet.id = self._next_id
+        self._next_id = (self._next_id + 1) % 2**16
+        host.make_template(self._packetsize)
+        return host
+
     def reset(self):
         """
         Reset method to clear requests and responses
@@ -215,91 +375,87 @@ class MegaPing(object):
         self._requests = {}
         for host in self._hosts.values():
             host.reply = None
-        self._sender_finished = 0
 
     def ping(self):
         """
         Send icmp echo to all configured hosts. Returns the
         time used.
         """
-        # Start working
         self.reset()
-        self._sender = threading.Thread(target=self._send_requests,
-                                        name="sender")
-        self._getter = threading.Thread(target=self._get_responses,
-                                        name="getter")
-        self._sender.daemon = True
-        self._getter.daemon = True
-        self._sender.start()
-        self._getter.start()
-        self._getter.join()
-        return self._elapsedtime
+        start = time.time()
+        hosts = list(self._hosts.values())
+        bucket = TokenBucket(self._rate, self._burst, start) \
+            if self._rate else None
+        sent = 0
+        deadline = None
+
+        while True:
+            wait = 0
+            if sent < len(hosts):
+                wanted = len(hosts) - sent
+                count = bucket.take(wanted, time.time()) if bucket else wanted
+                handled = self._send_requests(hosts[sent:sent + count])
+                sent += handled
+                if handled < count:
+                    if bucket:
+                        bucket.give_back(count - handled)
+                    wait = SEND_RETRY_DELAY
+                if sent == len(hosts):
+                    LOGGER.debug("Sent %d requests in %03.3f secs", sent,
+                                 time.time() - start)
+                    deadline = time.time() + self._timeout
+
+            if sent < len(hosts):
+                if bucket:
+                    wait = max(wait, bucket.time_until_available(time.time()))
+            elif not self._requests:
+                break
+            else:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    break
 
-    def _send_requests(self):
+            self._get_responses(wait)
 
-        # Get ip addresses to ping
-        hosts = self._hosts.values()
+        self._elapsedtime = time.time() - start
+        return self._elapsedtime
 
-        # Ping each host
-        for host in hosts:
+    def _send_requests(self, hosts):
+        """Sends an echo request to each of hosts, and returns the number of
+        hosts handled before the socket send buffer filled up.
+        """
+        for index, host in enumerate(hosts):
+            packet = host.get_packet()
             host.time = time.time()
-            # create and save a request identifier
-            packet, cookie = host.make_packet(self._packetsize)
-            self._requests[cookie] = host
-            host.next_seq()
-
             try:
                 if not host.is_v6():
                     self._sock4.sendto(packet, (host.ip, 0))
                 else:
                     self._sock6.sendto(packet, (host.ip, 0, 0, 0))
             except Exception as error:
+                if getattr(error, 'errno', None) in _SEND_BUFFER_FULL:
+                    return index
                 LOGGER.info("Failed to ping %s [%s]", host.ip, error)
+            else:
+                self._requests[host.get_request_key()] = host
+            host.next_seq()
+        return len(hosts)
 
-            sleep(self._delay)
-        self._sender_finished = time.time()
-
-    def _get_responses(self):
-        start = time.time()
-        timeout = self._timeout
-
-        while not self._sender_finished or self._requests:
-            if self._sender_finished:
-                runtime = time.time() - self._sender_finished
-                if runtime > self._timeout:
+    def _get_responses(self, timeout):
+        """Waits up to timeout seconds for replies, and processes all replies
+        that have arrived.
+        """
+        for sock in self._poller.wait(timeout):
+            is_ipv6 = sock is self._sock6
+            for _ in range(MAX_RECEIVE_BATCH):
+                try:
+                    raw_pong, sender = sock.recvfrom(4096)
+                except socket.error as error:
+                    if error.args and error.args[0] in _RECEIVE_QUEUE_EMPTY:
+                        break
+                    LOGGER.critical("RealityError -2", exc_info=True)
                     break
-                else:
-                    timeout = self._timeout - runtime
-
-            # Listen for incoming data on sockets
-            readable, _wt, _er = select.select([self._sock6, self._sock4],
-                                               [], [], timeout)
-
-            # If data found
-            if readable:
-                # okay to use time here, because select has told us
-                # there is data and we don't care to measure the time
-                # it takes the system to give us the packet.
-                arrival = time.time()
-
-                # Find out which socket got data and read
-                for sock in readable:
-                    try:
-                        raw_pong, sender = sock.recvfrom(4096)
-                    except socket.error:
-                        LOGGER.critical("RealityError -2", exc_info=True)
-                        continue
-
-                    is_ipv6 = sock == self._sock6
-                    self._process_response(raw_pong, sender, is_ipv6, arrival)
-            elif self._sender_finished:
-                break
-
-        # Everything else timed out
-        for host in self._requests.values():
-            host.reply = None
-        end = time.time()
-        self._elapsedtime = end - start
+                self._process_response(raw_pong, sender, is_ipv6, time.time())
 
     def _process_response(self, raw_pong, sender, is_ipv6, arrival):
         # Extract header info and payload
@@ -317,20 +473,13 @@ class MegaPing(object):
                          sender, pong)
             return
 
-        if not pong.id == self._pid:
-            LOGGER.debug("packet from %r doesn't match our id (%s): %r (raw "
-                         "packet: %r)", sender, self._pid, pong, raw_pong)
-            return
-
-        cookie = pong.data[:Host.COOKIE_LENGTH]
-
-        # Find the host with this cookie
-        try:
-            host = self._requests[cookie]
-        except KeyError:
+        # Find the host this is a reply to
+        key = (pong.id, pong.sequence)
+        host = self._requests.get(key)
+        if host is None or not pong.data.startswith(host.cookie):
             LOGGER.debug("packet from %r does not match any outstanding "
-                         "request: %r (raw packet: %r cookie: %r)",
-                         sender, pong, raw_pong, cookie)
+                         "request: %r (raw packet: %r)",
+                         sender, pong, raw_pong)
             return
 
         # Delete the entry of the host who has replied and add the pingtime
@@ -338,7 +487,7 @@ class MegaPing(object):
         host.reply = pingtime
         LOGGER.debug("Response from %-16s in %03.3f ms",
                      sender, pingtime*1000)
-        del self._requests[cookie]
+        del self._requests[key]
 
     def results(self):
         """
@@ -0,0 +1,170 @@
+#
+# Copyright (C) 2018 UNINETT AS
+#
+# This file is part of Network Administration Visualized (NAV).
+#
+# NAV is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.  You should have received a copy of the GNU General Public License
+# along with NAV. If not, see <http://www.gnu.org/licenses/>.
+#
+"""Compact bookkeeping of ping replies, for deciding which hosts are down.
+
+Each host is assigned a dense slot number. The round trip times of the last
+few ping cycles are kept in a ring matrix, stored in a flat array with one
+row per slot and one column per cycle. The hosts that did not reply in each
+cycle are kept as a bitset of slots per column, so that finding the hosts
+that have not replied to any of the last requests only takes a few bitwise
+operations on the whole set, regardless of the number of hosts.
+
+"""
+import binascii
+from array import array
+from functools import reduce
+import operator
+
+NO_REPLY = -1.0
+
+
+class ReplyMatrix(object):
+    """The recent ping replies of a set of hosts.
+
+    A host is considered down when it has not replied to any of the last
+    nrping ping requests.
+
+    :param nrping: The number of cycles to keep replies for.
+
+    """
+    def __init__(self, nrping):
+        self.nrping = nrping
+        self.slots = {}
+        self.keys = []
+        self.rtt = array('d')
+        self.column = 0
+        self.missed = [0] * nrping
+        self.down = 0
+        self._free = []
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def add(self, key, up=True):
+        """Adds a host to the matrix.
+
+        :param key: Any hashable host identifier.
+        :param up: If False, the host is added as down, as if it hadn't
+                   replied for the last nrping cycles.
+        :returns: The slot assigned to the host.
+
+        """
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+            self.keys[slot] = key
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.rtt.extend(array('d', [NO_REPLY]) * self.nrping)
+        self.slots[key] = slot
+
+        start = slot * self.nrping
+        self.rtt[start:start + self.nrping] = (
+            array('d', [NO_REPLY]) * self.nrping)
+        bit = 1 << slot
+        if not up:
+            self.missed = [missed | bit for missed in self.missed]
+            self.down |= bit
+        return slot
+
+    def remove(self, key):
+        """Removes a host from the matrix, without reporting it as up"""
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        mask = ~(1 << slot)
+        self.missed = [missed & mask for missed in self.missed]
+        self.down &= mask
+        self.keys[slot] = None
+        self._free.append(slot)
+
+    def update(self, samples):
+        """Records the results of a ping cycle, and finds the hosts whose
+        state has changed.
+
+        :param samples: An iterable of (key, rtt) pairs, where an rtt of -1
+                        means the host did not reply. Hosts that are missing
+                        from samples, e.g. because they were not pinged, are
+                        not counted as having missed a reply.
+        :returns: A tuple of two lists, of the keys of the hosts that went
+                  down and of the hosts that came up.
+
+        """
+        column = self.column
+        nrping = self.nrping
+        rtt = self.rtt
+        slots = self.slots
+        missed = bytearray((len(self.keys) + 7) // 8)
+
+        rtt[column::nrping] = array('d', [NO_REPLY]) * len(self.keys)
+        for key, value in samples:
+            slot = slots.get(key)
+            if slot is None:
+                continue
+            if value == NO_REPLY:
+                missed[slot >> 3] |= 1 << (slot & 7)
+            else:
+                rtt[slot * nrping + column] = value
+
+        self.missed[column] = _bitmap_to_int(missed)
+        self.column = (column + 1) % nrping
+
+        down = reduce(operator.and_, self.missed)
+        went_down = down & ~self.down
+        came_up = self.down & ~down
+        self.down = down
+        return self._keys_of(went_down), self._keys_of(came_up)
+
+    def get_replies(self, key):
+        """Returns the round trip times recorded for a host in the last
+        nrping cycles, most recent first.
+        """
+        start = self.slots[key] * self.nrping
+        return [self.rtt[start + (self.column - 1 - cycle) % self.nrping]
+                for cycle in range(self.nrping)]
+
+    def is_down(self, key):
+        """Returns True if a host is currently considered down"""
+        return bool(self.down >> self.slots[key] & 1)
+
+    def count_down(self):
+        """Returns the number of hosts currently considered down"""
+        return bin(self.down).count('1')
+
+    def get_down(self):
+        """Returns the keys of all hosts currently considered down"""
+        return self._keys_of(self.down)
+
+    def _keys_of(self, bits):
+        if not bits:
+            return []
+        digits = bin(bits)[:1:-1]
+        return [self.keys[slot] for slot, digit in enumerate(digits)
+                if digit == '1']
+
+
+def _bitmap_to_int(bitmap):
+    """Converts a little-endian bitmap to an integer"""
+    if hasattr(int, 'from_bytes'):
+        return int.from_bytes(bytes(bitmap), 'little')
+    bitmap = bytearray(reversed(bitmap))
+    return int(binascii.hexlify(bitmap) or b'0', 16)
@@ -24,11 +24,13 @@ the statemon subsystem.
 import time
 from . import event
 from nav.metrics.carbon import send_metrics
+from nav.metrics.pathcache import format_line, format_timestamp
 from nav.metrics.templates import (
     metric_path_for_packet_loss,
     metric_path_for_roundtrip_time,
     metric_path_for_service_availability,
-    metric_path_for_service_response_time
+    metric_path_for_service_response_time,
+    metric_prefix_for_statemon,
 )
 
 
@@ -66,3 +68,70 @@ def update(netboxid, sysname, timestamp, status, responsetime, serviceid=None,
         (response_name, (timestamp, responsetime))
     ]
     send_metrics(metrics)
+
+
+def get_ping_metric_paths(sysname):
+    """Returns the encoded packet loss and round-trip time metric paths of a
+    device, for use with format_ping_metrics().
+    """
+    return (metric_path_for_packet_loss(sysname).encode('utf-8'),
+            metric_path_for_roundtrip_time(sysname).encode('utf-8'))
+
+
+def format_ping_metrics(paths, rtt, timestamp):
+    """Formats the ping metrics of a device as Carbon line protocol lines.
+
+    :param paths: The metric paths of the device, as returned by
+                  get_ping_metric_paths().
+    :param rtt: The round-trip time of the device, or -1 if it didn't reply.
+    :param timestamp: A timestamp, as returned by
+                      nav.metrics.pathcache.format_timestamp().
+    :returns: A tuple of two lines.
+
+    """
+    loss_path, rtt_path = paths
+    if rtt != -1:
+        return (format_line(loss_path, b"", 0, timestamp),
+                format_line(rtt_path, b"", rtt, timestamp))
+    else:
+        # ugly...
+        return (format_line(loss_path, b"", 1, timestamp),
+                format_line(rtt_path, b"", 5, timestamp))
+
+
+def send_ping_metrics(samples, timestamp=None):
+    """Sends the ping metrics of many devices in one batch.
+
+    :param samples: An iterable of (paths, rtt) tuples, where paths are as
+                    returned by get_ping_metric_paths().
+    :param timestamp: The timestamp of the measurements. If None, the current
+                      time will be used.
+
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    timestamp = format_timestamp(timestamp)
+    lines = []
+    for paths, rtt in samples:
+        lines.extend(format_ping_metrics(paths, rtt, timestamp))
+    if lines:
+        send_metrics(lines)
+
+
+def send_event_queue_metrics(source, queue_length, batch_size, latency):
+    """Sends metrics describing the posting of events to the event queue.
+
+    :param source: The source of the events, e.g. pping or serviceping.
+    :param queue_length: The number of events that were waiting to be posted.
+    :param batch_size: The number of events that were posted in one batch.
+    :param latency: The number of seconds it took to post the batch.
+
+    """
+    prefix = metric_prefix_for_statemon(source)
+    now = time.time()
+    metrics = [
+        (prefix + '.eventq.queue_length', (now, queue_length)),
+        (prefix + '.eventq.batch_size', (now, batch_size)),
+        (prefix + '.eventq.flush_latency', (now, latency)),
+    ]
+    send_metrics(metrics)
@@ -32,6 +32,7 @@ from nav.logs import init_generic_logging
 from nav.topology.layer2 import update_layer2_topology
 from nav.topology.analyze import AdjacencyReducer, build_candidate_graph_from_db
 from nav.topology.vlan import VlanGraphAnalyzer, VlanTopologyUpdater
+from nav.eventengine.topology import TOPOLOGY_CHANGE_CHANNEL
 
 from nav.models.manage import Vlan, Prefix
 from django.db.models import Q
@@ -68,6 +69,8 @@ def main():
         do_vlan_detection(vlans)
         delete_unused_prefixes()
         delete_unused_vlans()
+    if options.l2 or options.vlan:
+        notify_topology_change()
 
 
 def int_list(value):
@@ -160,6 +163,15 @@ def delete_unused_prefixes():
                        (tuple([p.id for p in unused_prefixes]), ))
 
 
+def notify_topology_change():
+    """Notifies other NAV processes, such as eventengine, that they should
+    invalidate any topology information they may have cached.
+
+    """
+    cursor = django.db.connection.cursor()
+    cursor.execute('NOTIFY ' + TOPOLOGY_CHANGE_CHANNEL)
+
+
 def verify_singleton():
     """Verifies that we are the single running navtopology process.
 
@@ -15,18 +15,22 @@
 #
 """Common utility functions for Machine Tracker"""
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from socket import gethostbyaddr, herror
 from IPy import IP
 from collections import namedtuple
 
 from nav import asyncdns
 from nav.models.manage import Prefix, Netbox, Interface
+from nav.prefixindex import PrefixIndex
 
 from django.utils.datastructures import SortedDict
 from django.db import DatabaseError, transaction
 
 _cached_hostname = {}
+_prefix_index = PrefixIndex()
+_prefix_index_update_time = datetime.min
+PREFIX_INDEX_MAX_AGE = timedelta(minutes=5)
 
 
 def hostname(ip):
@@ -51,6 +55,23 @@ def hostname(ip):
     return dns[0]
 
 
+def get_prefix_index():
+    """Returns a longest-prefix-match index of the ids of all non-scope
+    prefixes in the NAVdb.
+
+    The index is refreshed incrementally once it is older than
+    PREFIX_INDEX_MAX_AGE.
+
+    """
+    global _prefix_index_update_time
+    if datetime.now() - _prefix_index_update_time > PREFIX_INDEX_MAX_AGE:
+        prefixes = Prefix.objects.filter(vlan__isnull=False).exclude(
+            vlan__net_type='scope').values_list('net_address', 'id')
+        _prefix_index.update(prefixes)
+        _prefix_index_update_time = datetime.now()
+    return _prefix_index
+
+
 @transaction.atomic()
 def get_prefix_info(addr):
     """Returns the smallest prefix from the NAVdb that an IP address fits into.
@@ -60,13 +81,10 @@ def get_prefix_info(addr):
 
     """
     try:
-        return Prefix.objects.select_related().extra(
-            select={"mask_size": "masklen(netaddr)"},
-            where=["%s << netaddr AND nettype <> 'scope'"],
-            order_by=["-mask_size"],
-            params=[addr]
-        )[0]
-    except (IndexError, DatabaseError):
+        prefix_id = get_prefix_index().longest_match(addr, proper=True)
+        if prefix_id is not None:
+            return Prefix.objects.select_related().get(id=prefix_id)
+    except (ValueError, Prefix.DoesNotExist, DatabaseError):
         return None
 
 
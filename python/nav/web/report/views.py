@@ -35,8 +35,9 @@ from django.core.urlresolvers import reverse
 from django.core.paginator import Paginator, InvalidPage
 from django.shortcuts import render_to_response, render
 from django.template import RequestContext
-from django.http import HttpResponse, Http404, HttpResponseRedirect
-from django.utils.six import iteritems, text_type
+from django.http import (HttpResponse, Http404, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.utils.six import iteritems, text_type, PY2
 
 from nav.models.manage import Prefix
 
@@ -59,6 +60,8 @@ CONFIG_FILE_LOCAL = os.path.join(nav.buildconf.sysconfdir,
 FRONT_FILE = os.path.join(nav.buildconf.sysconfdir, "report/front.html")
 DEFAULT_PAGE_SIZE = 25
 PAGE_SIZES = [25, 50, 100, 500, 1000]
+# The number of CSV export rows sent to the client at a time
+EXPORT_CHUNK_ROWS = 500
 
 
 def index(request):
@@ -296,28 +299,58 @@ def make_report(request, report_name, export_delimiter, query_dict,
                              for x, y in iteritems(query_dict)
                              if x != 'page_number'])
 
-    @report_cache((request.account.login, report_name,
-                   os.stat(CONFIG_FILE_PACKAGE).st_mtime,
-                   os.stat(CONFIG_FILE_LOCAL).st_mtime),
-                  query_dict)
-    def _fetch_data_from_db():
-        (report, contents, neg, operator, adv, config, dbresult) = (
-            gen.make_report(report_name, CONFIG_FILE_PACKAGE,
-                            CONFIG_FILE_LOCAL, query_dict, None, None))
-        if not report:
-            raise Http404
-        result_time = strftime("%H:%M:%S", localtime())
-        return report, contents, neg, operator, adv, result_time
+    def _fetch_data_from_db(page=None):
+        # When paged, each page is cached separately
+        @report_cache((request.account.login, report_name,
+                       os.stat(CONFIG_FILE_PACKAGE).st_mtime,
+                       os.stat(CONFIG_FILE_LOCAL).st_mtime, page),
+                      query_dict)
+        def _fetch():
+            (report, contents, neg, operator, adv, config, dbresult) = (
+                gen.make_report(report_name, CONFIG_FILE_PACKAGE,
+                                CONFIG_FILE_LOCAL, query_dict, None, None,
+                                page=page))
+            if not report:
+                raise Http404
+            result_time = strftime("%H:%M:%S", localtime())
+            return report, contents, neg, operator, adv, result_time
+        return _fetch()
 
     gen = Generator()
 
-    report, contents, neg, operator, adv, result_time = _fetch_data_from_db()
+    if export_delimiter:
+        # Exports are streamed straight from the database, and never cached
+        report = gen.make_report(report_name, CONFIG_FILE_PACKAGE,
+                                 CONFIG_FILE_LOCAL, query_dict, None, None,
+                                 streaming=True)[0]
+        if not report:
+            raise Http404
+    elif paginate:
+        # Only the displayed page is fetched from the database
+        page_number, page_size = _clean_page_arguments(page_number, page_size)
+        (report, contents, neg, operator, adv,
+         result_time) = _fetch_data_from_db(
+             _get_page_window(page_number, page_size))
+        if report.paged and page_number > 1 and not report.table.rows:
+            # the requested page is out of range, start over at page 1
+            page_number = 1
+            (report, contents, neg, operator, adv,
+             result_time) = _fetch_data_from_db(
+                 _get_page_window(page_number, page_size))
+    else:
+        report, contents, neg, operator, adv, result_time = (
+            _fetch_data_from_db())
 
     if export_delimiter:
         return generate_export(report, report_name, export_delimiter)
     else:
 
-        paginator = Paginator(report.table.rows, page_size)
+        if report.paged:
+            offset, _limit = _get_page_window(page_number, page_size)
+            rows = PageRows(report.table.rows, report.rowcount, offset)
+        else:
+            rows = report.table.rows
+        paginator = Paginator(rows, page_size)
         try:
             page = paginator.page(page_number)
         except InvalidPage:
@@ -408,6 +441,60 @@ def get_page_size(request):
     return page_size
 
 
+def _clean_page_arguments(page_number, page_size):
+    """Returns page_number and page_size as positive integers, replacing
+    invalid values with the defaults.
+
+    """
+    try:
+        page_number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        page_number = 1
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    if page_size < 1:
+        page_size = DEFAULT_PAGE_SIZE
+    return page_number, page_size
+
+
+def _get_page_window(page_number, page_size):
+    """Returns the (offset, limit) of a page of report rows"""
+    return (page_number - 1) * page_size, page_size
+
+
+class PageRows(object):
+    """A stand-in for the full list of rows of a report, when only a single
+    page of the rows have been fetched.
+
+    Django's Paginator only needs to know the total number of rows, and will
+    only slice out the rows of the page that was fetched.
+
+    """
+    def __init__(self, rows, total, offset):
+        """
+        :param rows: The rows of the fetched page.
+        :param total: The total number of rows in the report.
+        :param offset: The offset of the first row of the fetched page.
+
+        """
+        self.rows = rows
+        self.total = total
+        self.offset = offset
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = (index.start or 0) - self.offset
+            stop = (self.total if index.stop is None
+                    else index.stop) - self.offset
+            return self.rows[max(start, 0):max(stop, 0)]
+        return self.rows[index - self.offset]
+
+
 def find_page_range(page_number, page_range, visible_pages=5):
     """Finds a suitable page range given current page.
 
@@ -433,33 +520,55 @@ def find_page_range(page_number, page_range, visible_pages=5):
 
 
 def generate_export(report, report_name, export_delimiter):
-    """Generates a CSV export version of a report"""
+    """Generates a CSV export version of a report.
+
+    The rows are encoded and sent to the client in chunks while they are
+    being read from the database.
+
+    """
     def _cellformatter(cell):
-        if isinstance(cell.text, unicode):
+        if PY2 and isinstance(cell.text, text_type):
             return cell.text.encode('utf-8')
         else:
             return cell.text
 
-    response = HttpResponse(content_type="text/x-csv; charset=utf-8")
+    def _generate_csv():
+        writer = csv.writer(_Echo(), delimiter=str(export_delimiter))
+
+        # Make a list of headers
+        header_row = [_cellformatter(cell)
+                      for cell in report.table.header.cells]
+        chunk = [writer.writerow(header_row)]
+
+        # Considers the 'hidden' option from the config.
+        rows = (report.iter_table_rows() if report.streaming
+                else report.table.rows)
+        for row in rows:
+            chunk.append(writer.writerow(
+                [_cellformatter(cell) for cell in row.cells]))
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+    response = StreamingHttpResponse(_generate_csv(),
+                                     content_type="text/x-csv; charset=utf-8")
     response["Content-Type"] = "application/force-download"
     response["Content-Disposition"] = (
         "attachment; filename=report-%s-%s.csv" %
         (report_name, strftime("%Y%m%d", localtime()))
         )
-    writer = csv.writer(response, delimiter=str(export_delimiter))
+    return response
 
-    # Make a list of headers
-    header_row = [_cellformatter(cell) for cell in report.table.header.cells]
-    writer.writerow(header_row)
 
-    # Make a list of lists containing each cell. Considers the 'hidden' option
-    # from the config.
-    rows = []
-    for row in report.table.rows:
-        rows.append([_cellformatter(cell) for cell in row.cells])
-    writer.writerows(rows)
+class _Echo(object):
+    """A pseudo-buffer for csv.writer, which returns what is written to it
+    instead of storing it.
 
-    return response
+    """
+    def write(self, value):
+        return value
 
 
 def add_report_widget(request):
@@ -0,0 +1,69 @@
+-- Keep the time of the last successful run of each ipdevpoll job for each
+-- netbox in a compact table, rather than aggregating over the entire job log.
+
+CREATE TABLE manage.ipdevpoll_job_last_success (
+  netboxid INTEGER NOT NULL,
+  job_name VARCHAR NOT NULL,
+  end_time TIMESTAMP NOT NULL,
+
+  CONSTRAINT ipdevpoll_job_last_success_pkey PRIMARY KEY (netboxid, job_name),
+  CONSTRAINT ipdevpoll_job_last_success_netbox_fkey FOREIGN KEY (netboxid)
+             REFERENCES netbox (netboxid)
+             ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+INSERT INTO ipdevpoll_job_last_success (netboxid, job_name, end_time)
+  SELECT netboxid, job_name, MAX(end_time)
+  FROM ipdevpoll_job_log
+  WHERE success
+  GROUP BY netboxid, job_name;
+
+CREATE OR REPLACE FUNCTION update_ipdevpoll_job_last_success()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE ipdevpoll_job_last_success
+    SET end_time = GREATEST(end_time, NEW.end_time)
+    WHERE netboxid = NEW.netboxid AND job_name = NEW.job_name;
+    IF NOT FOUND THEN
+        INSERT INTO ipdevpoll_job_last_success (netboxid, job_name, end_time)
+        VALUES (NEW.netboxid, NEW.job_name, NEW.end_time);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trig_update_ipdevpoll_job_last_success
+    AFTER INSERT ON ipdevpoll_job_log
+    FOR EACH ROW
+    WHEN (NEW.success)
+    EXECUTE PROCEDURE update_ipdevpoll_job_last_success();
+
+
+-- Stamp each netbox with the time its row was last changed, so that
+-- ipdevpoll can reload only the netboxes that changed since its last reload.
+
+ALTER TABLE netbox ADD COLUMN last_modified TIMESTAMP NOT NULL DEFAULT NOW();
+
+COMMENT ON COLUMN netbox.last_modified IS
+  'The last time any column of this netbox row was changed';
+
+CREATE OR REPLACE FUNCTION netbox_update_last_modified()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        NEW.last_modified = now();
+    ELSE
+        NEW.last_modified = OLD.last_modified;
+        IF NEW IS DISTINCT FROM OLD THEN
+            NEW.last_modified = now();
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER netbox_last_modified
+  BEFORE INSERT OR UPDATE ON netbox
+  FOR EACH ROW EXECUTE PROCEDURE netbox_update_last_modified();
+
+CREATE INDEX netbox_last_modified_btree ON netbox (last_modified);
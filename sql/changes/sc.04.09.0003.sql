@@ -0,0 +1,61 @@
+-- Notify pping and servicemon of changes to the netboxes and services they
+-- monitor, so they can reload only what changed. The payload of each
+-- notification is the id of the changed row.
+
+CREATE OR REPLACE FUNCTION notify_netbox_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('netbox_changed', OLD.netboxid::text);
+    ELSE
+        PERFORM pg_notify('netbox_changed', NEW.netboxid::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trig_notify_netbox_insert_delete
+    AFTER INSERT OR DELETE ON netbox
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_netbox_changed();
+
+-- up is maintained by eventengine, and is only read by the monitors when a
+-- netbox is first loaded
+CREATE TRIGGER trig_notify_netbox_update
+    AFTER UPDATE ON netbox
+    FOR EACH ROW
+    WHEN (OLD.sysname IS DISTINCT FROM NEW.sysname
+          OR OLD.ip IS DISTINCT FROM NEW.ip)
+    EXECUTE PROCEDURE notify_netbox_changed();
+
+
+CREATE OR REPLACE FUNCTION notify_service_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('service_changed', OLD.serviceid::text);
+    ELSE
+        PERFORM pg_notify('service_changed', NEW.serviceid::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trig_notify_service_insert_delete
+    AFTER INSERT OR DELETE ON service
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_service_changed();
+
+-- up and version are maintained by eventengine and servicemon themselves
+CREATE TRIGGER trig_notify_service_update
+    AFTER UPDATE ON service
+    FOR EACH ROW
+    WHEN (OLD.netboxid IS DISTINCT FROM NEW.netboxid
+          OR OLD.active IS DISTINCT FROM NEW.active
+          OR OLD.handler IS DISTINCT FROM NEW.handler)
+    EXECUTE PROCEDURE notify_service_changed();
+
+CREATE TRIGGER trig_notify_serviceproperty_changed
+    AFTER INSERT OR UPDATE OR DELETE ON serviceproperty
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_service_changed();
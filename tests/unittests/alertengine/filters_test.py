@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from nav.models.profiles import Expression, MatchField, Operator
+from nav.alertengine.filters import compile_expression, UncompilableExpression
+
+
+def make_expression(value_id, operator, value, data_type=MatchField.STRING):
+    match_field = MatchField(name=value_id, value_id=value_id,
+                             data_type=data_type)
+    return Expression(match_field=match_field, operator=operator, value=value)
+
+
+class CompileExpressionTest(TestCase):
+    def test_integer_comparison_should_coerce_value(self):
+        predicate = compile_expression(make_expression(
+            'alertq.severity', Operator.GREATER, '50', MatchField.INTEGER))
+        self.assertTrue(predicate(Mock(severity=60)))
+        self.assertFalse(predicate(Mock(severity=40)))
+
+    def test_in_should_match_any_value(self):
+        predicate = compile_expression(make_expression(
+            'netbox.catid', Operator.IN, 'GW|GSW'))
+        self.assertTrue(predicate(Mock(netbox=Mock(category_id='GSW'))))
+        self.assertFalse(predicate(Mock(netbox=Mock(category_id='SW'))))
+
+    def test_missing_netbox_should_not_match_equals(self):
+        predicate = compile_expression(make_expression(
+            'netbox.catid', Operator.EQUALS, 'GW'))
+        self.assertFalse(predicate(Mock(netbox=None)))
+
+    def test_missing_netbox_should_match_not_equals(self):
+        predicate = compile_expression(make_expression(
+            'netbox.catid', Operator.NOT_EQUAL, 'GW'))
+        self.assertTrue(predicate(Mock(netbox=None)))
+
+    def test_startswith_should_ignore_case(self):
+        predicate = compile_expression(make_expression(
+            'netbox.sysname', Operator.STARTSWITH, 'Core'))
+        self.assertTrue(predicate(Mock(netbox=Mock(sysname='core-gw.example'))))
+        self.assertFalse(predicate(Mock(netbox=Mock(sysname='edge-sw'))))
+
+    def test_multi_valued_relation_should_not_compile(self):
+        with self.assertRaises(UncompilableExpression):
+            compile_expression(make_expression(
+                'module.name', Operator.EQUALS, 'foo'))
+
+    def test_wildcard_should_not_compile(self):
+        with self.assertRaises(UncompilableExpression):
+            compile_expression(make_expression(
+                'netbox.sysname', Operator.WILDCARD, 'core*'))
+
+    def test_text_ordering_should_not_compile(self):
+        with self.assertRaises(UncompilableExpression):
+            compile_expression(make_expression(
+                'netbox.sysname', Operator.GREATER, 'a'))
+
+    def test_simple_regexp_should_match_like_postgresql(self):
+        predicate = compile_expression(make_expression(
+            'netbox.sysname', Operator.REGEXP, '^(core|edge)-.*gw$'))
+        self.assertTrue(predicate(Mock(netbox=Mock(sysname='Core-1-GW'))))
+        self.assertFalse(predicate(Mock(netbox=Mock(sysname='core-gw\n'))))
+        self.assertFalse(predicate(Mock(netbox=Mock(sysname='dist-gw'))))
+
+    def test_non_portable_regexp_should_not_compile(self):
+        for value in ('sw[[:digit:]]', r'\mcore\M', 'a{2}', '(?i)a'):
+            with self.assertRaises(UncompilableExpression):
+                compile_expression(make_expression(
+                    'netbox.sysname', Operator.REGEXP, value))
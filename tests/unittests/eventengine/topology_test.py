@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+import networkx
+
+from nav.models.manage import Netbox, Prefix, Vlan
+from nav.eventengine.topology import VlanReachability
+
+
+def make_netbox(netbox_id, up=Netbox.UP_UP):
+    return Netbox(id=netbox_id, sysname='box%d' % netbox_id, up=up)
+
+
+class VlanReachabilityTest(TestCase):
+    def setUp(self):
+        # router - switch1 - switch2 - edge
+        #             \
+        #              other
+        self.router = make_netbox(1)
+        self.switch1 = make_netbox(2)
+        self.switch2 = make_netbox(3)
+        self.edge = make_netbox(4)
+        self.other = make_netbox(5)
+        self.graph = networkx.MultiGraph()
+        self.graph.add_edge(self.router, self.switch1)
+        self.graph.add_edge(self.switch1, self.switch2)
+        self.graph.add_edge(self.switch2, self.edge)
+        self.graph.add_edge(self.switch1, self.other)
+        self.prefix = Prefix(id=1, net_address='10.0.0.0/24',
+                             vlan=Vlan(id=1, vlan=10))
+
+    def _evaluate(self, node, extra_neighbors=()):
+        reachability = VlanReachability(self.graph, self.router, self.prefix)
+        return reachability.evaluate(node, extra_neighbors)
+
+    def test_down_box_behind_up_boxes_should_be_reachable(self):
+        self.edge.up = Netbox.UP_DOWN
+        self.assertTrue(self._evaluate(self.edge))
+
+    def test_box_behind_down_box_should_be_unreachable(self):
+        self.switch2.up = Netbox.UP_DOWN
+        self.edge.up = Netbox.UP_DOWN
+        self.assertFalse(self._evaluate(self.edge))
+
+    def test_down_box_should_not_shadow_itself(self):
+        self.switch2.up = Netbox.UP_DOWN
+        self.edge.up = Netbox.UP_DOWN
+        self.assertTrue(self._evaluate(self.switch2))
+
+    def test_box_outside_graph_should_be_considered_reachable(self):
+        self.assertTrue(self._evaluate(make_netbox(42, Netbox.UP_DOWN)))
+
+    def test_boxes_should_be_unreachable_when_router_is_down(self):
+        self.router.up = Netbox.UP_DOWN
+        self.other.up = Netbox.UP_DOWN
+        self.assertFalse(self._evaluate(self.other))
+
+    def test_extra_neighbors_should_be_considered(self):
+        nav = object()
+        self.switch2.up = Netbox.UP_DOWN
+        self.assertTrue(self._evaluate(nav, [self.other]))
+        self.assertFalse(self._evaluate(nav, [self.edge]))
+
+    def test_same_instance_should_answer_for_multiple_boxes(self):
+        self.switch2.up = Netbox.UP_DOWN
+        self.edge.up = Netbox.UP_DOWN
+        self.other.up = Netbox.UP_DOWN
+        reachability = VlanReachability(self.graph, self.router, self.prefix)
+        self.assertFalse(reachability.evaluate(self.edge))
+        self.assertTrue(reachability.evaluate(self.other))
+        self.assertTrue(reachability.evaluate(self.switch2))
@@ -0,0 +1,41 @@
+import datetime
+from unittest import TestCase
+
+from nav.models.event import AlertHistory, EventQueue as Event
+from nav.models.fields import INFINITY
+from nav.eventengine import unresolved
+
+
+def make_alert(alert_id, end_time=INFINITY):
+    return AlertHistory(id=alert_id, netbox_id=1, subid='',
+                        event_type_id='boxState', end_time=end_time)
+
+
+class TrackUnresolvedTest(TestCase):
+    def setUp(self):
+        unresolved.get_map().clear()
+
+    def tearDown(self):
+        unresolved.get_map().clear()
+
+    def test_tracked_open_alert_should_be_found(self):
+        alert = make_alert(1)
+        unresolved.track(alert)
+        event = Event(netbox_id=1, subid='', event_type_id='boxState')
+        self.assertTrue(unresolved.refers_to_unresolved_alert(event) is alert)
+
+    def test_tracked_resolved_alert_should_be_removed(self):
+        unresolved.track(make_alert(1))
+        unresolved.track(make_alert(1, end_time=datetime.datetime.now()))
+        self.assertEqual(len(unresolved.get_map()), 0)
+
+    def test_resolving_other_alert_should_not_remove_entry(self):
+        unresolved.track(make_alert(1))
+        unresolved.track(make_alert(2, end_time=datetime.datetime.now()))
+        self.assertEqual(len(unresolved.get_map()), 1)
+
+    def test_stats_should_count_misses(self):
+        misses = unresolved.get_stats()['misses']
+        event = Event(netbox_id=1, subid='', event_type_id='boxState')
+        unresolved.refers_to_unresolved_alert(event)
+        self.assertEqual(unresolved.get_stats()['misses'], misses + 1)
@@ -1,8 +1,11 @@
 import pytest
-from mock import Mock
+from mock import Mock, patch
 from unittest import TestCase
 import random
 import logging
+import os
+import shutil
+import tempfile
 logging.raiseExceptions = False
 
 import datetime
@@ -11,8 +14,7 @@ from nav import logengine
 
 
 class TestParseAndInsertWithMockedDatabase(TestCase):
-    def setUp(self):
-        self.loglines = """
+    loglines_text = """
 Oct 28 13:15:06 10.0.42.103 1030: Oct 28 13:15:05.310 CEST: %LINEPROTO-5-UPDOWN: Line protocol on Interface GigabitEthernet1/0/29, changed state to up
 Oct 28 13:15:21 10.0.42.103 1031: Oct 28 13:15:20.191 CEST: %EC-5-COMPATIBLE: Gi1/0/30 is compatible with port-channel members
 Oct 28 13:15:21 10.0.42.103 1032: Oct 28 13:15:21.181 CEST: %LINEPROTO-5-UPDOWN: Line protocol on Interface GigabitEthernet1/0/29, changed state to down
@@ -31,6 +33,9 @@ Oct 28 13:15:52 10.0.128.13 71781: *Oct 28 2010 12:08:49 CET: %MV64340_ETHERNET-
 Oct 28 13:15:58 10.0.42.103 1043: Oct 28 13:15:57.560 CEST: %LINEPROTO-5-UPDOWN: Line protocol on Interface GigabitEthernet1/0/30, changed state to up
 """.strip().split("\n")
 
+    def setUp(self):
+        self.loglines = self.loglines_text
+
     def test_parse_without_exceptions(self):
         for line in self.loglines:
             msg = logengine.create_message(line)
@@ -163,3 +168,124 @@ non_conforming_lines = [
 def test_non_conforming_lines(line):
     msg = logengine.create_message(line)
     assert msg is None, "line shouldn't be parseable: %s" % line
+
+
+class TestParseAndInsertBatch(TestCase):
+    def setUp(self):
+        self.lines = TestParseAndInsertWithMockedDatabase.loglines_text
+        self.database = Mock()
+        self.database.fetchall.side_effect = [
+            [(1, '10.0.42.103'), (2, '10.0.80.11'), (3, '10.0.128.13')],
+            [(i, facility, mnemonic) for i, (facility, mnemonic) in enumerate(
+                [('LINEPROTO', 'UPDOWN'), ('EC', 'COMPATIBLE'),
+                 ('LINK', 'UPDOWN'), ('SEC', 'IPACCESSLOGP'),
+                 ('EC', 'CANNOT_BUNDLE2'), ('SPANTREE', 'TOPOTRAP'),
+                 ('MV64340_ETHERNET', 'LATECOLLISION')])],
+        ]
+
+    def test_should_insert_all_messages_in_one_statement(self):
+        logengine.parse_and_insert_batch(self.lines, self.database,
+                                         {}, {}, {}, {}, {}, {})
+        inserts = [call[0][0] for call in self.database.execute.call_args_list
+                   if call[0][0].startswith("INSERT INTO log_message ")]
+        self.assertEqual(len(inserts), 1)
+
+    def test_should_add_new_origins_in_bulk(self):
+        origins = {}
+        logengine.parse_and_insert_batch(self.lines, self.database,
+                                         {}, origins, {}, {}, {}, {})
+        self.assertEqual(len(origins), 3)
+        inserts = [call[0][0] for call in self.database.execute.call_args_list
+                   if call[0][0].startswith("INSERT INTO origin ")]
+        self.assertEqual(len(inserts), 1)
+
+    def test_should_not_add_known_origins_and_types(self):
+        categories = {'rest': 'rest'}
+        origins = {'10.0.42.103': 1, '10.0.80.11': 2, '10.0.128.13': 3}
+        types = {}
+        for line in self.lines:
+            msg = logengine.create_message(line)
+            types.setdefault(msg.facility, {})[msg.mnemonic] = 1
+        logengine.parse_and_insert_batch(self.lines, self.database,
+                                         categories, origins, types,
+                                         {}, {}, {})
+        self.assertEqual(self.database.execute.call_count, 1)
+
+
+class TestInsertBatch(TestCase):
+    def setUp(self):
+        self.lines = TestParseAndInsertWithMockedDatabase.loglines_text
+        self.database = Mock()
+
+    def _statements(self):
+        return [call[0][0] for call in self.database.execute.call_args_list]
+
+    @patch('nav.logengine.parse_and_insert_batch')
+    def test_should_release_batch_savepoint(self, _insert):
+        logengine.insert_batch(self.lines, self.database,
+                               {}, {}, {}, {}, {}, {})
+        self.assertEqual(self._statements(),
+                         ["SAVEPOINT logengine_batch",
+                          "RELEASE SAVEPOINT logengine_batch"])
+
+    @patch('nav.logengine.reload_caches')
+    @patch('nav.logengine.parse_and_insert')
+    @patch('nav.logengine.parse_and_insert_batch')
+    def test_should_release_line_savepoints(self, insert_batch, insert,
+                                            _reload):
+        insert_batch.side_effect = logengine.db.driver.Error()
+        insert.side_effect = [None, logengine.db.driver.Error()] + (
+            [None] * (len(self.lines) - 2))
+        logengine.insert_batch(self.lines, self.database,
+                               {}, {}, {}, {}, {}, {})
+        statements = self._statements()
+        self.assertEqual(statements.count("SAVEPOINT logengine_line"),
+                         len(self.lines))
+        self.assertEqual(statements.count("RELEASE SAVEPOINT logengine_line"),
+                         len(self.lines))
+        self.assertEqual(
+            statements.count("ROLLBACK TO SAVEPOINT logengine_line"), 1)
+        self.assertTrue("RELEASE SAVEPOINT logengine_batch" in statements)
+
+    @patch('nav.logengine.reload_caches')
+    @patch('nav.logengine.parse_and_insert')
+    @patch('nav.logengine.parse_and_insert_batch')
+    def test_should_insert_lines_after_non_db_batch_error(self, insert_batch,
+                                                          insert, _reload):
+        insert_batch.side_effect = ValueError()
+        logengine.insert_batch(self.lines, self.database,
+                               {}, {}, {}, {}, {}, {})
+        statements = self._statements()
+        self.assertTrue("ROLLBACK TO SAVEPOINT logengine_batch" in statements)
+        self.assertEqual(insert.call_count, len(self.lines))
+
+
+class TestSpoolLogFile(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'cisco.log')
+        self.config = Mock()
+        self.config.get.return_value = self.filename
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_return_none_when_there_is_no_log_file(self):
+        self.assertTrue(logengine.spool_log_file(self.config) is None)
+
+    def test_should_move_contents_to_spool_file(self):
+        with open(self.filename, 'w') as logfile:
+            logfile.write("line 1\nline 2\n")
+        spoolname = logengine.spool_log_file(self.config)
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        self.assertEqual(list(logengine.read_log_lines(spoolname)),
+                         [u"line 1\n", u"line 2\n"])
+
+    def test_should_append_to_leftover_spool_file(self):
+        with open(self.filename + logengine.SPOOL_SUFFIX, 'w') as spool:
+            spool.write("line 1\n")
+        with open(self.filename, 'w') as logfile:
+            logfile.write("line 2\n")
+        spoolname = logengine.spool_log_file(self.config)
+        self.assertEqual(list(logengine.read_log_lines(spoolname)),
+                         [u"line 1\n", u"line 2\n"])
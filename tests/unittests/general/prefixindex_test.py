@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from IPy import IP
+
+from nav.prefixindex import PrefixIndex
+
+
+class PrefixIndexTest(TestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            ('10.0.0.0/8', 1),
+            ('10.0.42.0/24', 2),
+            ('10.0.42.128/25', 3),
+            ('2001:db8::/32', 4),
+            ('2001:db8:1::/48', 5),
+        ])
+
+    def test_should_find_most_specific_prefix(self):
+        self.assertEqual(self.index.longest_match('10.0.42.200'), 3)
+        self.assertEqual(self.index.longest_match('10.0.42.1'), 2)
+        self.assertEqual(self.index.longest_match('10.1.0.1'), 1)
+
+    def test_should_find_ipv6_prefixes(self):
+        self.assertEqual(self.index.longest_match('2001:db8:1::1'), 5)
+        self.assertEqual(self.index.longest_match('2001:db8:2::1'), 4)
+
+    def test_should_accept_ip_objects(self):
+        self.assertEqual(self.index.longest_match(IP('10.0.42.1')), 2)
+
+    def test_unmatched_address_should_return_none(self):
+        self.assertTrue(self.index.longest_match('192.168.0.1') is None)
+
+    def test_proper_match_should_not_match_prefix_itself(self):
+        self.assertEqual(self.index.longest_match('10.0.42.0/24'), 2)
+        self.assertEqual(
+            self.index.longest_match('10.0.42.0/24', proper=True), 1)
+
+    def test_removed_prefix_should_not_match(self):
+        self.index.remove('10.0.42.128/25')
+        self.assertEqual(self.index.longest_match('10.0.42.200'), 2)
+        self.assertEqual(len(self.index), 4)
+
+    def test_update_should_only_report_actual_changes(self):
+        changed, removed = self.index.update([
+            ('10.0.0.0/8', 1),
+            ('10.0.42.0/24', 20),
+            ('192.168.0.0/16', 6),
+        ])
+        self.assertEqual((changed, removed), (2, 3))
+        self.assertEqual(self.index.longest_match('10.0.42.200'), 20)
+        self.assertEqual(self.index.longest_match('192.168.1.1'), 6)
+        self.assertTrue(self.index.longest_match('2001:db8::1') is None)
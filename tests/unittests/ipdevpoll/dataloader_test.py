@@ -0,0 +1,129 @@
+import datetime
+
+from mock import Mock, patch
+
+from nav.ipdevpoll import dataloader
+from nav.ipdevpoll.dataloader import (CapabilityCache, NetboxCapabilities,
+                                      NetboxLoader, get_capabilities)
+
+SNAPSHOT = NetboxCapabilities(interfaces=48, sensors=0, power_supplies=2)
+
+
+def fake_load_capabilities(netbox_ids):
+    return dict((netbox_id, SNAPSHOT) for netbox_id in netbox_ids)
+
+
+@patch('nav.ipdevpoll.dataloader.load_capabilities',
+       side_effect=fake_load_capabilities)
+class TestCapabilityCache(object):
+    def test_should_return_none_for_unknown_netbox(self, _load):
+        assert CapabilityCache().get(1) is None
+
+    def test_should_return_bulk_loaded_snapshot(self, _load):
+        cache = CapabilityCache()
+        cache.load_all([1, 2])
+        assert cache.get(2) == SNAPSHOT
+
+    def test_should_discard_snapshots_of_unlisted_netboxes(self, _load):
+        cache = CapabilityCache(min_reload_interval=datetime.timedelta(0))
+        cache.load_all([1, 2])
+        cache.load_all([1])
+        assert cache.get(2) is None
+
+    def test_should_not_reload_all_too_often(self, load):
+        cache = CapabilityCache()
+        cache.load_all([1])
+        cache.load_all([1])
+        assert load.call_count == 1
+
+    def test_should_expire_old_snapshots(self, _load):
+        cache = CapabilityCache(max_age=datetime.timedelta(seconds=-1))
+        cache.load(1)
+        assert cache.get(1) is None
+
+
+@patch('nav.ipdevpoll.dataloader._capability_cache')
+def test_get_capabilities_should_answer_from_cache(cache):
+    cache.get.return_value = SNAPSHOT
+    result = []
+    get_capabilities(Mock(id=1)).addCallback(result.append)
+    assert result == [SNAPSHOT]
+    assert not cache.load.called
+
+
+class FakeNetbox(object):
+    def __init__(self, id, ip='10.0.0.1', snmp_up=True):
+        self.id = id
+        self.ip = ip
+        self.type = self.read_only = self.deleted_at = None
+        self.snmp_version = 2
+        self.up = 'y'
+        self.up_to_date = True
+        self.snmp_up = snmp_up
+        self.last_updated = {}
+
+    def copy(self, other):
+        self.__dict__.update(other.__dict__)
+
+
+NOW = datetime.datetime(2018, 1, 1, 12, 0)
+
+
+@patch('nav.ipdevpoll.dataloader._capability_cache', Mock())
+@patch('nav.ipdevpoll.dataloader.load_last_updated_times', Mock(
+    return_value={}))
+@patch('nav.ipdevpoll.dataloader.load_snmp_down_ids', Mock(
+    return_value=set()))
+@patch('nav.ipdevpoll.dataloader.django_debug_cleanup', Mock())
+class TestNetboxLoader(object):
+    def _load(self, loader, netboxes, present_ids, now=NOW):
+        with patch.multiple(dataloader,
+                            get_database_time=Mock(return_value=now),
+                            load_netboxes=Mock(return_value=netboxes),
+                            load_netbox_ids=Mock(return_value=present_ids)):
+            result = loader.load_all_s()
+            return result, dataloader.load_netboxes
+
+    def test_first_load_should_be_full(self):
+        loader = NetboxLoader()
+        (new, lost, changed), load = self._load(
+            loader, [FakeNetbox(1), FakeNetbox(2)], set())
+        assert new == set([1, 2])
+        assert load.call_args[1].get('modified_since') is None
+
+    def test_reload_should_only_load_modified_netboxes(self):
+        loader = NetboxLoader()
+        self._load(loader, [FakeNetbox(1), FakeNetbox(2)], set())
+        later = NOW + datetime.timedelta(minutes=2)
+        (new, lost, changed), load = self._load(
+            loader, [FakeNetbox(2, ip='10.0.0.2'), FakeNetbox(3)],
+            set([1, 2, 3]), now=later)
+        assert load.call_args[1]['modified_since'] < NOW
+        assert load.call_args[1]['extra_ids'] == set([3])
+        assert (new, lost, changed) == (set([3]), set(), set([2]))
+        assert sorted(loader.keys()) == [1, 2, 3]
+
+    def test_reload_should_detect_removed_netboxes(self):
+        loader = NetboxLoader()
+        self._load(loader, [FakeNetbox(1), FakeNetbox(2)], set())
+        (new, lost, changed), _load = self._load(
+            loader, [], set([1]), now=NOW + datetime.timedelta(minutes=2))
+        assert lost == set([2])
+        assert list(loader.keys()) == [1]
+
+    def test_reload_should_detect_snmp_state_of_unmodified_netbox(self):
+        loader = NetboxLoader()
+        self._load(loader, [FakeNetbox(1)], set())
+        with patch('nav.ipdevpoll.dataloader.load_snmp_down_ids',
+                   Mock(return_value=set([1]))):
+            (new, lost, changed), _load = self._load(
+                loader, [], set([1]), now=NOW + datetime.timedelta(minutes=2))
+        assert changed == set([1])
+        assert loader[1].snmp_up is False
+
+    def test_should_reload_all_after_full_reload_interval(self):
+        loader = NetboxLoader()
+        self._load(loader, [FakeNetbox(1)], set())
+        later = NOW + dataloader.NETBOX_FULL_RELOAD_INTERVAL
+        _result, load = self._load(loader, [FakeNetbox(1)], set(), now=later)
+        assert load.call_args[1].get('modified_since') is None
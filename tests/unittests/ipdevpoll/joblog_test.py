@@ -0,0 +1,77 @@
+"""Tests for buffered job logging"""
+from unittest import TestCase
+
+from mock import Mock, patch
+from twisted.internet import defer
+
+from nav.ipdevpoll import joblog
+from nav.ipdevpoll.joblog import JobLogWriter, write_job_log_records
+
+
+@patch('nav.ipdevpoll.joblog.send_metrics')
+@patch('nav.ipdevpoll.joblog.db.run_in_thread')
+class JobLogWriterTest(TestCase):
+    def setUp(self):
+        self.writer = JobLogWriter(max_queue=3)
+
+    def _add_records(self, count):
+        for netbox_id in range(count):
+            self.writer.add_record(netbox_id, 'inventory', 0, 1.5, True, 300)
+
+    def test_should_send_all_queued_metrics_at_once(self, run, send):
+        self.writer.add_metrics([('a.runtime', (0, 1))])
+        self.writer.add_metrics([('b.runtime', (0, 2))])
+        self.writer.flush()
+        send.assert_called_once_with([('a.runtime', (0, 1)),
+                                      ('b.runtime', (0, 2))])
+        self.assertFalse(self.writer.metrics)
+
+    def test_should_write_all_queued_records_at_once(self, run, send):
+        run.return_value = defer.succeed(None)
+        self._add_records(2)
+        self.writer.flush()
+        self.assertEqual(run.call_count, 1)
+        records = run.call_args[0][1]
+        self.assertEqual([r.netbox_id for r in records], [0, 1])
+
+    def test_should_not_write_concurrently(self, run, send):
+        run.return_value = defer.Deferred()
+        self._add_records(1)
+        self.writer.flush()
+        self._add_records(1)
+        self.writer.flush()
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(len(self.writer.records), 1)
+
+    def test_should_discard_oldest_records_on_overflow(self, run, send):
+        self._add_records(5)
+        self.assertEqual([r.netbox_id for r in self.writer.records],
+                         [2, 3, 4])
+        self.assertEqual(self.writer.dropped_records, 2)
+
+    def test_should_resume_writing_after_failure(self, run, send):
+        run.return_value = defer.fail(Exception("database is gone"))
+        self._add_records(1)
+        self.writer.flush()
+        run.return_value = defer.succeed(None)
+        self._add_records(1)
+        self.writer.flush()
+        self.assertEqual(run.call_count, 2)
+
+
+@patch('nav.ipdevpoll.joblog.db.django_debug_cleanup', Mock())
+@patch('nav.ipdevpoll.joblog.storage.bulk_insert')
+@patch('nav.ipdevpoll.joblog.manage')
+class WriteJobLogRecordsTest(TestCase):
+    def test_should_skip_deleted_netboxes(self, manage, bulk_insert):
+        # netbox 2 is marked for deletion, netbox 4 is already gone
+        manage.Netbox.objects.filter.return_value.values_list.return_value = [
+            1, 3]
+        records = [joblog.JobLogRecord(netbox_id, 'inventory', None, 1.0,
+                                       True, 300)
+                   for netbox_id in (1, 2, 3, 4)]
+        write_job_log_records(records)
+        manage.Netbox.objects.filter.assert_called_with(
+            id__in=set([1, 2, 3, 4]), deleted_at__isnull=True)
+        rows = bulk_insert.call_args[0][2]
+        self.assertEqual([row[0] for row in rows], [1, 3])
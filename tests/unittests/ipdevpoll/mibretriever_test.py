@@ -0,0 +1,81 @@
+"""Tests for concurrent column retrieval in MibRetriever"""
+from unittest import TestCase
+
+from mock import Mock, patch
+from twisted.internet import defer
+
+from nav.ipdevpoll.snmp.common import SNMP_DEFAULTS
+from nav.mibs.if_mib import IfMib
+
+DESCR = str(IfMib.nodes['ifDescr'].oid)
+TYPE = str(IfMib.nodes['ifType'].oid)
+MTU = str(IfMib.nodes['ifMtu'].oid)
+
+
+def call_immediately(_delay, func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+@patch('nav.mibs.mibretriever.reactor', Mock(callLater=call_immediately))
+class RetrieveColumnsTest(TestCase):
+    def setUp(self):
+        self.requests = []
+        self.agent = Mock(snmp_parameters=SNMP_DEFAULTS)
+        self.agent.getTable.side_effect = self._get_table
+
+    def _get_table(self, oids):
+        deferred = defer.Deferred()
+        self.requests.append((oids, deferred))
+        return deferred
+
+    def _set_parameters(self, **kwargs):
+        self.agent.snmp_parameters = SNMP_DEFAULTS._replace(**kwargs)
+
+    def _respond(self, index, values):
+        oids, deferred = self.requests[index]
+        deferred.callback(
+            dict((oid, {oid + '.1': values[oid]}) for oid in oids))
+
+    def test_should_retrieve_one_column_at_a_time_by_default(self):
+        IfMib(self.agent).retrieve_columns(['ifDescr', 'ifType'])
+        self.assertEqual(len(self.requests), 1)
+
+    def test_should_keep_window_of_columns_in_flight(self):
+        self._set_parameters(max_concurrent_columns=2)
+        IfMib(self.agent).retrieve_columns(['ifDescr', 'ifType', 'ifMtu'])
+        self.assertEqual([oids for oids, _ in self.requests],
+                         [[DESCR], [TYPE]])
+        self._respond(1, {TYPE: 6})
+        self.assertEqual([oids for oids, _ in self.requests],
+                         [[DESCR], [TYPE], [MTU]])
+
+    def test_should_aggregate_concurrent_results(self):
+        self._set_parameters(max_concurrent_columns=3)
+        df = IfMib(self.agent).retrieve_columns(['ifDescr', 'ifType', 'ifMtu'])
+        values = {DESCR: 'eth0', TYPE: 6, MTU: 1500}
+        for index in (2, 0, 1):
+            self._respond(index, values)
+        self.assertTrue(df.called)
+        row = df.result[(1,)]
+        self.assertEqual(
+            (row['ifDescr'], row['ifType'], row['ifMtu']), ('eth0', 6, 1500))
+
+    def test_should_walk_several_columns_per_request(self):
+        self._set_parameters(columns_per_request=2)
+        df = IfMib(self.agent).retrieve_columns(['ifDescr', 'ifType', 'ifMtu'])
+        self.assertEqual(self.requests[0][0], [DESCR, TYPE])
+        values = {DESCR: 'eth0', TYPE: 6, MTU: 1500}
+        self._respond(0, values)
+        self._respond(1, values)
+        self.assertTrue(df.called)
+        self.assertEqual(df.result[(1,)]['ifType'], 6)
+
+    def test_should_fail_once_when_columns_fail(self):
+        self._set_parameters(max_concurrent_columns=2)
+        df = IfMib(self.agent).retrieve_columns(['ifDescr', 'ifType', 'ifMtu'])
+        failures = []
+        df.addErrback(failures.append)
+        self.requests[0][1].errback(Exception("timeout"))
+        self.requests[1][1].errback(Exception("timeout"))
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(len(self.requests), 2)
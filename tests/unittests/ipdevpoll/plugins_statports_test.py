@@ -0,0 +1,15 @@
+from mock import Mock
+
+from nav.ipdevpoll.plugins.statports import StatPorts
+
+
+def test_make_metrics_should_duplicate_lines_for_all_netboxes():
+    plugin = StatPorts(Mock(sysname='sw'), None, None)
+    stats = {1: {'ifName': 'Gi1/1', 'ifDescr': 'GigabitEthernet1/1',
+                 'ifHCInOctets': 10, 'ifInOctets': 5, 'ifInErrors': None}}
+    lines = list(plugin._make_metrics(stats, netboxes=['sw', 'sw-vc1'],
+                                      timestamp=1500000000))
+    assert lines == [
+        b"nav.devices.sw.ports.Gi1_1.ifInOctets 10 1500000000\n",
+        b"nav.devices.sw-vc1.ports.Gi1_1.ifInOctets 10 1500000000\n",
+    ]
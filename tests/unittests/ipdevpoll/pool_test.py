@@ -0,0 +1,101 @@
+"""Tests for job placement in the ipdevpoll worker pool"""
+from unittest import TestCase
+
+from mock import Mock, patch
+from twisted.internet.defer import Deferred
+
+from nav.ipdevpoll.pool import Job, RuntimeEstimator, Worker, WorkerPool
+
+
+def make_worker(pool):
+    worker = Worker(pool, None, None)
+    worker.process = Mock()
+    worker.process.callRemote.side_effect = lambda *args, **kw: Deferred()
+    pool.workers.add(worker)
+    return worker
+
+
+class WorkerPoolPlacementTest(TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(0, None)
+        self.pool.runtimes.set_history({
+            (1, 'inventory'): 600.0,
+            (2, 'inventory'): 600.0,
+            (3, 'statuscheck'): 2.0,
+        })
+        self.first = make_worker(self.pool)
+        self.second = make_worker(self.pool)
+
+    def _run(self, netbox, job):
+        self.pool.execute_job(job, netbox, ['noop'], 300)
+        return self.pool.affinity[netbox]
+
+    def test_should_weigh_workers_by_expected_runtime(self):
+        busy = self._run(1, 'inventory')
+        for netbox in (10, 11, 12):
+            self.pool.runtimes.update(netbox, 'statuscheck', 2.0)
+            self.assertNotEqual(self._run(netbox, 'statuscheck'), busy)
+        self.assertNotEqual(self._run(2, 'inventory'), busy)
+
+    def test_should_prefer_worker_that_last_polled_netbox(self):
+        worker = self._run(3, 'statuscheck')
+        self.assertTrue(self._run(3, 'statuscheck') is worker)
+
+    def test_should_abandon_sticky_worker_when_overloaded(self):
+        worker = self._run(1, 'inventory')
+        self.assertFalse(self._run(1, 'statuscheck') is worker)
+
+    def test_should_forget_affinity_of_dead_worker(self):
+        worker = self._run(3, 'statuscheck')
+        self.pool.worker_died(worker)
+        self.assertFalse(3 in self.pool.affinity)
+
+    def test_should_send_job_with_worker_serial(self):
+        worker = self._run(3, 'statuscheck')
+        worker.process.callRemote.assert_called_with(
+            Job, serial=1, job='statuscheck', netbox=3, plugins=['noop'],
+            interval=300)
+
+
+class WorkerRecyclingTest(TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(0, None, max_rss=100 * 1024 * 1024)
+        self.pool._spawn_worker = Mock()
+        self.worker = make_worker(self.pool)
+        self.deferred = self.pool._execute(Job, job='noop', netbox=1,
+                                           plugins=[], interval=0)
+
+    def test_should_retire_worker_exceeding_max_rss(self):
+        with patch.object(Worker, 'get_rss', return_value=200 * 1024 * 1024):
+            self.deferred.callback({})
+        self.assertTrue(self.worker.done())
+        self.assertTrue(self.pool._spawn_worker.called)
+
+    def test_should_keep_worker_below_max_rss(self):
+        with patch.object(Worker, 'get_rss', return_value=50 * 1024 * 1024):
+            self.deferred.callback({})
+        self.assertFalse(self.worker.done())
+        self.assertFalse(self.pool._spawn_worker.called)
+
+    def test_should_release_expected_runtime_of_finished_job(self):
+        with patch.object(Worker, 'get_rss', return_value=None):
+            self.deferred.callback({})
+        self.assertEqual(self.worker.load, 0)
+
+
+class RuntimeEstimatorTest(TestCase):
+    def test_should_use_job_average_for_unknown_netbox(self):
+        estimator = RuntimeEstimator()
+        estimator.set_history({(1, 'inventory'): 100.0,
+                               (2, 'inventory'): 300.0})
+        self.assertEqual(estimator.get(3, 'inventory'), 200.0)
+
+    def test_should_use_default_for_unknown_job(self):
+        estimator = RuntimeEstimator(default=5.0)
+        self.assertEqual(estimator.get(1, 'inventory'), 5.0)
+
+    def test_should_smooth_observed_runtimes(self):
+        estimator = RuntimeEstimator()
+        estimator.update(1, 'inventory', 100.0)
+        estimator.update(1, 'inventory', 200.0)
+        self.assertTrue(100.0 < estimator.get(1, 'inventory') < 200.0)
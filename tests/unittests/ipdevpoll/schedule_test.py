@@ -1,4 +1,6 @@
-from mock import Mock
+import datetime
+
+from mock import Mock, patch
 
 import pytest
 from twisted.internet import defer, task
@@ -15,20 +17,103 @@ def netbox_job_scheduler():
     job.intensity = 0
     netbox = Mock()
     netbox.id = 1
+    netbox.last_updated = {}
     pool = Mock()
     return schedule.NetboxJobScheduler(job,  netbox, pool)
 
 
-def test_netbox_job_scheduler_reschedule_on_success(netbox_job_scheduler):
+@patch('nav.ipdevpoll.schedule.joblog')
+def test_netbox_job_scheduler_reschedule_on_success(joblog,
+                                                    netbox_job_scheduler):
     pool = netbox_job_scheduler.pool
     pool.execute_job.return_value = defer.succeed(True)
     clock = task.Clock()
     netbox_job_scheduler.callLater = clock.callLater
     netbox_job_scheduler.start()
-    clock.advance(1)
+    clock.advance(10)
     pool.execute_job.assert_called_once_with('myjob', 1, plugins=[],
                                              interval=10)
-    clock.advance(10)
+    clock.advance(15)
     assert pool.execute_job.call_count == 2
     pool.execute_job.assert_called_with('myjob', 1, plugins=[],
                                         interval=10)
+
+
+@patch('nav.ipdevpoll.schedule.joblog')
+def test_netbox_job_scheduler_should_send_lag_metric(joblog,
+                                                     netbox_job_scheduler):
+    netbox_job_scheduler.pool.execute_job.return_value = defer.Deferred()
+    netbox_job_scheduler._due_time = 1000.0
+    with patch('nav.ipdevpoll.schedule.time.time', return_value=1002.5):
+        netbox_job_scheduler.run_job()
+    add_metrics = joblog.get_job_log_writer.return_value.add_metrics
+    path, (_timestamp, lag) = add_metrics.call_args[0][0][0]
+    assert path.endswith('.myjob.schedule-lag')
+    assert lag == 2.5
+
+
+def test_phases_should_be_spread_across_interval(netbox_job_scheduler):
+    phases = set()
+    for netbox_id in range(100):
+        netbox_job_scheduler.netbox.id = netbox_id
+        phase = netbox_job_scheduler._get_phase()
+        assert 0 <= phase < 10
+        phases.add(int(phase))
+    assert len(phases) == 10
+
+
+def test_next_slot_should_be_on_phase(netbox_job_scheduler):
+    phase = netbox_job_scheduler._get_phase()
+    slot = netbox_job_scheduler._get_next_slot(1000.0)
+    assert 1000.0 <= slot < 1010.0
+    assert abs((slot - phase) % 10) < 1e-6
+
+
+def test_recently_polled_netbox_should_wait_for_its_slot(
+        netbox_job_scheduler):
+    netbox_job_scheduler.netbox.last_updated = {
+        'myjob': datetime.datetime.now() - datetime.timedelta(seconds=2)}
+    delay = netbox_job_scheduler._get_initial_delay()
+    assert 2 <= delay <= 13
+
+
+def test_overdue_netbox_should_start_within_spread(netbox_job_scheduler):
+    netbox_job_scheduler.job.interval = 3600
+    delay = netbox_job_scheduler._get_initial_delay()
+    assert 0 <= delay < schedule.MAX_INITIAL_SPREAD
+
+
+class TestTimerQueue(object):
+    def setup_method(self, _method):
+        self.clock = task.Clock()
+        self.queue = schedule.TimerQueue(self.clock)
+        self.calls = []
+
+    def test_should_run_calls_in_order(self):
+        self.queue.callLater(2, self.calls.append, 'b')
+        self.queue.callLater(1, self.calls.append, 'a')
+        self.clock.advance(1)
+        assert self.calls == ['a']
+        self.clock.advance(1)
+        assert self.calls == ['a', 'b']
+
+    def test_should_use_single_reactor_timer(self):
+        for delay in range(100):
+            self.queue.callLater(delay, self.calls.append, delay)
+        assert len(self.clock.getDelayedCalls()) == 1
+
+    def test_cancelled_call_should_not_run(self):
+        timer = self.queue.callLater(1, self.calls.append, 'a')
+        timer.cancel()
+        self.clock.advance(2)
+        assert self.calls == []
+        assert not timer.active()
+
+    def test_reset_call_should_run_at_new_time(self):
+        timer = self.queue.callLater(1, self.calls.append, 'a')
+        timer.reset(5)
+        self.clock.advance(1)
+        assert self.calls == []
+        assert timer.getTime() == 5
+        self.clock.advance(4)
+        assert self.calls == ['a']
@@ -0,0 +1,61 @@
+import datetime
+
+from django.db import transaction
+from mock import Mock, patch
+
+from nav.models import manage
+from nav.models.fields import INFINITY
+from nav.ipdevpoll.shadows.cam import (CamManager, CamDetails, Cam,
+                                       MAX_MISS_COUNT)
+
+
+@patch('django.db.connection')
+def test_close_missing_should_update_all_records_at_once(connection):
+    cursor = connection.cursor.return_value
+    CamManager._close_missing([
+        CamDetails(2, INFINITY, 0),
+        CamDetails(1, datetime.datetime(2018, 1, 1), 1),
+    ])
+    assert cursor.execute.call_count == 1
+    _sql, args = cursor.execute.call_args[0]
+    assert args[1:] == [MAX_MISS_COUNT, [1, 2]]
+
+
+@patch('django.db.connection')
+def test_close_missing_should_not_query_without_missing_records(connection):
+    CamManager._close_missing([])
+    assert not connection.cursor.called
+
+
+@patch.object(transaction.Atomic, '__enter__', Mock())
+@patch.object(transaction.Atomic, '__exit__', Mock(return_value=False))
+@patch.object(manage.Cam, 'objects')
+@patch('nav.ipdevpoll.shadows.cam.bulk_insert')
+def test_save_should_insert_new_and_reclaim_closed_records(bulk_insert,
+                                                           objects):
+    containers = Mock()
+    containers.get.return_value = Mock(ifname='Gi0/1')
+    manager = CamManager(Cam, containers)
+    manager.netbox = Mock(id=1, sysname='example')
+    closed = Cam(2, 'aa:aa:aa:aa:aa:02')
+    still_open = Cam(3, 'aa:aa:aa:aa:aa:03')
+    manager._previously_open = {
+        closed: CamDetails(20, datetime.datetime(2018, 1, 1), 1),
+        still_open: CamDetails(30, INFINITY, 0),
+    }
+    manager._keepers = set([closed, still_open])
+    manager._new = set([Cam(1, 'aa:aa:aa:aa:aa:01')])
+
+    manager.save()
+
+    assert bulk_insert.call_count == 1
+    _meta, fields, rows = bulk_insert.call_args[0]
+    assert len(rows) == 1
+    row = dict(zip([field.name for field in fields], rows[0]))
+    assert row['netbox'] == 1
+    assert row['ifindex'] == 1
+    assert row['mac'] == 'aa:aa:aa:aa:aa:01'
+    assert row['port'] == 'Gi0/1'
+    objects.filter.assert_called_once_with(id__in=[20])
+    objects.filter.return_value.update.assert_called_once_with(
+        end_time=INFINITY, miss_count=0)
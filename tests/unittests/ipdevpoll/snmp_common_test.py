@@ -0,0 +1,75 @@
+"""Tests for the common AgentProxy mix-in"""
+from unittest import TestCase
+
+from mock import patch
+from twisted.internet import defer
+
+from nav.ipdevpoll.snmp.common import AgentProxyMixIn, SNMP_DEFAULTS
+from nav.ipdevpoll.snmp.tablecache import TableCache
+
+IFNAME = '.1.3.6.1.2.1.31.1.1.1.1'
+
+
+class FakeAgentProxy(object):
+    ip = '192.0.2.1'
+    port = 161
+    community = 'public'
+    snmpVersion = 'v2c'
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _getbulk(self, *args, **kwargs):
+        return defer.succeed({})
+
+    def getTable(self, oids, **kwargs):
+        return defer.succeed(dict((oid, {oid + '.1': 'foo'}) for oid in oids))
+
+
+class AgentProxy(AgentProxyMixIn, FakeAgentProxy):
+    pass
+
+
+class AgentProxyMixInTest(TestCase):
+    def test_should_count_requests(self):
+        agent = AgentProxy()
+        agent._getbulk(0, 10, ['.1.3.6.1.2.1.2.2.1.2'])
+        agent._getbulk(0, 10, ['.1.3.6.1.2.1.2.2.1.3'])
+        self.assertEqual(agent.request_stats.requests, 2)
+
+    @patch('nav.ipdevpoll.snmp.common.time.time', return_value=1000.0)
+    @patch('nav.ipdevpoll.snmp.common.deferLater')
+    def test_concurrent_requests_should_be_spaced_by_throttle_delay(
+            self, defer_later, _time):
+        agent = AgentProxy(
+            snmp_parameters=SNMP_DEFAULTS._replace(throttle_delay=0.5))
+        agent._last_request = 1000.0
+        agent._getbulk(0, 10, ['.1.3.6.1.2.1.2.2.1.2'])
+        agent._getbulk(0, 10, ['.1.3.6.1.2.1.2.2.1.3'])
+        delays = [call[0][1] for call in defer_later.call_args_list]
+        self.assertEqual(delays, [0.5, 1.0])
+
+
+class CacheAcrossJobsTest(TestCase):
+    def setUp(self):
+        cache = TableCache({IFNAME: 600})
+        patcher = patch('nav.ipdevpoll.snmp.common.get_table_cache',
+                        return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_agent_should_get_cached_table(self):
+        first, second = AgentProxy(), AgentProxy()
+        first.getTable([IFNAME])
+        result = []
+        second.getTable([IFNAME]).addCallback(result.append)
+        self.assertEqual(result, [{IFNAME: {IFNAME + '.1': 'foo'}}])
+        self.assertEqual(first.request_stats.cache_misses, 1)
+        self.assertEqual(second.request_stats.cache_hits, 1)
+
+    def test_should_not_cache_unlisted_oids(self):
+        first, second = AgentProxy(), AgentProxy()
+        first.getTable(['.1.3.6.1.2.1.2.2.1.10'])
+        second.getTable(['.1.3.6.1.2.1.2.2.1.10'])
+        self.assertEqual(second.request_stats.cache_hits, 0)
+        self.assertEqual(second.request_stats.cache_misses, 0)
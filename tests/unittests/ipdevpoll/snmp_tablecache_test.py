@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+from nav.config import NAVConfigParser
+from nav.ipdevpoll.snmp.tablecache import (TableCache,
+                                           make_table_cache_from_config)
+
+IFNAME = '.1.3.6.1.2.1.31.1.1.1.1'
+IFALIAS = '.1.3.6.1.2.1.31.1.1.1.18'
+IFINOCTETS = '.1.3.6.1.2.1.2.2.1.10'
+
+
+class TableCacheTest(TestCase):
+    def setUp(self):
+        self.cache = TableCache({'1.3.6.1.2.1.31.1.1.1': 600,
+                                 '1.3.6.1.2.1.31.1.1.1.18': 60},
+                                max_values=4)
+
+    def test_unlisted_oids_should_not_be_cached(self):
+        self.assertEqual(self.cache.get_max_age([IFINOCTETS]), 0)
+
+    def test_longest_prefix_should_decide_max_age(self):
+        self.assertEqual(self.cache.get_max_age([IFNAME]), 600)
+        self.assertEqual(self.cache.get_max_age([IFALIAS]), 60)
+
+    def test_walk_of_several_oids_should_use_shortest_max_age(self):
+        self.assertEqual(self.cache.get_max_age([IFNAME, IFALIAS]), 60)
+        self.assertEqual(self.cache.get_max_age([IFNAME, IFINOCTETS]), 0)
+
+    def test_should_return_cached_result(self):
+        result = {IFNAME: {IFNAME + '.1': 'ge-0/0/1'}}
+        self.cache.put('key', result)
+        self.assertEqual(self.cache.get('key', 600), result)
+
+    def test_should_not_return_expired_result(self):
+        self.cache.put('key', {IFNAME: {IFNAME + '.1': 'ge-0/0/1'}})
+        self.assertTrue(self.cache.get('key', -1) is None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_should_evict_least_recently_used_results(self):
+        self.cache.put('a', {IFNAME: {1: 'a', 2: 'b'}})
+        self.cache.put('b', {IFNAME: {1: 'a', 2: 'b'}})
+        self.cache.get('a', 600)
+        self.cache.put('c', {IFNAME: {1: 'a'}})
+        self.assertTrue(self.cache.get('b', 600) is None)
+        self.assertTrue(self.cache.get('a', 600) is not None)
+
+    def test_should_not_cache_results_larger_than_limit(self):
+        self.cache.put('key', {IFNAME: dict((i, i) for i in range(5))})
+        self.assertEqual(len(self.cache), 0)
+
+
+class TableCacheConfigTest(TestCase):
+    def _make_config(self, text):
+        return NAVConfigParser(default_config=text)
+
+    def test_should_be_disabled_by_default(self):
+        config = self._make_config(u"[snmpcache]\nenabled = no\n")
+        self.assertTrue(make_table_cache_from_config(config) is False)
+
+    def test_should_parse_max_ages(self):
+        config = self._make_config(
+            u"[snmpcache]\nenabled = yes\nmax-values = 10\n"
+            u"[snmpcache:oids]\n1.3.6.1.2.1.31.1.1.1.1 = 10m\n"
+            u"1.3.6.1.2.1.2.2.1.2 = 0\n")
+        cache = make_table_cache_from_config(config)
+        self.assertEqual(cache.max_values, 10)
+        self.assertEqual(cache.get_max_age([IFNAME]), 600)
+        self.assertEqual(cache.get_max_age(['.1.3.6.1.2.1.2.2.1.2']), 0)
+
+    def test_zero_max_age_should_override_shorter_prefix(self):
+        config = self._make_config(
+            u"[snmpcache]\nenabled = yes\n"
+            u"[snmpcache:oids]\n1.3.6.1.2.1.2.2.1 = 10m\n"
+            u"1.3.6.1.2.1.2.2.1.10 = 0\n")
+        cache = make_table_cache_from_config(config)
+        self.assertEqual(cache.get_max_age(['.1.3.6.1.2.1.2.2.1.10']), 0)
+        self.assertEqual(cache.get_max_age(['.1.3.6.1.2.1.2.2.1.2']), 600)
@@ -1,5 +1,11 @@
-from nav.ipdevpoll.storage import get_shadow_sort_order
+import pytest
+from django.db import transaction
+from mock import Mock, patch
+
+from nav.ipdevpoll.storage import get_shadow_sort_order, DefaultManager
+from nav.ipdevpoll.storage import _get_bulk_lookup_key, _chunks
 from nav.ipdevpoll import shadows
+from nav.models import manage
 
 
 # debateable whether this is a proper unit test, since it is in reality
@@ -8,3 +14,143 @@ from nav.ipdevpoll import shadows
 def test_netboxinfo_should_always_sort_last():
     classes = get_shadow_sort_order()
     assert classes[-1] is shadows.NetboxInfo
+
+
+def test_shadows_with_custom_save_should_not_support_bulk_save():
+    assert not shadows.Arp.supports_bulk_save()
+    assert not shadows.Vlan.supports_bulk_save()
+
+
+def test_shadows_with_custom_existing_model_should_not_support_bulk_save():
+    assert not shadows.Interface.supports_bulk_save()
+
+
+def test_plain_shadows_should_support_bulk_save():
+    assert shadows.Sensor.supports_bulk_save()
+    assert shadows.Module.supports_bulk_save()
+
+
+def test_bulk_lookup_key_should_use_primary_key_of_shadows():
+    netbox = shadows.Netbox(id=42)
+    assert _get_bulk_lookup_key([netbox, 'foo']) == (42, 'foo')
+
+
+def test_bulk_lookup_key_should_be_none_for_unsaved_shadows():
+    assert _get_bulk_lookup_key([shadows.Netbox(), 'foo']) is None
+
+
+def test_bulk_lookup_key_should_be_none_for_null_values():
+    assert _get_bulk_lookup_key([shadows.Netbox(id=42), None]) is None
+
+
+def test_chunks_should_split_evenly():
+    assert list(_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.fixture
+def netbox():
+    netbox = shadows.Netbox(id=1)
+    netbox.set_existing_model(manage.Netbox(id=1))
+    return netbox
+
+
+@pytest.fixture
+def sensor_objects():
+    objects = Mock()
+    objects.in_bulk.return_value = {}
+    objects.filter.return_value = []
+    with patch.object(transaction.Atomic, '__enter__'), \
+            patch.object(transaction.Atomic, '__exit__', return_value=False), \
+            patch.object(manage.Sensor, 'objects', objects):
+        yield objects
+
+
+def _make_sensor(netbox, **kwargs):
+    sensor = shadows.Sensor()
+    sensor.netbox = netbox
+    sensor.internal_name = 'temp'
+    sensor.mib = 'FOO-MIB'
+    for key, value in kwargs.items():
+        setattr(sensor, key, value)
+    return sensor
+
+
+def _bulk_save(*objs):
+    containers = {shadows.Sensor: dict(enumerate(objs))}
+    manager = DefaultManager(shadows.Sensor, containers)
+    manager.bulk_save()
+    return manager.counts
+
+
+@patch('nav.ipdevpoll.storage.bulk_insert', return_value=[10])
+def test_bulk_save_should_insert_new_shadow(bulk_insert, netbox,
+                                            sensor_objects):
+    sensor = _make_sensor(netbox, name='Temperature')
+    counts = _bulk_save(sensor)
+
+    assert counts['inserted'] == 1
+    assert bulk_insert.call_count == 1
+    assert sensor.id == 10
+
+
+@patch('nav.ipdevpoll.storage.bulk_insert', return_value=[10])
+def test_inserted_shadow_should_know_its_existing_model(bulk_insert, netbox,
+                                                        sensor_objects):
+    sensor = _make_sensor(netbox, name='Temperature')
+    _bulk_save(sensor)
+
+    model = sensor.get_existing_model()
+    assert model.pk == 10
+    assert model.name == 'Temperature'
+    assert not sensor_objects.get.called
+
+
+@patch('nav.ipdevpoll.storage.bulk_update')
+def test_bulk_save_should_update_changed_shadow(bulk_update, netbox,
+                                                sensor_objects):
+    sensor_objects.in_bulk.return_value = {
+        5: manage.Sensor(id=5, netbox_id=1, internal_name='temp',
+                         mib='FOO-MIB', name='Old name')}
+    sensor = _make_sensor(netbox, id=5, name='New name')
+    counts = _bulk_save(sensor)
+
+    assert counts['updated'] == 1
+    _meta, fields, values = bulk_update.call_args[0]
+    assert [field.name for field in fields] == ['name']
+    assert values == [[5, 'New name']]
+
+
+@patch('nav.ipdevpoll.storage.bulk_update')
+@patch('nav.ipdevpoll.storage.bulk_insert')
+def test_bulk_save_should_leave_unchanged_shadow(bulk_insert, bulk_update,
+                                                 netbox, sensor_objects):
+    sensor_objects.filter.return_value = [
+        manage.Sensor(id=5, netbox_id=1, internal_name='temp',
+                      mib='FOO-MIB', name='Temperature')]
+    sensor = _make_sensor(netbox, name='Temperature')
+    counts = _bulk_save(sensor)
+
+    assert counts['unchanged'] == 1
+    assert sensor.id == 5
+    assert not bulk_insert.called
+    assert not bulk_update.called
+
+
+def test_bulk_save_should_delete_shadow(netbox, sensor_objects):
+    sensor_objects.filter.return_value = Mock()
+    sensor_objects.in_bulk.return_value = {
+        5: manage.Sensor(id=5, netbox_id=1, internal_name='temp',
+                         mib='FOO-MIB')}
+    sensor = _make_sensor(netbox, id=5)
+    sensor.delete = True
+    counts = _bulk_save(sensor)
+
+    assert counts['deleted'] == 1
+    sensor_objects.filter.assert_called_with(pk__in=[5])
+    assert sensor_objects.filter.return_value.delete.called
+
+
+def test_bulk_save_should_fail_on_stale_primary_key(netbox, sensor_objects):
+    sensor = _make_sensor(netbox, id=5)
+    with pytest.raises(manage.Sensor.DoesNotExist):
+        _bulk_save(sensor)
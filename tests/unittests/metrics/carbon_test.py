@@ -0,0 +1,139 @@
+import pickle
+import socket
+import struct
+import threading
+import time
+from unittest import TestCase
+
+from mock import patch
+from twisted.test import proto_helpers
+
+from nav.metrics import carbon, twistedcarbon
+
+METRICS = [('nav.a', (1500000000.5, 1)), ('nav.b', (1500000001, 2.5))]
+
+
+class FramingTest(TestCase):
+    def test_line_format_should_truncate_timestamps(self):
+        self.assertEqual(carbon.format_lines(METRICS),
+                         b"nav.a 1 1500000000\nnav.b 2.5 1500000001\n")
+
+    def test_pickle_format_should_be_length_prefixed(self):
+        data = carbon.format_pickle(METRICS)
+        (length,) = struct.unpack("!L", data[:4])
+        self.assertEqual(length, len(data) - 4)
+        self.assertEqual(pickle.loads(data[4:]),
+                         [('nav.a', (1500000000, 1.0)),
+                          ('nav.b', (1500000001, 2.5))])
+
+    def test_pickle_format_should_skip_non_numeric_values(self):
+        data = carbon.format_pickle([('nav.a', (0, 'x'))] + METRICS)
+        self.assertEqual(len(pickle.loads(data[4:])), 2)
+
+    def test_formats_should_accept_preformatted_lines(self):
+        line = b"nav.c 3 1500000002\n"
+        self.assertTrue(carbon.format_lines([line]) == line)
+        data = carbon.format_pickle([line])
+        self.assertEqual(pickle.loads(data[4:]),
+                         [('nav.c', (1500000002, 3.0))])
+
+
+@patch('nav.metrics.carbon.socket.create_connection')
+class TCPTransportTest(TestCase):
+    def _transport(self, **kwargs):
+        return carbon.TCPTransport('127.0.0.1', 2003, carbon.format_lines,
+                                   **kwargs)
+
+    def test_should_send_batches_over_one_connection(self, connect):
+        transport = self._transport(batch_size=1)
+        transport.send(METRICS)
+        transport.send(METRICS)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(connect.return_value.sendall.call_count, 4)
+        self.assertEqual(transport.sent, 4)
+
+    def test_should_queue_metrics_while_disconnected(self, connect):
+        connect.side_effect = socket.error("connection refused")
+        transport = self._transport()
+        transport.send(METRICS)
+        self.assertEqual(transport.get_queue_length(), 2)
+        self.assertEqual(transport.sent, 0)
+
+    def test_should_not_reconnect_too_often(self, connect):
+        connect.side_effect = socket.error("connection refused")
+        transport = self._transport()
+        transport.send(METRICS)
+        transport.send(METRICS)
+        self.assertEqual(connect.call_count, 1)
+
+    def test_should_discard_oldest_metrics_on_overflow(self, connect):
+        connect.side_effect = socket.error("connection refused")
+        transport = self._transport(queue_size=3)
+        transport.send(METRICS)
+        transport.send([('nav.c', (0, 3)), ('nav.d', (0, 4))])
+        self.assertEqual([path for path, _ in transport.queue],
+                         ['nav.b', 'nav.c', 'nav.d'])
+        self.assertEqual(transport.dropped, 1)
+
+    def test_should_requeue_batch_on_send_error(self, connect):
+        connect.return_value.sendall.side_effect = socket.error("reset")
+        transport = self._transport()
+        transport.send(METRICS)
+        self.assertEqual(list(transport.queue), METRICS)
+        self.assertTrue(transport.socket is None)
+
+    def test_should_not_interleave_concurrent_writes(self, connect):
+        writing = []
+        overlaps = []
+
+        def sendall(data):
+            if writing:
+                overlaps.append(data)
+            writing.append(data)
+            time.sleep(0.001)
+            writing.remove(data)
+        connect.return_value.sendall.side_effect = sendall
+        transport = self._transport(batch_size=1)
+        threads = [threading.Thread(target=transport.send, args=(METRICS,))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(transport.sent, 20)
+
+
+class TwistedCarbonTransportTest(TestCase):
+    def setUp(self):
+        self.reactor = proto_helpers.MemoryReactorClock()
+        self.transport = twistedcarbon.TwistedCarbonTransport(
+            '127.0.0.1', 2004, carbon.format_lines, clock=self.reactor)
+
+    def _connect(self):
+        protocol = self.transport.factory.buildProtocol(None)
+        connection = proto_helpers.StringTransport()
+        protocol.makeConnection(connection)
+        return connection
+
+    def test_should_connect_on_first_send(self):
+        self.transport.send(METRICS)
+        self.assertEqual(len(self.reactor.tcpClients), 1)
+        self.assertEqual(self.transport.get_queue_length(), 2)
+
+    def test_should_write_queue_when_connected(self):
+        self.transport.send(METRICS)
+        connection = self._connect()
+        self.assertEqual(connection.value(), carbon.format_lines(METRICS))
+        self.assertEqual(self.transport.get_queue_length(), 0)
+
+    def test_should_stop_writing_when_paused(self):
+        self.transport.send(METRICS)
+        connection = self._connect()
+        self.transport.pauseProducing()
+        self.transport.send(METRICS)
+        self.transport.flush()
+        self.assertEqual(self.transport.get_queue_length(), 2)
+        self.transport.resumeProducing()
+        self.assertEqual(len(connection.value()),
+                         2 * len(carbon.format_lines(METRICS)))
@@ -0,0 +1,70 @@
+from unittest import TestCase
+import datetime
+
+from mock import patch
+
+from nav.metrics.index import MetricIndex
+
+TREE = {
+    'nav.devices.gw.*': [
+        {'id': 'nav.devices.gw.ports', 'leaf': 0},
+        {'id': 'nav.devices.gw.cpu', 'leaf': 0},
+        {'id': 'nav.devices.gw.uptime', 'leaf': 1},
+    ],
+    'nav.devices.gw.*.*': [
+        {'id': 'nav.devices.gw.ports.gi1_1', 'leaf': 0},
+        {'id': 'nav.devices.gw.ports.gi1_2', 'leaf': 0},
+        {'id': 'nav.devices.gw.cpu.loadavg5min', 'leaf': 1},
+    ],
+    'nav.devices.gw.*.*.*': [
+        {'id': 'nav.devices.gw.ports.gi1_1.ifInOctets', 'leaf': 1},
+        {'id': 'nav.devices.gw.ports.gi1_1.ifOutOctets', 'leaf': 1},
+        {'id': 'nav.devices.gw.ports.gi1_2.ifInOctets', 'leaf': 1},
+    ],
+}
+
+
+def fake_query(query):
+    return TREE.get(query, [])
+
+
+@patch('nav.metrics.index.raw_metric_query', side_effect=fake_query)
+class MetricIndexTest(TestCase):
+    def test_should_find_leaves_below_interface(self, _query):
+        index = MetricIndex()
+        self.assertEqual(
+            index.get_all_leaves_below('nav.devices.gw.ports.gi1_1'),
+            ['nav.devices.gw.ports.gi1_1.ifInOctets',
+             'nav.devices.gw.ports.gi1_1.ifOutOctets'])
+
+    def test_should_find_all_leaves_below_device(self, _query):
+        index = MetricIndex()
+        self.assertEqual(
+            index.get_all_leaves_below('nav.devices.gw',
+                                       ['nav.devices.gw.ports']),
+            ['nav.devices.gw.uptime', 'nav.devices.gw.cpu.loadavg5min'])
+
+    def test_should_return_empty_list_for_unknown_path(self, _query):
+        index = MetricIndex()
+        self.assertEqual(
+            index.get_all_leaves_below('nav.devices.gw.ports.gi9_9'), [])
+
+    def test_should_query_once_per_level_for_all_interfaces(self, query):
+        index = MetricIndex()
+        for ifname in ('gi1_1', 'gi1_2', 'gi1_3'):
+            index.get_all_leaves_below('nav.devices.gw.ports.' + ifname)
+        self.assertEqual(query.call_count, 3)
+
+    def test_should_reload_expired_subtree(self, query):
+        index = MetricIndex(max_age=datetime.timedelta(seconds=-1))
+        index.get_all_leaves_below('nav.devices.gw.ports.gi1_1')
+        index.get_all_leaves_below('nav.devices.gw.ports.gi1_1')
+        self.assertEqual(query.call_count, 6)
+
+    def test_should_evict_least_recently_used_subtree(self, query):
+        index = MetricIndex(max_roots=1)
+        index.get_all_leaves_below('nav.devices.gw')
+        index.get_all_leaves_below('nav.devices.other')
+        query.reset_mock()
+        index.get_all_leaves_below('nav.devices.gw')
+        self.assertEqual(query.call_count, 3)
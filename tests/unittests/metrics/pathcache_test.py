@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from nav.metrics.pathcache import (MetricPathCache, INTERFACE, format_line,
+                                   format_timestamp, encode_metric_name)
+from nav.metrics.templates import (metric_path_for_interface,
+                                   metric_path_for_sensor)
+
+
+class MetricPathCacheTest(TestCase):
+    def setUp(self):
+        self.cache = MetricPathCache(max_devices=2)
+
+    def test_interface_lines_should_match_template_paths(self):
+        prefix = self.cache.get_interface_prefix('sw.example.org', 'Gi1/0/1')
+        line = format_line(prefix, encode_metric_name('ifInOctets'), 42,
+                           format_timestamp(1500000000.7))
+        path = metric_path_for_interface('sw.example.org', 'Gi1/0/1',
+                                         'ifInOctets')
+        self.assertEqual(line, (path + " 42 1500000000\n").encode('utf-8'))
+
+    def test_sensor_path_should_match_template_path(self):
+        path = self.cache.get_sensor_path('sw.example.org', 'temp (inlet)')
+        self.assertEqual(path, metric_path_for_sensor(
+            'sw.example.org', 'temp (inlet)').encode('utf-8'))
+
+    def test_should_reuse_cached_prefix(self):
+        first = self.cache.get_interface_prefix('sw', 'Gi1/1')
+        self.assertTrue(self.cache.get_interface_prefix('sw', 'Gi1/1')
+                        is first)
+
+    def test_retain_should_discard_renamed_interfaces(self):
+        old = self.cache.get_interface_prefix('sw', 'Gi1/1')
+        self.cache.retain('sw', INTERFACE, ['Gi1/2'])
+        self.assertFalse(self.cache.get_interface_prefix('sw', 'Gi1/1')
+                         is old)
+
+    def test_should_discard_least_recently_used_device(self):
+        self.cache.get_interface_prefix('a', 'Gi1/1')
+        self.cache.get_interface_prefix('b', 'Gi1/1')
+        self.cache.get_interface_prefix('a', 'Gi1/1')
+        self.cache.get_interface_prefix('c', 'Gi1/1')
+        self.assertEqual(list(self.cache._devices.keys()), ['a', 'c'])
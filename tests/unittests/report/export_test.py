@@ -0,0 +1,47 @@
+"""Tests for CSV export of reports"""
+from unittest import TestCase
+
+from django.http import StreamingHttpResponse
+from mock import Mock
+
+from nav.report.report import Cell, Row
+from nav.web.report import views
+
+
+def make_row(*texts):
+    row = Row()
+    for text in texts:
+        row.append(Cell(text))
+    return row
+
+
+class GenerateExportTest(TestCase):
+    def setUp(self):
+        self.report = Mock(streaming=True)
+        self.report.table.header.cells = [Cell(u'sysname'), Cell(u'ip')]
+        self.report.iter_table_rows.return_value = iter(
+            [make_row(u'foo', u'10.0.0.1'), make_row(u'bar', u'10.0.0.2')])
+
+    def _export(self):
+        response = views.generate_export(self.report, 'netbox', ';')
+        return b"".join(response.streaming_content).decode('utf-8')
+
+    def test_should_return_streaming_response(self):
+        response = views.generate_export(self.report, 'netbox', ';')
+        self.assertTrue(isinstance(response, StreamingHttpResponse))
+
+    def test_should_export_header_and_rows(self):
+        self.assertEqual(self._export().splitlines(),
+                         [u'sysname;ip', u'foo;10.0.0.1', u'bar;10.0.0.2'])
+
+    def test_should_export_rows_in_chunks(self):
+        rows = [make_row(u'box%d' % i, u'10.0.0.%d' % i) for i in range(5)]
+        self.report.iter_table_rows.return_value = iter(rows)
+        original = views.EXPORT_CHUNK_ROWS
+        views.EXPORT_CHUNK_ROWS = 2
+        try:
+            response = views.generate_export(self.report, 'netbox', ';')
+            chunks = list(response.streaming_content)
+        finally:
+            views.EXPORT_CHUNK_ROWS = original
+        self.assertEqual(len(chunks), 3)
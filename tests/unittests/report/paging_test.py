@@ -0,0 +1,72 @@
+"""Tests for paged report execution"""
+from unittest import TestCase
+
+from django.core.paginator import Paginator
+
+from nav.report.dbresult import StreamingDatabaseResult
+from nav.report.generator import ReportConfig
+from nav.web.report.views import PageRows, _clean_page_arguments
+
+
+class ReportConfigPagingTest(TestCase):
+    def setUp(self):
+        self.config = ReportConfig()
+        self.config.sql = "SELECT * FROM netbox"
+        self.config.where = ["sysname = 'foo'"]
+        self.config.order_by = ["-ip"]
+
+    def test_make_sql_should_add_limit_and_offset(self):
+        sql = self.config.make_sql(limit=25, offset=50)
+        self.assertTrue(sql.endswith("ORDER BY ip DESC LIMIT 25 OFFSET 50"))
+
+    def test_make_sql_should_be_unlimited_by_default(self):
+        self.assertFalse("LIMIT" in self.config.make_sql())
+
+    def test_streamed_export_should_respect_limit_and_offset(self):
+        self.config.limit, self.config.offset = '10', '20'
+        result = StreamingDatabaseResult.__new__(StreamingDatabaseResult)
+        sql = result._make_sql(self.config)
+        self.assertTrue(sql.endswith("LIMIT 10 OFFSET 20"))
+
+    def test_streamed_export_should_be_unlimited_by_exportcsv(self):
+        self.config.limit, self.config.offset = 0, 0
+        result = StreamingDatabaseResult.__new__(StreamingDatabaseResult)
+        self.assertFalse("LIMIT" in result._make_sql(self.config))
+
+    def test_aggregate_sql_should_count_without_ordering(self):
+        sql = self.config.make_aggregate_sql()
+        self.assertTrue(sql.startswith("SELECT COUNT(*) FROM"))
+        self.assertTrue("WHERE sysname = 'foo'" in sql)
+        self.assertFalse("ORDER BY" in sql)
+
+    def test_aggregate_sql_should_sum_columns(self):
+        sql = self.config.make_aggregate_sql(['ports'])
+        self.assertTrue(
+            'SUM(CAST(CAST("ports" AS TEXT) AS NUMERIC))' in sql)
+
+
+class PageRowsTest(TestCase):
+    def test_paginator_should_count_all_rows(self):
+        rows = PageRows(['c', 'd'], total=5, offset=2)
+        paginator = Paginator(rows, 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_paginator_should_get_fetched_rows(self):
+        rows = PageRows(['c', 'd'], total=5, offset=2)
+        page = Paginator(rows, 2).page(2)
+        self.assertEqual(list(page), ['c', 'd'])
+        self.assertEqual(page.start_index(), 3)
+
+    def test_last_page_should_be_sliced_correctly(self):
+        rows = PageRows(['e'], total=5, offset=4)
+        page = Paginator(rows, 2).page(3)
+        self.assertEqual(list(page), ['e'])
+
+
+class CleanPageArgumentsTest(TestCase):
+    def test_should_convert_strings(self):
+        self.assertEqual(_clean_page_arguments('3', '50'), (3, 50))
+
+    def test_should_replace_invalid_values(self):
+        self.assertEqual(_clean_page_arguments('foo', '0'), (1, 25))
@@ -0,0 +1,125 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+from twisted.internet import defer, task
+from twisted.test import proto_helpers
+
+from nav.statemon import asyncrunner, lineclient
+from nav.statemon.event import Event
+from nav.statemon.checker.FtpChecker import FtpChecker
+from nav.statemon.checker.Pop3Checker import Pop3Checker
+from nav.statemon.checker.SmtpChecker import SmtpChecker
+
+
+def _make_checker(result=None, timeout=5):
+    checker = Mock(ASYNC_SUPPORT=True, timeout=timeout, version=None)
+    checker.execute_async.return_value = (
+        defer.Deferred() if result is None else defer.succeed(result))
+    return checker
+
+
+class AsyncRunQueueTest(TestCase):
+    def setUp(self):
+        patcher = patch('nav.statemon.config.serviceconf',
+                        Mock(return_value={'max concurrent': '2'}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # run "threaded" work synchronously
+        patcher = patch('nav.statemon.asyncrunner.threads.deferToThreadPool',
+                        lambda _clock, _pool, func, *args:
+                        defer.maybeDeferred(func, *args))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = task.Clock()
+        self.runqueue = asyncrunner.AsyncRunQueue(clock=self.clock)
+
+    def test_should_process_result_of_async_checker(self):
+        checker = _make_checker((Event.UP, 'Alive'))
+        self.runqueue.run_checker(checker)
+        checker.process_result.assert_called_once_with(None, Event.UP,
+                                                        'Alive')
+        self.assertEqual(self.runqueue.running, 0)
+
+    def test_should_time_out_hanging_checker(self):
+        checker = _make_checker(timeout=5)
+        self.runqueue.run_checker(checker)
+        self.clock.advance(5)
+        self.assertFalse(checker.process_result.called)
+        self.clock.advance(asyncrunner.DEADLINE_GRACE)
+        checker.process_result.assert_called_once_with(None, Event.DOWN,
+                                                       'Timed out')
+
+    def test_should_report_errors_as_down(self):
+        checker = _make_checker()
+        checker.execute_async.return_value = defer.fail(
+            ValueError("Bad greeting"))
+        self.runqueue.run_checker(checker)
+        checker.process_result.assert_called_once_with(None, Event.DOWN,
+                                                       'Bad greeting')
+
+    def test_should_process_results_in_thread_pool(self):
+        checker = _make_checker((Event.UP, 'Alive'))
+        with patch('nav.statemon.asyncrunner.threads.deferToThreadPool',
+                   return_value=defer.Deferred()) as defer_to_thread:
+            self.runqueue.run_checker(checker)
+        self.assertFalse(checker.process_result.called)
+        self.assertTrue(defer_to_thread.call_args[0][1] is
+                        self.runqueue.threadpool)
+
+    def test_should_limit_concurrent_checks(self):
+        checkers = [_make_checker() for _ in range(3)]
+        for checker in checkers:
+            self.runqueue.run_checker(checker)
+        self.assertEqual(self.runqueue.running, 2)
+        self.assertFalse(checkers[2].execute_async.called)
+
+        checkers[0].execute_async.return_value.callback((Event.UP, ''))
+        self.assertTrue(checkers[2].execute_async.called)
+
+
+@patch('nav.statemon.abstractchecker.RunQueue', Mock())
+@patch('nav.statemon.abstractchecker.db', Mock())
+@patch('nav.statemon.config.serviceconf', Mock(return_value={}))
+class CheckerConversationTest(TestCase):
+    """Runs asynchronous checkers against canned server responses"""
+    def _run(self, checker_class, server_data, **args):
+        service = {'id': 1, 'netboxid': 1, 'ip': '127.0.0.1',
+                   'sysname': 'example', 'args': args, 'version': ''}
+        checker = checker_class(service)
+        client = lineclient.LineClient()
+        transport = proto_helpers.StringTransport()
+        client.makeConnection(transport)
+        client.dataReceived(server_data)
+        results = []
+        with patch('nav.statemon.lineclient.connect',
+                   return_value=defer.succeed(client)):
+            checker.execute_async().addBoth(results.append)
+        self.assertTrue(transport.disconnecting)
+        return checker, results[0], transport.value()
+
+    def test_smtp_greeting(self):
+        checker, result, sent = self._run(
+            SmtpChecker, b"220-mail.example.org ESMTP Postfix; x\r\n"
+                         b"220 welcome\r\n")
+        self.assertEqual(result, (Event.UP,
+                                  'mail.example.org ESMTP Postfix; x\n'
+                                  'welcome'))
+        self.assertEqual(checker.version, 'ESMTP Postfix')
+        self.assertEqual(sent, b"QUIT\r\n")
+
+    def test_pop3_login(self):
+        checker, result, sent = self._run(
+            Pop3Checker, b"+OK Dovecot ready.\r\n+OK\r\n+OK Logged in.\r\n"
+                         b"+OK 1 messages:\r\n1 100\r\n.\r\n",
+            username='user', password='secret')
+        self.assertEqual(result, (Event.UP, 'Dovecot ready. '))
+        self.assertEqual(sent, b"USER user\r\nPASS secret\r\nLIST\r\n"
+                               b"QUIT\r\n")
+
+    def test_ftp_failed_login_should_be_down(self):
+        _checker, result, sent = self._run(
+            FtpChecker, b"220 ProFTPD Server\r\n331 Password required\r\n"
+                        b"530 Login incorrect.\r\n")
+        self.assertEqual(result, (Event.DOWN, '530 Login incorrect.'))
+        self.assertEqual(sent, b"USER anonymous\r\nPASS anonymous@\r\n"
+                               b"QUIT\r\n")
@@ -0,0 +1,181 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+import psycopg2
+
+from nav.statemon import db
+from nav.statemon.event import Event
+
+
+def notification(channel, payload):
+    return Mock(channel=channel, payload=payload)
+
+
+@patch('nav.statemon.db.get_connection_string', Mock(return_value=''))
+@patch('nav.statemon.db.psycopg2.connect')
+class ChangeListenerTest(TestCase):
+    def setUp(self):
+        self.listener = db.ChangeListener(
+            [db.NETBOX_CHANNEL, db.SERVICE_CHANNEL], 'pping',
+            resync_interval=60)
+
+    def test_should_connect_as_the_listening_daemon(self, connect):
+        with patch('nav.statemon.db.get_connection_string') as conn_string:
+            self.listener.get_changes()
+        conn_string.assert_called_with(script_name='pping')
+
+    def test_first_call_should_request_full_reload(self, connect):
+        self.assertTrue(self.listener.get_changes() is None)
+        cursor = connect.return_value.cursor.return_value
+        cursor.execute.assert_any_call('LISTEN netbox_changed')
+        cursor.execute.assert_any_call('LISTEN service_changed')
+
+    def test_should_return_changed_ids_by_channel(self, connect):
+        connect.return_value.notifies = []
+        self.listener.get_changes()
+        connect.return_value.notifies.extend([
+            notification(db.NETBOX_CHANNEL, '1'),
+            notification(db.SERVICE_CHANNEL, '10'),
+            notification(db.NETBOX_CHANNEL, '1'),
+            notification(db.NETBOX_CHANNEL, '2'),
+        ])
+        changes = self.listener.get_changes()
+        self.assertEqual(changes[db.NETBOX_CHANNEL], set([1, 2]))
+        self.assertEqual(changes[db.SERVICE_CHANNEL], set([10]))
+        self.assertEqual(connect.return_value.notifies, [])
+
+    def test_lost_connection_should_request_full_reload(self, connect):
+        connect.return_value.notifies = []
+        self.listener.get_changes()
+        connect.return_value.poll.side_effect = psycopg2.OperationalError()
+        self.assertTrue(self.listener.get_changes() is None)
+        self.assertEqual(connect.call_count, 2)
+
+    @patch('time.time')
+    def test_should_request_full_reload_periodically(self, time, connect):
+        connect.return_value.notifies = []
+        time.return_value = 1000
+        self.listener.get_changes()
+        time.return_value = 1030
+        self.assertFalse(self.listener.get_changes() is None)
+        time.return_value = 1060
+        self.assertTrue(self.listener.get_changes() is None)
+
+    def test_should_request_full_reload_on_demand(self, connect):
+        connect.return_value.notifies = []
+        self.listener.get_changes()
+        self.listener.request_resync()
+        self.assertTrue(self.listener.get_changes() is None)
+
+
+def box_state(netboxid, status, source='pping'):
+    return Event(None, netboxid, None, Event.boxState, source, status,
+                 info='info')
+
+
+class EventBatchTest(TestCase):
+    def setUp(self):
+        self.db = db._DB()
+        self.db.db = Mock()
+        self.cursor = self.db.db.cursor.return_value
+        self.cursor.mogrify.side_effect = (
+            lambda template, values: repr(values).encode('ascii'))
+
+    def test_should_drain_queue_in_batches(self):
+        for netboxid in range(3):
+            self.db.new_event(box_state(netboxid, Event.DOWN))
+        with patch('nav.statemon.db.EVENT_BATCH_SIZE', 2):
+            self.assertEqual(len(self.db.get_event_batch()), 2)
+            self.assertEqual(len(self.db.get_event_batch()), 1)
+
+    def test_pending_events_should_come_first(self):
+        pending = [box_state(1, Event.DOWN)]
+        queued = box_state(1, Event.UP)
+        self.db.new_event(queued)
+        self.assertEqual(self.db.get_event_batch(pending), pending + [queued])
+
+    def test_should_post_batch_in_one_transaction(self):
+        self.cursor.fetchall.return_value = [(11,), (12,), (13,)]
+        events = [box_state(netboxid, Event.DOWN) for netboxid in range(3)]
+        self.db.commit_events(events)
+
+        statements = [call[0][0] for call in self.cursor.execute.call_args_list
+                      if call[0][0] != 'SELECT 1']
+        self.assertEqual(len(statements), 3)
+        self.assertTrue('generate_series' in statements[0])
+        self.assertEqual(self.cursor.execute.call_args_list[1][0][1], (3,))
+        self.assertTrue(b'INSERT INTO eventq\n' in statements[1])
+        self.assertTrue(b'(13, None, 2,' in statements[1])
+        self.assertTrue(b'INSERT INTO eventqvar' in statements[2])
+        self.assertEqual(self.db.db.commit.call_count, 1)
+
+    def test_should_update_versions_in_same_transaction(self):
+        event = Event(10, 1, None, 'version', 'serviceping', Event.UP,
+                      version='2.0')
+        self.db.commit_events([event])
+        statement, values = self.cursor.execute.call_args[0]
+        self.assertTrue('UPDATE service SET version' in statement)
+        self.assertEqual(values, ('2.0', 10))
+        self.assertEqual(self.db.db.commit.call_count, 1)
+
+    def test_should_roll_back_failed_batch(self):
+        self.cursor.fetchall.side_effect = psycopg2.OperationalError()
+        with self.assertRaises(psycopg2.OperationalError):
+            self.db.commit_events([box_state(1, Event.DOWN)])
+        self.assertTrue(self.db.db.rollback.called)
+        self.assertFalse(self.db.db.commit.called)
+
+    def test_should_post_events_one_at_a_time_if_batch_is_rejected(self):
+        ids = iter([[(11,), (12,), (13,)], [(11,)], [(12,)], [(13,)]])
+        self.cursor.fetchall.side_effect = lambda: next(ids)
+        inserts = []
+
+        def execute(statement, values=None):
+            if isinstance(statement, bytes) and b'INTO eventq\n' in statement:
+                inserts.append(statement)
+                # the batch and the event of netbox 1 violate a foreign key
+                if len(inserts) == 1 or b'None, 1,' in statement:
+                    raise psycopg2.IntegrityError()
+        self.cursor.execute.side_effect = execute
+
+        events = [box_state(netboxid, Event.DOWN) for netboxid in range(3)]
+        self.db.commit_events(events)
+
+        statements = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertEqual(statements.count("SAVEPOINT statemon_event"), 3)
+        self.assertEqual(
+            statements.count("ROLLBACK TO SAVEPOINT statemon_event"), 1)
+        self.assertEqual(statements.count("RELEASE SAVEPOINT statemon_event"),
+                         3)
+        self.assertEqual(len(inserts), 4)
+        self.assertEqual(self.db.db.rollback.call_count, 1)
+        self.assertEqual(self.db.db.commit.call_count, 1)
+
+    def test_should_not_fall_back_on_connection_errors(self):
+        self.cursor.fetchall.side_effect = psycopg2.InterfaceError()
+        with self.assertRaises(psycopg2.InterfaceError):
+            self.db.commit_events([box_state(1, Event.DOWN)])
+        statements = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertFalse("SAVEPOINT statemon_event" in statements)
+
+    def test_should_discard_events_that_cannot_be_formatted(self):
+        calls = []
+
+        def mogrify(template, values):
+            calls.append(values)
+            # the batch and the event of netbox 1 cannot be formatted
+            if len(calls) == 1 or values[2] == 1:
+                raise TypeError()
+            return repr(values).encode('ascii')
+        self.cursor.mogrify.side_effect = mogrify
+        self.cursor.fetchall.side_effect = [[(11,), (12,), (13,)], [(11,)],
+                                            [(12,)], [(13,)]]
+
+        events = [box_state(netboxid, Event.DOWN) for netboxid in range(3)]
+        self.db.commit_events(events)
+
+        statements = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertEqual(
+            statements.count("ROLLBACK TO SAVEPOINT statemon_event"), 1)
+        self.assertEqual(self.db.db.rollback.call_count, 1)
+        self.assertEqual(self.db.db.commit.call_count, 1)
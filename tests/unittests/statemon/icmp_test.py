@@ -1,4 +1,5 @@
-from nav.statemon.icmppacket import PacketV6, PacketV4, inet_checksum
+from nav.statemon.icmppacket import (PacketV6, PacketV4, PacketTemplate,
+                                     inet_checksum)
 from unittest import TestCase
 import os
 
@@ -64,3 +65,12 @@ class ICMPPacketTestcase(TestCase):
         #Check if the checksum is correct
         unpacked_packet = packet[v4_packet.packet_slice]
         self.assertEquals(inet_checksum(unpacked_packet), 0)
+
+    def test_template_packets_should_match_assembled_packets(self):
+        packet = PacketV4()
+        packet.data = b'Testing template'
+        packet.id = 4242
+        template = PacketTemplate(packet)
+        for sequence in (0, 1, 255, 65535):
+            packet.sequence = sequence
+            self.assertEquals(template.assemble(sequence), packet.assemble())
@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from twisted.internet import task
+from twisted.internet.error import ConnectionDone, TimeoutError
+from twisted.python.failure import Failure
+from twisted.test import proto_helpers
+
+from nav.statemon import lineclient
+
+
+class LineClientTest(TestCase):
+    def setUp(self):
+        self.client = lineclient.LineClient()
+        self.transport = proto_helpers.StringTransport()
+        self.client.makeConnection(self.transport)
+
+    def _result(self, deferred):
+        results = []
+        deferred.addBoth(results.append)
+        self.assertTrue(results, "deferred has not fired")
+        return results[0]
+
+    def test_read_line_should_return_buffered_line(self):
+        self.client.dataReceived(b"+OK ready\r\n")
+        self.assertEqual(self._result(self.client.read_line()), u"+OK ready")
+
+    def test_read_line_should_wait_for_line(self):
+        deferred = self.client.read_line()
+        self.assertFalse(deferred.called)
+        self.client.dataReceived(b"SSH-2.0-Open")
+        self.assertFalse(deferred.called)
+        self.client.dataReceived(b"SSH_7.4\n")
+        self.assertEqual(self._result(deferred), u"SSH-2.0-OpenSSH_7.4")
+
+    def test_read_numeric_reply_should_read_continuation_lines(self):
+        self.client.dataReceived(b"220-mail.example.org ESMTP\r\n"
+                                 b"free text\r\n"
+                                 b"220 welcome\r\n"
+                                 b"250 next reply\r\n")
+        self.assertEqual(self._result(self.client.read_numeric_reply()),
+                         [u"220-mail.example.org ESMTP", u"free text",
+                          u"220 welcome"])
+        self.assertEqual(self._result(self.client.read_numeric_reply()),
+                         [u"250 next reply"])
+
+    def test_write_line_should_terminate_with_crlf(self):
+        self.client.write_line(u"QUIT")
+        self.assertEqual(self.transport.value(), b"QUIT\r\n")
+
+    def test_lost_connection_should_fail_pending_read(self):
+        deferred = self.client.read_line()
+        self.client.connectionLost(Failure(ConnectionDone()))
+        self.assertTrue(self._result(deferred).check(ConnectionDone))
+
+    def test_deadline_should_abort_connection(self):
+        clock = task.Clock()
+        self.client.set_deadline(5, clock)
+        deferred = self.client.read_line()
+        clock.advance(5)
+        self.assertTrue(self._result(deferred).check(TimeoutError))
+        self.assertTrue(self.transport.disconnecting)
+        self.assertTrue(self._result(self.client.read_line()).check(
+            TimeoutError))
+
+
+class ConnectTest(TestCase):
+    def test_deadline_should_include_connect_time(self):
+        reactor = proto_helpers.MemoryReactorClock()
+        deferred = lineclient.connect('127.0.0.1', 25, 10, clock=reactor)
+        host, port, factory, timeout, _ = reactor.tcpClients[0]
+        self.assertEqual((host, port, timeout), ('127.0.0.1', 25, 10))
+
+        reactor.advance(4)
+        client = factory.buildProtocol(None)
+        client.makeConnection(proto_helpers.StringTransport())
+        reactor.advance(0)
+        connected = []
+        deferred.addCallback(connected.append)
+        self.assertEqual(connected, [client])
+        self.assertEqual(client._timeout_call.getTime(), 10)
@@ -0,0 +1,129 @@
+import errno
+import socket
+import struct
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from nav.statemon.megaping import MegaPing, TokenBucket, get_rate_limits
+from nav.statemon.icmppacket import PacketV4
+
+IP_HEADER = b'\x00' * 20
+
+
+def make_reply(request):
+    """Returns a raw echo reply packet, as received on an IPv4 raw socket"""
+    _type, _code, _checksum, ident, sequence = struct.unpack(
+        "BBHHH", request[:8])
+    reply = PacketV4()
+    reply.type = PacketV4.ICMP_ECHO_REPLY
+    reply.id = ident
+    reply.sequence = sequence
+    reply.data = request[8:]
+    return IP_HEADER + reply.assemble()
+
+
+class TokenBucketTest(TestCase):
+    def test_should_start_full(self):
+        bucket = TokenBucket(100, 10, now=0)
+        self.assertEqual(bucket.take(50, 0), 10)
+        self.assertEqual(bucket.take(50, 0), 0)
+
+    def test_should_refill_at_rate(self):
+        bucket = TokenBucket(100, 10, now=0)
+        bucket.take(10, 0)
+        self.assertAlmostEqual(bucket.time_until_available(0), 0.01)
+        self.assertEqual(bucket.take(50, 0.05), 5)
+
+    def test_should_not_refill_beyond_capacity(self):
+        bucket = TokenBucket(100, 10, now=0)
+        self.assertEqual(bucket.take(50, 60), 10)
+
+
+class RateLimitTest(TestCase):
+    def test_rate_should_be_derived_from_delay(self):
+        self.assertEqual(get_rate_limits({'delay': '4'}), (250.0, 2))
+
+    def test_configured_rate_should_override_delay(self):
+        self.assertEqual(get_rate_limits({'delay': '4', 'rate': '1000',
+                                          'burst': '50'}),
+                         (1000.0, 50))
+
+    def test_zero_delay_should_mean_no_limit(self):
+        self.assertEqual(get_rate_limits({'delay': '0'}), (None, 1))
+
+
+class MegaPingTest(TestCase):
+    def setUp(self):
+        self.sock6 = Mock(name='sock6')
+        self.sock4 = Mock(name='sock4')
+        self.sock4.sendto.side_effect = self._sendto
+        self.sock4.recvfrom.side_effect = self._recvfrom
+        self.inbox = []
+        self.unreachable = set()
+        poller = patch('nav.statemon.megaping.Poller')
+        self.poller = poller.start().return_value
+        self.poller.wait.side_effect = self._wait
+        self.addCleanup(poller.stop)
+        self.pinger = MegaPing([self.sock6, self.sock4],
+                               conf={'rate': '1000', 'burst': '2',
+                                     'timeout': '1'})
+
+    def _sendto(self, packet, address):
+        if address[0] not in self.unreachable:
+            self.inbox.append((make_reply(packet), address))
+
+    def _recvfrom(self, _bufsize):
+        if self.inbox:
+            return self.inbox.pop(0)
+        raise socket.error(errno.EAGAIN, "Resource temporarily unavailable")
+
+    def _wait(self, timeout):
+        return [self.sock4] if self.inbox else []
+
+    def test_should_match_replies_to_hosts(self):
+        self.unreachable.add('10.0.0.2')
+        self.pinger.set_hosts(['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.pinger.ping()
+        results = dict(self.pinger.results())
+        self.assertTrue(results['10.0.0.1'] > 0)
+        self.assertEqual(results['10.0.0.2'], -1)
+        self.assertTrue(results['10.0.0.3'] > 0)
+
+    def test_should_send_in_bursts(self):
+        self.pinger.set_hosts(['10.0.0.%d' % i for i in range(1, 6)])
+        self.pinger.ping()
+        self.assertEqual(self.sock4.sendto.call_count, 5)
+        # two bursts of 2 requests are sent before waiting for tokens
+        self.assertTrue(self.poller.wait.call_count >= 2)
+
+    def test_should_use_unique_ids_per_host(self):
+        self.pinger.set_hosts(['10.0.0.1', '10.0.0.2'])
+        ids = set(host.packet.id for host in self.pinger._hosts.values())
+        self.assertEqual(len(ids), 2)
+
+    def test_should_ignore_replies_with_wrong_sequence(self):
+        self.pinger.set_hosts(['10.0.0.1'])
+        self.pinger.ping()
+        stale = self.sock4.sendto.call_args[0][0]
+        self.unreachable.add('10.0.0.1')
+        self.inbox.append((make_reply(stale), ('10.0.0.1', 0)))
+        self.pinger.ping()
+        self.assertEqual(self.pinger.results(), [('10.0.0.1', -1)])
+
+    def test_should_retry_when_send_buffer_is_full(self):
+        full = socket.error(errno.ENOBUFS, "No buffer space available")
+        self.sock4.sendto.side_effect = [full, None]
+        self.pinger.set_hosts(['10.0.0.1'])
+        self.pinger.ping()
+        self.assertEqual(self.sock4.sendto.call_count, 2)
+        host = self.pinger._hosts['10.0.0.1']
+        self.assertEqual(host.packet.sequence, 1)
+
+    def test_added_hosts_should_keep_existing_hosts(self):
+        self.pinger.set_hosts(['10.0.0.1'])
+        self.pinger.ping()
+        self.pinger.add_hosts(['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(self.pinger._hosts['10.0.0.1'].packet.sequence, 1)
+        self.pinger.remove_hosts(['10.0.0.1'])
+        self.assertEqual(list(self.pinger._hosts), ['10.0.0.2'])
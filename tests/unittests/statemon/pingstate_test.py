@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+from mock import patch
+
+from nav.statemon import statistics
+from nav.statemon.pingstate import ReplyMatrix
+
+
+class ReplyMatrixTest(TestCase):
+    def setUp(self):
+        self.matrix = ReplyMatrix(3)
+        for netboxid in (1, 2, 3):
+            self.matrix.add(netboxid)
+
+    def _cycle(self, *down):
+        return self.matrix.update([(netboxid, -1 if netboxid in down else 0.1)
+                                   for netboxid in (1, 2, 3)])
+
+    def test_host_should_go_down_after_nrping_missed_replies(self):
+        self.assertEqual(self._cycle(2), ([], []))
+        self.assertEqual(self._cycle(2), ([], []))
+        self.assertEqual(self._cycle(2), ([2], []))
+        self.assertEqual(self._cycle(2), ([], []))
+        self.assertTrue(self.matrix.is_down(2))
+        self.assertEqual(self.matrix.count_down(), 1)
+
+    def test_host_should_come_up_on_first_reply(self):
+        for _ in range(3):
+            self._cycle(1, 3)
+        self.assertEqual(self._cycle(), ([], [1, 3]))
+        self.assertEqual(self.matrix.get_down(), [])
+
+    def test_single_reply_should_keep_host_up(self):
+        self._cycle(1)
+        self._cycle(1)
+        self._cycle()
+        self._cycle(1)
+        self.assertEqual(self._cycle(1), ([], []))
+
+    def test_host_added_as_down_should_not_be_reported_down(self):
+        self.matrix.add(4, up=False)
+        self.assertTrue(self.matrix.is_down(4))
+        self.assertEqual(self.matrix.update([(4, -1)]), ([], []))
+        self.assertEqual(self.matrix.update([(4, 0.2)]), ([], [4]))
+
+    def test_removed_host_should_not_be_reported_up(self):
+        for _ in range(3):
+            self._cycle(2)
+        self.matrix.remove(2)
+        self.assertEqual(self._cycle(), ([], []))
+        self.assertEqual(self.matrix.count_down(), 0)
+
+    def test_slots_of_removed_hosts_should_be_reused(self):
+        slot = self.matrix.slots[2]
+        self.matrix.remove(2)
+        self.assertEqual(self.matrix.add(4), slot)
+        self.assertEqual(self.matrix.get_replies(4), [-1, -1, -1])
+
+    def test_replies_should_be_most_recent_first(self):
+        for rtt in (0.1, 0.2, 0.3, 0.4):
+            self.matrix.update([(1, rtt)])
+        self.assertEqual(self.matrix.get_replies(1), [0.4, 0.3, 0.2])
+
+
+class PingMetricsTest(TestCase):
+    def test_should_send_all_metrics_at_once(self):
+        paths = statistics.get_ping_metric_paths('example-sw')
+        with patch('nav.statemon.statistics.send_metrics') as send:
+            statistics.send_ping_metrics([(paths, 0.5), (paths, -1)],
+                                         1500000000)
+        send.assert_called_once_with([
+            b'nav.devices.example-sw.ping.packetLoss 0 1500000000\n',
+            b'nav.devices.example-sw.ping.roundTripTime 0.5 1500000000\n',
+            b'nav.devices.example-sw.ping.packetLoss 1 1500000000\n',
+            b'nav.devices.example-sw.ping.roundTripTime 5 1500000000\n',
+        ])